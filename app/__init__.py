@@ -8,13 +8,15 @@ import os
 import sys
 
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_bootstrap import Bootstrap
 from flask_bootstrap import WebCDN
 from flask_migrate import Migrate
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from config import config
+from .database import ScrudSQLAlchemy
 
-db = SQLAlchemy()
+db = ScrudSQLAlchemy()
 bootstrap = Bootstrap()
 migrate = Migrate()
 
@@ -65,6 +67,16 @@ class ManySideRelationship:
         self.related_classname = related_classname
         self.fk = fk
 
+@event.listens_for(Session, "before_flush")
+def set_computed_columns(session, flush_context, instances):
+    """ Compute the computed columns of every new or changed record before it is written.
+
+    The computed values are written by the same flush, so a create or update is one transaction and the record does not have to be read back to compute them.  Models with computed columns override set_computed_columns() (see All_mixin in models_pab.py).
+    """
+    for record in list(session.new) + list(session.dirty):
+        if hasattr(record, "set_computed_columns"):
+            record.set_computed_columns()
+
 # Flask-migrate needs all models to build migration.  Must be added after db is created to avoid circular reference since models.py also imports db.
 from . models_chinook import *
 from . models_pab import *
@@ -0,0 +1,161 @@
+from threading import Lock
+from weakref import WeakSet
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+class PoolMetrics:
+    """ Counts connection pool events for one engine.  Shown by the /scrud/pool_status page together with the pool status.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.connects = 0 # new dbapi connections opened
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+
+    def register(self, engine):
+        event.listen(engine, "connect", self.on_connect)
+        event.listen(engine, "checkout", self.on_checkout)
+        event.listen(engine, "checkin", self.on_checkin)
+        event.listen(engine, "invalidate", self.on_invalidate)
+
+    def on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+            self.checked_out -= 1
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def get_metrics(self):
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out
+            }
+
+
+class SQLitePragmas:
+    """ Sets PRAGMAs on every new sqlite connection of an engine.
+
+    Parameters
+    ----------
+    pragmas : dict
+        key = pragma name, value = pragma value (ie {"journal_mode": "WAL"}).  Pragmas are set in dict order.
+    """
+    def __init__(self, pragmas):
+        self.pragmas = pragmas
+
+    def register(self, engine):
+        event.listen(engine, "connect", self.on_connect)
+
+    def on_connect(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self.pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+
+class ScrudSQLAlchemy(SQLAlchemy):
+    """ Flask-SQLAlchemy with connection pool options and sqlite pragmas for each bind.
+
+    SCRUD_ENGINE_OPTIONS in config.py sets the sqlalchemy create_engine() pool options (pool_size, max_overflow, pool_recycle, pool_timeout) for each bind key.  Binds that are not listed use the Flask-SQLAlchemy defaults.
+
+    SCRUD_SQLITE_PRAGMAS in config.py sets the pragmas applied to each new connection of a sqlite bind (ie journal_mode, synchronous, cache_size).  Binds that are not listed use the sqlite defaults.
+
+    Notes
+    -----
+    Flask-SQLAlchemy hooks a NullPool into file sqlite databases, which opens a new sqlite connection for every checkout.  A sqlite bind with a pool_size uses a QueuePool instead.  The connections are shared between threads, so check_same_thread is turned off (a connection is only used by one thread at a time while it is checked out).
+    """
+    def __init__(self, *args, **kwargs):
+        super(ScrudSQLAlchemy, self).__init__(*args, **kwargs)
+        self.pool_metrics = {} # bind key : PoolMetrics
+        self._configured_engines = WeakSet()
+        self._configure_lock = Lock()
+
+    def get_bind_key(self, app, url):
+        """ Get the bind key of an engine url (None is the SQLALCHEMY_DATABASE_URI bind) """
+        for bind, uri in (app.config.get("SQLALCHEMY_BINDS") or {}).items():
+            if str(url) == uri:
+                return bind
+        return None
+
+    def apply_driver_hacks(self, app, info, options):
+        bind = self.get_bind_key(app, info)
+        engine_options = (app.config.get("SCRUD_ENGINE_OPTIONS") or {}).get(bind, {})
+        options.update(engine_options)
+        if info.drivername == "sqlite" and info.database not in (None, "", ":memory:") \
+            and options.get("pool_size"):
+            options["poolclass"] = QueuePool
+            options.setdefault("connect_args", {})["check_same_thread"] = False
+        super(ScrudSQLAlchemy, self).apply_driver_hacks(app, info, options)
+
+    def get_engine(self, app=None, bind=None):
+        engine = super(ScrudSQLAlchemy, self).get_engine(app, bind)
+        if engine not in self._configured_engines:
+            with self._configure_lock:
+                if engine not in self._configured_engines:
+                    self.configure_engine(self.get_app(app), engine, bind)
+                    self._configured_engines.add(engine)
+        return engine
+
+    def configure_engine(self, app, engine, bind):
+        """ Called once for each new engine, before its first connection is opened.
+        """
+        metrics = PoolMetrics()
+        metrics.register(engine)
+        self.pool_metrics[bind] = metrics
+
+        pragmas = (app.config.get("SCRUD_SQLITE_PRAGMAS") or {}).get(bind)
+        if pragmas and engine.dialect.name == "sqlite":
+            SQLitePragmas(pragmas).register(engine)
+
+    def get_pool_status(self, app=None):
+        """ Get the pool status and metrics for each bind in SCRUD_BINDS
+
+        Returns
+        -------
+        pool_status : dict
+            key = database name, value = dict of pool status and metrics
+        """
+        app = self.get_app(app)
+        pool_status = {}
+        for bind, database in app.config["SCRUD_BINDS"].items():
+            engine = self.get_engine(app, bind)
+            pool = engine.pool
+            status = {
+                "bind": bind,
+                "pool": type(pool).__name__,
+                "status": pool.status()
+            }
+            if isinstance(pool, QueuePool):
+                status.update({
+                    "size": pool.size(),
+                    "checkedin": pool.checkedin(),
+                    "checkedout": pool.checkedout(),
+                    "overflow": pool.overflow()
+                })
+            status.update(self.pool_metrics[bind].get_metrics())
+            pool_status[database] = status
+        return pool_status
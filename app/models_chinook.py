@@ -16,6 +16,11 @@ class All_mixin(object):
     # sqlalchemy database URI.
     __bind_key__ = None
 
+    # DataTables server side processing, keyset pagination and dropdown display columns (see models_pab.py)
+    dt_server_side = True
+    dt_keyset_pagination = False
+    display_columns = None
+
     # all WTForm classes will be name "model_classnameForm" by convention
     @declared_attr
     def wtform_classname(cls):
@@ -107,5 +112,7 @@ class Artist(db.Model, All_mixin):
         )
     ])
 
+    display_columns = ("name",)
+
     def __str__(self):
         return self.name
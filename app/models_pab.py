@@ -49,13 +49,31 @@ Example dt_column_spec
         order : ['asc', 'desc']
             The table will be ordered using this column
             "order" should only be added to one column.  If more than one, then the order will be on the last column entered.
+        aggregate : ["correlated", "group_by", "batched"]
+            How the count of a many side relationship column is computed.  Only used on many side relationship columns.
+            correlated : (default) COUNT subquery run once for each row of the table
+            group_by : all counts are computed in one GROUP BY pass over the related table, which is joined once
+            batched : one GROUP BY query over the ids of the rows in the requested page only
+            correlated and batched need an index on the related table foreign key.  See benchmarks/msr_counts.py for the crossover point.
+
+    Model class attributes
+    ----------------------
+        dt_server_side : [True, False]
+            True : (default) DataTables server side processing. Paging, ordering and searching are done by the database.
+            False : the whole table is sent to DataTables and paged in the browser.
+        dt_keyset_pagination : [True, False]
+            True : the next page is fetched with a range predicate on (order column, id) instead of OFFSET.  Used when the table is ordered by one database column of the model.  The order column should be indexed.
+            False : (default) pages are fetched with LIMIT/OFFSET
+        display_columns : tuple of column names
+            The columns that __str__() returns.  Form dropdown options are loaded with one SELECT of the primary key and these columns (values joined by a space) instead of loading every row as a model object.  Set it together with __str__().
+            None : (default) options are loaded as model objects and displayed with __str__()
 
 Example form_spec
 -----------------
     * Only specify for columns that need a value from the user.
     * "id" (or primary key) is not entered in form because its value is automatically set and incremented by the database.
     * Form does not have inputs for children.  The children attribute is automatically populated by SQLAlchemy using the back relationship.
-    # Form does not have an input for computed columns. Models with computed columns must override the set_computed_columns() method.
+    # Form does not have an input for computed columns. Models with computed columns must override the set_computed_columns() method.  It is called before the record is flushed to the database.
 
     form_spec = OrderedDict([
         ("first_name",
@@ -95,9 +113,14 @@ Example form_spec
         value : Form input field default value.  If value = "", then placeholder value is displayed. If value is not in inner dict, then it defaults to value = "".
         type : any html <input> type - form input field defined by html standard
                dropdown - form input field is <select> list
+               lookup - search box for a record in the related table.  Matching records are fetched from /scrud/lookup a page at a time (SCRUD_LOOKUP_PAGE_SIZE in config.py) as the user types, so the form size does not grow with the related table.  The related class must set display_columns.
                boolean - True/False inline radio buttons
                computed - not in form: value is computed by .py code
         validate : HTML or jQuery validate() keyword (not fully implemented yet)
+        match : ["prefix", "contains"]
+            Only used on lookup inputs.  How the search text matches the related class display_columns.
+            prefix : (default) display column starts with the search text
+            contains : display column contains the search text
 """
 
 class All_mixin(object):
@@ -105,6 +128,15 @@ class All_mixin(object):
     """
     __bind_key__ = "models_pab"
 
+    # DataTables server side processing: the database does the paging, ordering and searching so only one page of rows is sent per draw. Set to False in a model to send the whole table and let DataTables page it in the browser.
+    dt_server_side = True
+
+    # Keyset (seek) pagination for server side tables.  Set to True in models with large tables so that deep pages cost the same as the first page.
+    dt_keyset_pagination = False
+
+    # columns returned by __str__(), used to load form dropdown options without model objects
+    display_columns = None
+
     @declared_attr
     def wtform_classname(cls):
         return cls.__name__ + "Form"
@@ -117,14 +149,10 @@ class All_mixin(object):
 
     def set_computed_columns(self):
         """Models with computed columns should override set_computed_columns() This function should call methods implemented in individual models that compute values for computed columns.
+
+        It is called before each flush of a new or changed record (see set_computed_columns() in app/__init__.py), so it only sets the column values.  It must not flush or commit.
         """
-        try:
-            db.session.commit()
-        except:
-            db.session.rollback()
-            raise
-        finally:
-            db.session.close()
+        pass
 
 
 class Employee(db.Model, All_mixin):
@@ -226,6 +254,8 @@ class Employee(db.Model, All_mixin):
         )
     ])
 
+    display_columns = ("last_name",)
+
     def __str__(self):
         return self.last_name
 
@@ -242,6 +272,9 @@ class Company(db.Model, All_mixin):
     headquarters = db.Column(db.String(255), nullable=False)
     rev_per_employee = db.Column(db.Float, nullable=True)
     employees = ManySideRelationship("Employee", "company_id")
+
+    display_columns = ("name",)
+
     # The return value is displayed in tables that reference this class.
     def __str__(self):
         return self.name
@@ -368,6 +401,8 @@ class Country(db.Model, All_mixin):
             })
     ])
 
+    display_columns = ("name",)
+
     def __str__(self):
         return self.name
 
@@ -396,10 +431,12 @@ class User(db.Model, All_mixin):
             {"label":"Email"}),
         ("posts",
             {"label":"Posts",
-            "link":True}),
+            "link":True,
+            "aggregate":"batched"}), # count posts for the displayed page only
         ("pets",
             {"label":"Pets",
-            "link":True})
+            "link":True,
+            "aggregate":"batched"})
     ])
 
     form_spec = OrderedDict([
@@ -415,6 +452,8 @@ class User(db.Model, All_mixin):
             })
     ])
 
+    display_columns = ("name",)
+
     def __str__(self):
         return self.name
 
@@ -425,6 +464,9 @@ class Post(db.Model, All_mixin):
     user_id =  db.Column(db.Integer, ForeignKey("user.id", ondelete="CASCADE", onupdate="CASCADE"))
     created_at = db.Column(db.DateTime, server_default=func.now())
 
+    # posts are paged in created_at order
+    dt_keyset_pagination = True
+
     dt_column_spec = OrderedDict([
         ("id",
             {"label":"pk_id"}),
@@ -444,7 +486,7 @@ class Post(db.Model, All_mixin):
     form_spec = OrderedDict([
         ("user_id",
             {"label":"User",
-            "type": "dropdown"
+            "type": "lookup"    # search box, for related tables too big for a dropdown
             }),
         ("body",
             {"label":"Body",
@@ -542,6 +584,8 @@ class Pet(db.Model, All_mixin):
         )
     ])
 
+    display_columns = ("name",)
+
     def __str__(self):
         return self.name
 
@@ -550,8 +594,9 @@ class Pet(db.Model, All_mixin):
         self.compute_weight_st()
         super(Pet, self).set_computed_columns()
 
+    # weight is not required in the form
     def compute_weight_kg(self):
-        self.weight_kg = self.weight_lb / 2.205
+        self.weight_kg = None if self.weight_lb is None else self.weight_lb / 2.205
 
     def compute_weight_st(self):
-        self.weight_st = self.weight_lb / 14.0
+        self.weight_st = None if self.weight_lb is None else self.weight_lb / 14.0
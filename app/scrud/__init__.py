@@ -2,5 +2,11 @@ from flask import Blueprint
 
 bp = Blueprint("scrud", __name__, template_folder="templates", static_folder="static")
 
+@bp.record_once
+def register_cli(state):
+    """ Add the scrud commands to the flask command (ie $flask scrud indexes) """
+    from .indexes import scrud_cli
+    state.app.cli.add_command(scrud_cli)
+
 # import views has to be after all code to avoid a circular reference when blueprint is registered
 from .views import *
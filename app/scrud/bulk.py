@@ -0,0 +1,277 @@
+""" Bulk create, update and delete of the records of one table (see bulk_create, bulk_update and bulk_delete in views.py).
+
+Records are sent as a json array of objects or as csv with a header row of column names.  Every record is validated with the model's WTForms class (app/forms.py) before anything is written and set_computed_columns() is called on each record.  The rows are then written with bulk_insert_mappings() or bulk_update_mappings() (one executemany for each set of columns), all in one transaction.  If any record fails validation nothing is written.
+
+The bulk methods do not flush, so they do not fire the session events that update the row counts and the table caches.  mark_bulk_write() records the change for the commit instead (see caches.py).
+"""
+import csv
+import io
+
+from flask import current_app
+from sqlalchemy.exc import StatementError
+from werkzeug.datastructures import MultiDict
+
+from app import db
+from .caches import mark_bulk_write
+from .helpers import convert_form_value, to_form_str
+
+MAX_ERRORS = 100 # errors returned to the client, the others are only counted
+CHUNK_SIZE = 500 # ids in one IN (), sqlite allows 999 variables per statement
+
+def read_records(request):
+    """ Get the list of records (dicts) sent with a bulk request.
+
+    Parameters
+    ----------
+    request : flask request
+        csv file upload (form field "file"), csv body (Content-Type text/csv) or json array of objects
+    """
+    upload = request.files.get("file")
+    if upload is not None:
+        return list(csv.DictReader(iter_text_lines(upload.stream)))
+    if request.mimetype == "text/csv":
+        return list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+    records = request.get_json()
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError("Expected a json array of objects or csv")
+    return records
+
+def read_ids(request):
+    """ Get the ids sent with a bulk delete request (json {"ids": [id, ...]}) as ints.  Raises ValueError if an id is not an int or a numeric str. """
+    body = request.get_json(silent=True)
+    ids = body.get("ids", []) if isinstance(body, dict) else None
+    if not isinstance(ids, list):
+        raise ValueError('Expected json {"ids": [id, ...]}')
+    return get_ids(ids)
+
+def get_ids(ids):
+    """ Convert a list of ids to ints.  Raises ValueError for an id that is not an int or a numeric str (ie null, a list or an object). """
+    converted = []
+    for id in ids:
+        if isinstance(id, str) and id.strip().lstrip("-").isdigit():
+            id = int(id)
+        if not isinstance(id, int) or isinstance(id, bool):
+            raise ValueError(f"Not a record id : {id!r}")
+        converted.append(id)
+    return converted
+
+def iter_text_lines(stream):
+    """ Generator of the lines of a utf-8 binary file as str, without the byte order mark.
+
+    I don't wrap the stream with io.TextIOWrapper since the SpooledTemporaryFile of a werkzeug upload is not readable() before python 3.11.  The lines are split at \\n only, so a quoted csv field or a json string can hold any other line separator.
+    """
+    for i, line in enumerate(stream):
+        yield line.decode("utf-8-sig" if i == 0 else "utf-8")
+
+def get_form_class(class_):
+    return getattr(current_app.tc.modules, class_.wtform_classname)
+
+def get_column_names(class_):
+    return {c.name for c in class_.__table__.columns}
+
+def validate_record(form_class, data, obj=None):
+    """ Validate one record with the model's WTForms class.  Returns the form errors ({} if valid). """
+    form = form_class(formdata=MultiDict({k: to_form_str(v) for k, v in data.items()}), obj=obj)
+    form.validate()
+    return form.errors
+
+def get_column_errors(record, columns):
+    """ Errors for the keys of a record that are not columns ({} if there are none).  csv.DictReader puts the extra fields of a row that is longer than the header under the key None. """
+    errors = {}
+    for name in record:
+        if name is None:
+            errors["row"] = ["More fields than the header"]
+        elif name not in columns:
+            errors[name] = ["Not a column"]
+    return errors
+
+def map_record(class_, values, columns):
+    """ Build the model record for values, set its computed columns and return the column values for the bulk methods.
+
+    Returns
+    -------
+    mapping : dict or None
+        column values, None if there are errors
+    errors : dict
+        column name : [messages] for the values that can't be converted to the column type, or "computed" : [message] if set_computed_columns() fails (ie a division by zero).  {} if the record mapped.
+    """
+    converted = {}
+    errors = {}
+    for name, value in values.items():
+        try:
+            converted[name] = convert_form_value(class_, name, value)
+        except (TypeError, ValueError) as ex:
+            errors[name] = [f"Not a valid value : {ex}"]
+    if errors:
+        return None, errors
+    record = class_(**converted)
+    try:
+        record.set_computed_columns()
+    except Exception as ex:
+        return None, {"computed": [f"{type(ex).__name__} : {ex}"]}
+    # a transient record only has the attributes that were set
+    return {k: v for k, v in record.__dict__.items() if k in columns}, {}
+
+def bulk_create(class_, records):
+    """ Insert records into the table of class_.
+
+    Returns
+    -------
+    count : int
+        rows inserted (0 if there are errors)
+    errors : list of dicts
+        {"row": index of record, "errors": {column: [messages]}} for every record that failed
+    """
+    form_class = get_form_class(class_)
+    columns = get_column_names(class_)
+    mappings = []
+    errors = []
+    for i, r in enumerate(records):
+        row_errors = get_column_errors(r, columns) or validate_record(form_class, r)
+        if not row_errors:
+            mapping, row_errors = map_record(class_, r, columns)
+        if row_errors:
+            errors.append({"row": i, "errors": row_errors})
+            continue
+        mappings.append(mapping)
+    if errors:
+        return 0, errors
+
+    try:
+        db.session.bulk_insert_mappings(class_, mappings)
+        mark_bulk_write(db.session, class_.__table__.name, inserted=len(mappings))
+        db.session.commit()
+    except StatementError as ex: # ie duplicate values of a unique column in the records
+        db.session.rollback()
+        raise ValueError(f"Database error, no records created : {ex.orig}")
+    except:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+    return len(mappings), []
+
+def bulk_update(class_, records):
+    """ Update records of the table of class_.  Each record has the "id" of its row and the columns to change.
+
+    The other columns are read from the database, so the whole row is validated and the computed columns see every value.
+
+    Returns
+    -------
+    count : int
+        rows updated (0 if there are errors)
+    errors : list of dicts
+        {"row": index of record, "errors": {column: [messages]}} for every record that failed
+    """
+    form_class = get_form_class(class_)
+    columns = get_column_names(class_)
+    mappings = []
+    errors = []
+    try:
+        for start in range(0, len(records), CHUNK_SIZE):
+            chunk = records[start:start + CHUNK_SIZE]
+            ids = []
+            for r in chunk:
+                try:
+                    ids.append(int(r.get("id")))
+                except (TypeError, ValueError):
+                    ids.append(None)
+            rows = {obj.id: obj for obj in class_.query.filter(class_.id.in_([i for i in ids if i is not None]))}
+            for i, (r, id) in enumerate(zip(chunk, ids), start):
+                obj = rows.get(id)
+                if obj is None:
+                    errors.append({"row": i, "errors": {"id": [f"Did not find record with id = {r.get('id')}"]}})
+                    continue
+                row_errors = get_column_errors(r, columns)
+                if not row_errors:
+                    values = {name: getattr(obj, name) for name in columns}
+                    values.update(r)
+                    values["id"] = id
+                    # obj lets the Unique validators accept the record's own value
+                    row_errors = validate_record(form_class, values, obj)
+                if not row_errors:
+                    mapping, row_errors = map_record(class_, values, columns)
+                if row_errors:
+                    errors.append({"row": i, "errors": row_errors})
+                    continue
+                mappings.append(mapping)
+        if errors:
+            db.session.rollback()
+            return 0, errors
+
+        db.session.bulk_update_mappings(class_, mappings)
+        mark_bulk_write(db.session, class_.__table__.name)
+        db.session.commit()
+    except StatementError as ex: # ie two records set a unique column to the same value
+        db.session.rollback()
+        raise ValueError(f"Database error, no records updated : {ex.orig}")
+    except:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+    return len(mappings), []
+
+def bulk_delete(class_, ids, progress=None):
+    """ Delete the rows of the table of class_ with these ids in one transaction.  Returns the number of rows deleted.
+
+    Query.delete() fires the after_bulk_delete session event, so the caches are updated at commit.
+
+    Parameters
+    ----------
+    class_ : sqlalchemy class
+    ids : list of int or numeric str
+    progress : function(done, total) or None
+        called after each chunk of ids (see jobs.py)
+    """
+    ids = get_ids(ids)
+    count = 0
+    try:
+        for start in range(0, len(ids), CHUNK_SIZE):
+            q = class_.query.filter(class_.id.in_(ids[start:start + CHUNK_SIZE]))
+            count += q.delete(synchronize_session=False)
+            if progress is not None:
+                progress(min(start + CHUNK_SIZE, len(ids)), len(ids))
+        db.session.commit()
+    except:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+    return count
+
+def recompute_columns(class_, progress=None):
+    """ Recompute the computed columns of every row of the table of class_ (ie after a compute function changed).  Returns the number of rows read.
+
+    Rows are read in id order CHUNK_SIZE at a time and each chunk is committed, so the table is not locked for the whole table.  Only the rows whose values change are written (see set_computed_columns() in app/__init__.py).
+
+    Parameters
+    ----------
+    class_ : sqlalchemy class
+    progress : function(done, total) or None
+        called after each chunk (see jobs.py)
+    """
+    total = class_.query.count()
+    count = 0
+    last_id = None
+    try:
+        while True:
+            q = class_.query.order_by(class_.id)
+            if last_id is not None:
+                q = q.filter(class_.id > last_id)
+            records = q.limit(CHUNK_SIZE).all()
+            if not records:
+                break
+            for r in records:
+                r.set_computed_columns()
+            last_id = records[-1].id
+            count += len(records)
+            db.session.commit()
+            if progress is not None:
+                progress(count, total)
+    except:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+    return count
@@ -0,0 +1,512 @@
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from threading import Lock
+
+from flask import current_app, has_app_context, json
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .helpers import get_uid_from_tablename
+
+class RowCountCache:
+    """ Total number of rows in each table, keyed by table uid.  Used for the DataTables recordsTotal so a table reload does not pay for a COUNT scan.
+
+    Counts are adjusted when records are created or deleted through the sqlalchemy session (see the session events below) and recounted after max_age seconds, so writes made outside of this process are picked up.  A count that was running while an adjust() or invalidate() of its table happened is returned but not cached, since it may or may not include that write.
+
+    Parameters
+    ----------
+    max_age : float
+        seconds before a cached count is recounted from the database
+    """
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._counts = {} # uid : (count, time counted)
+        self._generations = Counter() # uid : adjust and invalidate count
+        self._clears = 0 # invalidate() of all tables count
+        self._lock = Lock()
+
+    def get(self, uid, count_func):
+        """ Get the row count for table uid.
+
+        Parameters
+        ----------
+        uid : int
+            table uid
+        count_func : function
+            returns the row count from the database.  Only called if the count is not cached or is older than max_age.
+        """
+        with self._lock:
+            cached = self._counts.get(uid)
+            generation = (self._clears, self._generations[uid])
+        if cached is not None and time.monotonic() - cached[1] < self.max_age:
+            return cached[0]
+        count = count_func()
+        with self._lock:
+            if (self._clears, self._generations[uid]) == generation:
+                self._counts[uid] = (count, time.monotonic())
+        return count
+
+    def adjust(self, uid, delta):
+        """ Add delta to the cached count (no op if the count is not cached) """
+        with self._lock:
+            self._generations[uid] += 1
+            if uid in self._counts:
+                count, counted = self._counts[uid]
+                self._counts[uid] = (count + delta, counted)
+
+    def invalidate(self, uid=None):
+        """ Remove the cached count for table uid (all tables if uid = None) """
+        with self._lock:
+            if uid is None:
+                self._clears += 1
+                self._counts.clear()
+            else:
+                self._generations[uid] += 1
+                self._counts.pop(uid, None)
+
+class OptionCache:
+    """ Form dropdown options (pk, display str) of each related table, keyed by table name.  get_form builds a dropdown for every foreign key column of the form, so without the cache every update modal loads all the rows of each related table as ORM objects.
+
+    A table's options are removed when a commit changes the table (see the session events below) and reloaded after max_age seconds, so writes made outside of this process are picked up.
+
+    Parameters
+    ----------
+    max_tables : int
+        max number of cached option lists, the least recently used list is removed
+    max_options : int
+        longer option lists are not cached
+    max_age : float
+        seconds before an option list is reloaded from the database
+    """
+    def __init__(self, max_tables=32, max_options=10000, max_age=300):
+        self.max_tables = max_tables
+        self.max_options = max_options
+        self.max_age = max_age
+        self._options = OrderedDict() # tablename : (options, time loaded)
+        self._lock = Lock()
+
+    def get(self, tablename, load_options):
+        """ Get the dropdown options of tablename.
+
+        Parameters
+        ----------
+        tablename : str
+            related table name
+        load_options : function
+            returns the list of (pk, display str) from the database.  Only called if the options are not cached or are older than max_age.
+        """
+        with self._lock:
+            cached = self._options.get(tablename)
+            if cached is not None and time.monotonic() - cached[1] < self.max_age:
+                self._options.move_to_end(tablename)
+                return cached[0]
+        options = load_options()
+        if len(options) <= self.max_options:
+            with self._lock:
+                self._options[tablename] = (options, time.monotonic())
+                self._options.move_to_end(tablename)
+                while len(self._options) > self.max_tables:
+                    self._options.popitem(last=False)
+        return options
+
+    def invalidate(self, tablename=None):
+        """ Remove the options of tablename (all tables if tablename = None) """
+        with self._lock:
+            if tablename is None:
+                self._options.clear()
+            else:
+                self._options.pop(tablename, None)
+
+class TableVersions:
+    """ Version counter for each table uid.  A table's version is bumped when a commit changes its rows or the rows it shows from related tables (see get_dependent_uids()).  The version tag is the get_data ETag validator, so an unchanged table reload gets a 304.
+
+    The versions are kept in a sqlite file shared by all the worker processes of the app on one host, so a reload served by any worker sees the writes committed through the others.  The file also holds a boot id that is made once, so tags from before the file was deleted never match.  The tag also changes every max_age seconds, so a write made outside of the app (raw SQL, another host) is picked up after at most max_age seconds, same as RowCountCache.
+
+    Parameters
+    ----------
+    path : str
+        sqlite file (SCRUD_TABLE_VERSIONS_PATH)
+    max_age : float
+        seconds before every version tag changes
+    """
+    def __init__(self, path, max_age=300):
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local() # one sqlite connection per thread
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS version (uid INTEGER PRIMARY KEY, version INTEGER)")
+            conn.execute("CREATE TABLE IF NOT EXISTS boot (key INTEGER PRIMARY KEY CHECK (key = 0), id TEXT)")
+            # the first worker to start sets the boot id, the others read it
+            conn.execute("INSERT OR IGNORE INTO boot VALUES (0, ?)", (uuid.uuid4().hex[:8],))
+            self._boot = conn.execute("SELECT id FROM boot").fetchone()[0]
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode = WAL")
+            self._local.conn = conn
+        return conn
+
+    def bump(self, *uids):
+        """ Add 1 to the versions of tables uids (one transaction) """
+        with self._connect() as conn:
+            conn.executemany("INSERT OR IGNORE INTO version VALUES (?, 0)", [(uid,) for uid in uids])
+            conn.executemany("UPDATE version SET version = version + 1 WHERE uid = ?", [(uid,) for uid in uids])
+
+    def get_tag(self, uid):
+        """ Get the version tag of table uid (str) """
+        row = self._connect().execute("SELECT version FROM version WHERE uid = ?", (uid,)).fetchone()
+        version = row[0] if row else 0
+        return f"{self._boot}.{version}.{int(time.time() // self.max_age)}"
+
+def get_request_digest(dt_request):
+    """ Hash of a get_data request, without draw which changes with every request.  Used for the ETag and the ResultCache key.
+    """
+    params = {k: v for k, v in (dt_request or {}).items() if k != "draw"}
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+class MemoryCacheBackend:
+    """ ResultCache backend in this process.  Least recently used entries are evicted when the entries use more than max_bytes.
+
+    Parameters
+    ----------
+    max_bytes : int
+        max total size of the cached (pickled) values
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # key : (uid, data), least recently used first
+        self._keys = {} # uid : set of keys
+        self._generations = Counter() # uid : invalidation count
+        self._bytes = 0
+        self.evictions = 0
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def generation(self, uid):
+        with self._lock:
+            return self._generations[uid]
+
+    def set(self, key, uid, data, generation):
+        """ Store data unless table uid was invalidated since generation was read """
+        with self._lock:
+            if self._generations[uid] != generation:
+                return
+            self._remove(key)
+            self._entries[key] = (uid, data)
+            self._keys.setdefault(uid, set()).add(key)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._keys[entry[0]].discard(key)
+            self._bytes -= len(entry[1])
+
+    def invalidate(self, uid):
+        with self._lock:
+            self._generations[uid] += 1
+            for key in list(self._keys.get(uid, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            for uid in self._keys:
+                self._generations[uid] += 1
+            self._entries.clear()
+            self._keys.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._entries), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+class SQLiteCacheBackend:
+    """ ResultCache backend in a sqlite file, shared by all the worker processes of the app on one host.  Least recently used entries are evicted when the entries use more than max_bytes.
+
+    The file is not one of the SCRUD binds and can be deleted at any time.
+
+    Parameters
+    ----------
+    path : str
+        sqlite file
+    max_bytes : int
+        max total size of the cached (pickled) values
+    """
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local() # one sqlite connection per thread
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS entry (key TEXT PRIMARY KEY, uid INTEGER, data BLOB, size INTEGER, used REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_entry_used ON entry (used)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_entry_uid ON entry (uid)")
+            conn.execute("CREATE TABLE IF NOT EXISTS generation (uid INTEGER PRIMARY KEY, generation INTEGER)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF") # losing the cache is harmless
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM entry WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE entry SET used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def generation(self, uid):
+        row = self._connect().execute("SELECT generation FROM generation WHERE uid = ?", (uid,)).fetchone()
+        return row[0] if row else 0
+
+    def set(self, key, uid, data, generation):
+        """ Store data unless table uid was invalidated since generation was read """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if self.generation(uid) != generation:
+                return
+            conn.execute("INSERT OR REPLACE INTO entry VALUES (?, ?, ?, ?, ?)",
+                         (key, uid, sqlite3.Binary(data), len(data), time.time()))
+            total = conn.execute("SELECT SUM(size) FROM entry").fetchone()[0]
+            while total > self.max_bytes:
+                key, size = conn.execute("SELECT key, size FROM entry ORDER BY used LIMIT 1").fetchone()
+                conn.execute("DELETE FROM entry WHERE key = ?", (key,))
+                total -= size
+
+    def invalidate(self, uid):
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO generation VALUES (?, 0)", (uid,))
+            conn.execute("UPDATE generation SET generation = generation + 1 WHERE uid = ?", (uid,))
+            conn.execute("DELETE FROM entry WHERE uid = ?", (uid,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO generation SELECT DISTINCT uid, 0 FROM entry")
+            conn.execute("UPDATE generation SET generation = generation + 1")
+            conn.execute("DELETE FROM entry")
+
+    def stats(self):
+        entries, total = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entry").fetchone()
+        return {"backend": "sqlite", "path": self.path, "entries": entries, "bytes": total,
+                "max_bytes": self.max_bytes}
+
+class ResultCache:
+    """ Cache of get_table_data() results, keyed by table uid and the get_data request (link parameters, page, order, search, cursor).
+
+    Most draws read the same few tables between edits.  The key has the TableVersions tag of the table, which every worker process reads from the shared versions file, so a commit through any worker that changes the table or a table it shows through an osr/msr column (see get_dependent_uids() and the session events below) makes every backend miss, the memory backend of each worker too.  The entries of this process are also removed at commit.  The tag changes every SCRUD_ETAG_MAX_AGE seconds, so writes made outside of the app (raw SQL) are picked up after at most that time.  Entries with an old tag are evicted like the least recently used ones.  Results are pickled, so a cached result can not be changed by the caller.
+
+    Parameters
+    ----------
+    backend : MemoryCacheBackend, SQLiteCacheBackend or an object with the same methods
+    max_entry_bytes : int
+        larger results are not cached
+    versions : TableVersions
+    """
+    def __init__(self, backend, max_entry_bytes, versions):
+        self.backend = backend
+        self.max_entry_bytes = max_entry_bytes
+        self.versions = versions
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    def get(self, uid, dt_request, get_result):
+        """ Get the cached result of a request for table uid.
+
+        Parameters
+        ----------
+        uid : int
+            uid of the displayed table
+        dt_request : dict
+            get_data request
+        get_result : function
+            returns the result from the database.  Only called on a miss.
+        """
+        key = f"{uid}:{self.versions.get_tag(uid)}:{get_request_digest(dt_request)}"
+        data = self.backend.get(key)
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+            return pickle.loads(data)
+        with self._lock:
+            self.misses += 1
+        # a write committed while the query runs makes the result stale, see backend set()
+        generation = self.backend.generation(uid)
+        result = get_result()
+        data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        if len(data) <= self.max_entry_bytes:
+            self.backend.set(key, uid, data, generation)
+        return result
+
+    def invalidate(self, uid=None):
+        """ Remove the cached results of table uid (all tables if uid = None) """
+        if uid is None:
+            self.backend.clear()
+        else:
+            self.backend.invalidate(uid)
+
+    def stats(self):
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses,
+                     "hit_rate": self.hits / (self.hits + self.misses) if self.hits + self.misses else None}
+        stats.update(self.backend.stats())
+        return stats
+
+def create_result_cache(app, versions):
+    """ Create the ResultCache set by SCRUD_RESULT_CACHE in config.py (None if the cache is off).  versions is the TableVersions of the app.
+
+    SCRUD_RESULT_CACHE is "memory", "sqlite" (SCRUD_RESULT_CACHE_PATH file) or a function that takes the app and returns a backend.
+    """
+    backend = app.config["SCRUD_RESULT_CACHE"]
+    max_bytes = app.config["SCRUD_RESULT_CACHE_MAX_BYTES"]
+    if not backend:
+        return None
+    elif backend == "memory":
+        backend = MemoryCacheBackend(max_bytes)
+    elif backend == "sqlite":
+        backend = SQLiteCacheBackend(app.config["SCRUD_RESULT_CACHE_PATH"], max_bytes)
+    else:
+        backend = backend(app)
+    return ResultCache(backend, max_entry_bytes=max_bytes // 10, versions=versions)
+
+def get_dependent_uids(tablename):
+    """ Get the uids of the tables whose get_data rows change when a row of tablename changes.
+
+    These are the table itself, tables that show tablename through a one-side relationship (osr) display column or a many-side relationship (msr) count, and tables with a foreign key to tablename (ondelete cascade or set null).
+    """
+    uids = {get_uid_from_tablename(tablename)}
+    for t in current_app.tc.get_sqlalchemy_table_stmts():
+        for col in t["columns"]:
+            if col["type"] == "osr":
+                related = inspect(col["alias"]).mapper.local_table.name
+            elif col["type"] == "msr":
+                related = col["fk_class"].__table__.name
+            else:
+                continue
+            if related == tablename:
+                uids.add(t["uid"])
+        for fk in t["class_"].__table__.foreign_keys:
+            if fk.column.table.name == tablename:
+                uids.add(t["uid"])
+    return uids
+
+def get_cascade_uids(tablename):
+    """ Get the uids of tables whose rows are deleted by the database when a row of tablename is deleted (ForeignKey ondelete="CASCADE").
+    """
+    uids = set()
+    for t in current_app.tc.get_dt_tables_config():
+        for fk in t["class_"].__table__.foreign_keys:
+            if fk.column.table.name == tablename and (fk.ondelete or "").upper() == "CASCADE":
+                uids.add(t["uid"])
+    return uids
+
+# Session events
+# --------------
+# Creates, updates and deletes are collected at flush and applied to the caches at commit, since the rows are not visible to other connections until then.  A rollback discards them.
+
+def _scrud_cache_enabled():
+    return has_app_context() and getattr(current_app, "row_counts", None) is not None
+
+@event.listens_for(Session, "after_flush")
+def _collect_row_count_changes(session, flush_context):
+    if not _scrud_cache_enabled():
+        return
+    deltas = session.info.setdefault("scrud_row_count_deltas", Counter())
+    invalid = session.info.setdefault("scrud_row_count_invalid", set())
+    changed = session.info.setdefault("scrud_changed_tables", set())
+    for obj in session.new:
+        deltas[get_uid_from_tablename(obj.__table__.name)] += 1
+        changed.add(obj.__table__.name)
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            changed.add(obj.__table__.name)
+    for obj in session.deleted:
+        deltas[get_uid_from_tablename(obj.__table__.name)] -= 1
+        invalid.update(get_cascade_uids(obj.__table__.name))
+        changed.add(obj.__table__.name)
+
+@event.listens_for(Session, "after_bulk_delete")
+def _collect_bulk_delete(delete_context):
+    if not _scrud_cache_enabled():
+        return
+    session = delete_context.session
+    tablename = delete_context.mapper.local_table.name
+    invalid = session.info.setdefault("scrud_row_count_invalid", set())
+    invalid.add(get_uid_from_tablename(tablename))
+    invalid.update(get_cascade_uids(tablename))
+    session.info.setdefault("scrud_changed_tables", set()).add(tablename)
+
+@event.listens_for(Session, "after_bulk_update")
+def _collect_bulk_update(update_context):
+    if not _scrud_cache_enabled():
+        return
+    tablename = update_context.mapper.local_table.name
+    update_context.session.info.setdefault("scrud_changed_tables", set()).add(tablename)
+
+@event.listens_for(Session, "after_commit")
+def _apply_row_count_changes(session):
+    deltas = session.info.pop("scrud_row_count_deltas", {})
+    invalid = session.info.pop("scrud_row_count_invalid", set())
+    changed = session.info.pop("scrud_changed_tables", set())
+    if not _scrud_cache_enabled():
+        return
+    for uid, delta in deltas.items():
+        current_app.row_counts.adjust(uid, delta)
+    for uid in invalid:
+        current_app.row_counts.invalidate(uid)
+    bumped = set()
+    for tablename in changed:
+        bumped.update(get_dependent_uids(tablename))
+        current_app.option_cache.invalidate(tablename)
+    if bumped:
+        current_app.table_versions.bump(*bumped)
+    for uid in bumped:
+        if current_app.result_cache is not None:
+            current_app.result_cache.invalidate(uid)
+
+def mark_bulk_write(session, tablename, inserted=0):
+    """ Record a bulk insert or update of tablename in the session, like the flush events do, so the caches are updated when the session commits.
+
+    Session.bulk_insert_mappings() and bulk_update_mappings() do not flush, so the after_flush event does not see their rows (Query.delete() fires after_bulk_delete).
+
+    Parameters
+    ----------
+    session : sqlalchemy Session
+    tablename : str
+    inserted : int
+        number of rows inserted
+    """
+    if not _scrud_cache_enabled():
+        return
+    if inserted:
+        deltas = session.info.setdefault("scrud_row_count_deltas", Counter())
+        deltas[get_uid_from_tablename(tablename)] += inserted
+    session.info.setdefault("scrud_changed_tables", set()).add(tablename)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_row_count_changes(session, previous_transaction):
+    session.info.pop("scrud_row_count_deltas", None)
+    session.info.pop("scrud_row_count_invalid", None)
+    session.info.pop("scrud_changed_tables", None)
@@ -1,13 +1,16 @@
 from flask import current_app
 from app import db
 import sys
-from sqlalchemy import asc, desc, and_
-from sqlalchemy.sql import select, outerjoin
+import hashlib
+from sqlalchemy import asc, desc, and_, or_, cast, type_coerce, null, String
+from sqlalchemy.sql import select, outerjoin, operators
 from sqlalchemy.orm import aliased
 from app.models_pab import *
 from app.models_chinook import *
 from app.forms import *
 from .html import *
+from .helpers import get_uid_from_tablename, get_related_class
+from .serializers import get_column_encoder, encode_records, dumps
 
 
 class TableConfig:
@@ -54,7 +57,8 @@ class TableConfig:
                         {'data': 'functions'}
                     ],
                     'render': ['', '', ''],
-                    'order': [[0, 'desc']]
+                    'order': [[0, 'desc']],
+                    'server_side': True
                 },
                 {
                     'uid': 1,
@@ -76,6 +80,8 @@ class TableConfig:
         self.modules = sys.modules[__name__] # all models and forms
         self._dt_column_spec()
         self._sqlalchemy_stmt()
+        self._form_templates()
+        self._client_configs()
 
     def _dt_column_spec(self):
         """ Read models*.py dt_column_spec and converts to DataTables json format.
@@ -92,7 +98,9 @@ class TableConfig:
                     "columns": columns, # list of column attr names
                     "placeholder_data": list of placeholder_data
                     "render": render, # list of render functions
-                    "order": order
+                    "order": order,
+                    "server_side": bool, # DataTables serverSide option
+                    "links": links # link columns, used by scrud.js to render compact data
                 }
 
         Sample format for columns, th and order keys:
@@ -114,6 +122,12 @@ class TableConfig:
                 'Posts',
                 'Pets'
             ]
+
+            # column index, fk (the link column name) and the column with the linked row id (None for the many side)
+            links = [
+                {'column': 2, 'fk': 'posts', 'fk_id': None},
+                {'column': 3, 'fk': 'pets', 'fk_id': None}
+            ]
         """
         dt_tables_config = [] # DataTables table configuration
         for k, v in self.db_tables.items(): # k = databasename, v = dict of tablenames:uid
@@ -124,6 +138,7 @@ class TableConfig:
                 th = []
                 columns = []
                 render =[]
+                links = []
                 col_types = []
                 row_data = {}
 
@@ -144,9 +159,18 @@ class TableConfig:
                     else:
                         render.append("")
 
+                    if spec.get("link"):
+                        attr = getattr(class_, col)
+                        if isinstance(attr, ManySideRelationship):
+                            links.append({"column": i - 1, "fk": col, "fk_id": None})
+                        elif attr.foreign_keys:
+                            # see _sqlalchemy_stmt() for fk_id column name convention
+                            links.append({"column": i - 1, "fk": col, "fk_id": "fk_id" + col})
+
                 # add column for update and delete functions
+                # the functions column is html, so it can't be sorted or searched by the database
                 th.append("Functions")
-                columns.append({"data": "functions"})
+                columns.append({"data": "functions", "orderable": False, "searchable": False})
 
                 dt_table_config = {
                     "uid": uid,
@@ -156,7 +180,9 @@ class TableConfig:
                     "th": th, # column titles
                     "columns": columns, # column attr names
                     "render": render, # render functions
-                    "order": order
+                    "order": order,
+                    "server_side": class_.dt_server_side,
+                    "links": links
                 }
                 dt_tables_config.insert(uid, dt_table_config)
         self.dt_tables_config = dt_tables_config
@@ -192,10 +218,22 @@ class TableConfig:
                     if isinstance(attr, ManySideRelationship): # col is the many-side of relationship
                         fk_class = get_related_class(attr, self.modules)
                         fk = getattr(fk_class, attr.fk)
+                        # see models_pab.py for the "aggregate" options
+                        aggregate = spec.get("aggregate", "correlated")
                         stmt = select([func.count(fk_class.id)]).\
                             where(class_.id == fk).\
-                            as_scalar().label(col)
-                        columns.append({"col_name":col, "display":stmt, "type":"msr", "pk":None, "alias":None, "link":link})
+                            as_scalar()
+                        if aggregate == "group_by":
+                            # count all rows of the related table in one pass and join the counts once
+                            counts = select([fk.label("fk"), func.count(fk_class.id).label("count")]).\
+                                group_by(fk).\
+                                alias("msr_" + col)
+                            j = j.outerjoin(counts, class_.id == counts.c.fk)
+                            stmt = func.coalesce(counts.c.count, 0)
+                        elif aggregate not in ("correlated", "batched"):
+                            raise ValueError(f"{class_.__name__}.{col} aggregate = {aggregate} must be correlated, group_by or batched")
+                        columns.append({"col_name":col, "display":stmt, "type":"msr", "pk":None, "alias":None, "link":link,
+                                        "aggregate":aggregate, "fk":fk, "fk_class":fk_class})
                     elif attr.foreign_keys: # col is a foreign key (one-side of relationship)
                         fk = list(attr.foreign_keys)[0]
                         fk_class = get_related_class(attr, self.modules)
@@ -217,41 +255,138 @@ class TableConfig:
 
                 # get sqlalchemy order_by stmt
                 order_stmt = getattr(class_, "id").desc()
+                order_col = ("id", "desc") # (col_name, direction) used for keyset pagination
                 for col, spec in class_.dt_column_spec.items():
                     if "order" in spec:
+                        order_col = (col, spec["order"])
                         if spec["order"] == "desc":
                             order_stmt = getattr(class_, col).desc()
                         else:
                             order_stmt = getattr(class_, col).asc()
 
+                # get select columns and the unlabeled expression for each column
+                # the expressions are used for server side ORDER BY and WHERE
+                select_columns = []
+                column_exprs = {}
+                for col in columns:
+                    if col["type"] == "osr":
+                        # need to rename fk_id to avoid key name ambiguity since there
+                        # can be more than one fk in a model
+                        if "fk_id" in col["col_name"]:
+                            expr = getattr(col["alias"], col["pk"])
+                        else:
+                            expr = getattr(col["alias"], col["display"])
+                    elif col["type"] == "msr":
+                        expr = col["display"]
+                    else: # value from database
+                        expr = getattr(class_, col["display"])
+                    if col["type"] == "msr" and col["aggregate"] == "batched":
+                        # counts are set after the page is fetched, see set_batched_counts()
+                        # the correlated expr is only used if the table is ordered by this column
+                        select_columns.append(null().label(col["col_name"]))
+                    else:
+                        select_columns.append(expr.label(col["col_name"]))
+                    column_exprs[col["col_name"]] = expr
+
+                # array rows (SCRUD_ARRAY_DATA) : the DataTables columns in dt_column_spec order, then the other select columns (fk_id columns)
+                labels = {c.name: c for c in select_columns}
+                row_columns = [col for col in class_.dt_column_spec] + \
+                    [col for col in labels if col not in class_.dt_column_spec]
+                row_select_columns = [labels[col] for col in row_columns]
+                row_index = {col: i for i, col in enumerate(row_columns)}
+
+                # json encoder for each column whose values are not json types (dates, Decimal)
+                encoders = []
+                row_encoders = []
+                for col_name, expr in column_exprs.items():
+                    encoder = get_column_encoder(expr.type)
+                    if encoder is not None:
+                        encoders.append((col_name, encoder))
+                        row_encoders.append((row_index[col_name], encoder))
+
                 sqlalchemy_table_stmt = {
                     "uid": uid,
                     "class_": class_,
                     "database": k,
                     "tablename": t,
                     "columns": columns,
+                    "select_columns": select_columns,
+                    "column_exprs": column_exprs,
+                    "encoders": encoders,
+                    "decorator": RowDecorator(uid, columns),
+                    "row_columns": row_columns,
+                    "row_select_columns": row_select_columns,
+                    "row_index": row_index,
+                    "row_encoders": row_encoders,
+                    "row_decorator": RowDecorator(uid, columns, row_index),
                     "osr_filter": osr_filter,
                     "osr_join": j,
-                    "order_stmt": order_stmt
+                    "order_stmt": order_stmt,
+                    "order_col": order_col,
+                    "keyset": class_.dt_keyset_pagination
                 }
                 sqlalchemy_table_stmts.insert(uid, sqlalchemy_table_stmt)
         self.sqlalchemy_table_stmts = sqlalchemy_table_stmts
 
+    def _form_templates(self):
+        """ Compile the create/update form html of each table (see FormTemplate in html.py).
+
+        Returns
+        -------
+        form_templates : list of FormTemplate
+            By design, the list index equals the uid.
+        """
+        self.form_templates = [FormTemplate(t["uid"], t["class_"]) for t in self.dt_tables_config]
+
+    def _client_configs(self):
+        """ Build the table config that scrud.js needs to initialize each DataTable, and a version hash of all of them.
+
+        Returns
+        -------
+        client_configs : list of dicts
+            By design, the list index equals the uid.
+            dict : {columns, order, render, server_side, links, compact, arrays, row_columns}
+        client_configs_json : str
+            {"version": version, "tables": client_configs} as json (the /scrud/table_configs response)
+        client_configs_version : str
+            hash of the client_configs json.  It only changes when a model's dt_column_spec (or SCRUD_COMPACT_DATA, SCRUD_ARRAY_DATA) changes, so the table_configs response can be cached by the browser under a url with the version in it.
+        """
+        client_configs = []
+        for t, stmt in zip(self.dt_tables_config, self.sqlalchemy_table_stmts):
+            client_configs.append({
+                "columns": t["columns"],
+                "order": t["order"],
+                "render": t["render"],
+                "server_side": t["server_side"],
+                "links": t["links"],
+                "compact": current_app.config["SCRUD_COMPACT_DATA"],
+                "arrays": current_app.config["SCRUD_ARRAY_DATA"],
+                "row_columns": stmt["row_columns"]
+            })
+        tables_json = dumps(client_configs)
+        self.client_configs = client_configs
+        self.client_configs_version = hashlib.sha1(tables_json.encode("utf-8")).hexdigest()[:16]
+        self.client_configs_json = '{"version":"%s","tables":%s}' % (self.client_configs_version, tables_json)
+
     def get_dt_tables_config(self):
         return self.dt_tables_config
 
     def get_sqlalchemy_table_stmts(self):
         return self.sqlalchemy_table_stmts
 
+    def get_form_template(self, uid):
+        return self.form_templates[uid]
+
+    def get_client_config(self, uid):
+        return self.client_configs[uid]
+
 class LinkIDs:
-    """ Sets p_uid, c_uid, row_id, fk_id, and fk prior to getting data for DataTables.
+    """ Sets p_uid, c_uid, row_id, fk_id, and fk for the table requested by scrud.js.
 
     Parameters
     ----------
     p_uid : int
         parent table uid
-    c_uid : int
-        child table uid
     row_id : int
         parent table row
     fk_id : int
@@ -259,23 +394,51 @@ class LinkIDs:
     fk : str
         child table foreign key attribute (ie Employee.company_id : fk = company_id)
 
+    Attributes
+    ----------
+    c_uid : int
+        child table uid, None if no link was clicked (the parent table is displayed)
+
     Notes
     -----
-    I originally tried having DataTables send the id's in its ajax call.  This did not work because it would try to reinitialize the table, which it won't do.  DataTable.ajax.reload(), which doesn't reinitialize the table, does not have an option to send new parameter values to the reload call.  This class is my work around.
+    scrud.js sends the link parameters with every init_table and get_data request (DataTables ajax.data function is called on every ajax.reload), so nothing is stored on the server between requests.  Concurrent users, threads and worker processes can't see each other's links.
     """
-    def __init__(self):
-        self.p_uid = None #parent table uid
-        self.c_uid = None #child table uid
-        self.row_id = None
-        self.fk_id = None
-        self.fk = None
-
-    def set_link_ids(self, p_uid, c_uid, row_id, fk_id, fk):
-        self.p_uid = p_uid
-        self.c_uid = c_uid
+    def __init__(self, p_uid, row_id=None, fk_id=None, fk=None):
+        if isinstance(row_id, str):
+            row_id = None if row_id in ("None", "") else int(row_id)
+        if isinstance(fk_id, str):
+            fk_id = None if fk_id in ("None", "") else int(fk_id)
+        if fk in ("None", ""):
+            fk = None
+        self.p_uid = int(p_uid) #parent table uid
         self.row_id = row_id
         self.fk_id = fk_id
-        self.fk = fk
+        self.fk = fk # fk is a str in both .js and .py
+        self.c_uid = self._get_child_uid() #child table uid
+
+    @classmethod
+    def from_request(cls, dt_request):
+        """ Get the link parameters from the json sent by scrud.js """
+        return cls(dt_request["p_uid"], dt_request.get("row_id"), dt_request.get("fk_id"), dt_request.get("fk"))
+
+    def _get_child_uid(self):
+        p_class = current_app.tc.get_dt_tables_config()[self.p_uid]["class_"]
+        c_uid = None # default is parent table
+        if self.fk_id: # get child table uid (both osr and msr define row_id)
+            fk = None
+            for c in list(inspect(p_class).columns):
+                if c.name == self.fk:
+                    insp = inspect(c)
+                    fk = next(iter(insp.foreign_keys))
+            c_uid = get_uid_from_tablename(fk._table_key())
+        elif self.row_id: # msr table
+            msr = getattr(p_class, self.fk) # returns ManySideRelationship class
+            c_uid = get_uid_from_tablename(msr.related_classname.lower())
+        return c_uid
+
+    def get_uid(self):
+        """ uid of the table to display """
+        return self.c_uid if self.row_id else self.p_uid
 
     def get_link_ids(self):
         return {
@@ -286,26 +449,39 @@ class LinkIDs:
             "fk": self.fk
         }
 
-def get_table_data():
-    """ Get the data for the requested table from the database.
+def get_table_query(link_ids, dt_request=None, all_rows=False):
+    """ Build the sqlalchemy select statement for the requested table.
 
     Parameters
     ----------
     current_app.tc : TableConfig instance
-    current_app.link_ids : LinkIDs instance
+    link_ids : dict
+        LinkIDs.get_link_ids() for the requested table
+    dt_request : dict
+        DataTables ajax request.  If it includes "draw", the request is a DataTables server side processing request and start/length, order and search are done by the database.  If it includes "compact" = true, the records are sent without html (see decorate_records()).  If it includes "arrays" = true, each record is a list in the TableConfig row_columns order instead of a dict.
+    all_rows : bool
+        True to select every row of the table view (exports).  The order and search of dt_request are done by the database, even for a client side table, and start/length are ignored.
 
     Returns
     -------
-    records_total : int
-        total number of records (rows) in requested table
-    records : list of dicts
-        requested table data in json format required by DataTables
+    query : dict
+        uid : uid of the table to display
+        t : sqlalchemy_table_stmt of the table to display
+        select : sqlalchemy select statement
+        link_filter : WHERE clause for a linked (child) table, None for a parent table
+        search_filter : WHERE clause for the DataTables search, None if no search
+        keyset : see get_keyset(), None if keyset pagination is not used
+        start : index of the first requested row
+        paged : True if only one page of rows is selected (LIMIT)
+        compact : True if the records are sent without html
+        arrays : True if the records are lists (see get_records())
 
     Notes
     -----
     In my usage, parent refers to the table containing the link.  Child refers to the table called by the link.
+
+    See https://datatables.net/manual/server-side for the server side request and response parameters.
     """
-    link_ids = current_app.link_ids.get_link_ids()
     p_uid = link_ids["p_uid"] # parent table uid
     c_uid = link_ids["c_uid"] # child table uid, =None unless link clicked
     row_id = link_ids["row_id"] # parent table row
@@ -317,83 +493,497 @@ def get_table_data():
 
     # If child table, set uid and filter
     # row_id or fk_id != None if child table
-    link_table_flag = False # Default is parent table
     link_filter = None
     if fk_id: # link to child table
         c_class = current_app.tc.get_dt_tables_config()[c_uid]["class_"]
         link_filter = (c_class.id == fk_id)
         uid = c_uid # display the child table
-        link_table_flag = True
     elif row_id: # link to msr table (fk_id=None, row_id = int in this case)
         msr = getattr(p_class, fk) # returns ManySideRelationship class
         related_class = getattr(current_app.tc.modules, msr.related_classname)
         fk_col = getattr(related_class, msr.fk) # i.e. Employee.company_id
         link_filter = (fk_col == row_id)
         uid = c_uid
-        link_table_flag = True
 
     # get requested table from database
     t = current_app.tc.get_sqlalchemy_table_stmts()[uid] # for table to display
+    server_side = bool(dt_request) and "draw" in dt_request \
+        and current_app.tc.get_dt_tables_config()[uid]["server_side"]
+    if all_rows:
+        server_side = True
+        dt_request = dict(dt_request or {}, start=0, length=-1)
 
-    # build select stmt
-    # get columns for select
-    sel_cols = []
-    for col in t["columns"]:
-        if col["type"] == "osr":
-            # need to rename fk_id to avoid key name ambiguity since there
-            # can be more than one fk in a model
-            if "fk_id" in col["col_name"]:
-                attr = getattr(col["alias"], col["pk"]).label(col["col_name"])
-            else:
-                attr = getattr(col["alias"], col["display"]).label(col["col_name"])
-        elif col["type"] == "msr":
-            attr = col["display"].label(col["col_name"])
-        else: # value from database
-            attr = getattr(t["class_"], col["display"]).label(col["col_name"])
-        sel_cols.append(attr)
+    arrays = bool(dt_request) and bool(dt_request.get("arrays"))
 
     # combine select, join (select_from) and where stmts into one sqlalchemy statement
-    if link_table_flag: # child table
-        s = select(sel_cols, use_labels=True)\
-            .select_from(t["osr_join"])\
-            .where(link_filter)\
-            .order_by(t["order_stmt"])
-    else: # parent table
-        s = select(sel_cols, use_labels=True)\
+    s = select(t["row_select_columns"] if arrays else t["select_columns"], use_labels=True)\
+        .select_from(t["osr_join"])
+    if link_filter is not None: # child table
+        s = s.where(link_filter)
+
+    search_filter = None
+    keyset = None
+    start = 0
+    paged = False
+    if server_side:
+        search_filter = get_search_filter(t, dt_request)
+        if search_filter is not None:
+            s = s.where(search_filter)
+        s = s.order_by(*get_order_by(t, uid, dt_request))
+        start = int(dt_request.get("start", 0))
+        length = int(dt_request.get("length", -1))
+        if length != -1: # DataTables sends length = -1 for "show all"
+            paged = True
+            s = s.limit(length)
+            keyset = get_keyset(t, uid, dt_request, link_ids)
+        if keyset is not None:
+            # raw db value of the order column is returned so the next cursor compares like with like
+            s = s.column(type_coerce(keyset["expr"], String).label("keyset_value"))
+            if keyset["filter"] is not None:
+                s = s.where(keyset["filter"]) # seek replaces offset
+        if paged and (keyset is None or keyset["filter"] is None):
+            s = s.offset(start)
+    else:
+        s = s.order_by(t["order_stmt"])
+
+    return {
+        "uid": uid,
+        "t": t,
+        "select": s,
+        "link_filter": link_filter,
+        "search_filter": search_filter,
+        "keyset": keyset,
+        "start": start,
+        "paged": paged,
+        "compact": bool(dt_request) and bool(dt_request.get("compact")),
+        "arrays": arrays
+    }
+
+def get_connection(query):
+    """ Check out a connection from the pool of the requested table's bind.  Use it in a with block so that it is returned to the pool.
+    """
+    return db.get_engine(bind=query["t"]["class_"].__bind_key__).connect()
+
+def get_record_counts(conn, query):
+    """ Get the DataTables recordsTotal and recordsFiltered counts for a query from get_table_query()
+
+    Returns
+    -------
+    records_total : int
+        total number of records (rows) in the requested table. A linked table only counts the rows that belong to the link.
+    records_filtered : int
+        number of records left after the search filter is applied (equals records_total if there is no search)
+    """
+    t = query["t"]
+    link_filter = query["link_filter"]
+    search_filter = query["search_filter"]
+    if link_filter is not None:
+        count_stmt = select([func.count(t["class_"].id)]).where(link_filter)
+        records_total = conn.execute(count_stmt).scalar()
+    else: # cached, see caches.py
+        count_stmt = select([func.count(t["class_"].id)])
+        records_total = current_app.row_counts.get(query["uid"], lambda: conn.execute(count_stmt).scalar())
+
+    # filtered count needs the osr joins since the search includes related table display columns
+    if search_filter is not None:
+        count_stmt = select([func.count(t["class_"].id)])\
             .select_from(t["osr_join"])\
-            .order_by(t["order_stmt"])
-
-    conn = db.get_engine(bind=t["class_"].__bind_key__).connect()
-    result = conn.execute(s)
-
-    # build records as list of dicts in format required by DataTables
-    records = [{k:v for k, v in row.items()} for row in result]
-
-    # add update and delete functions to each row
-    for r in records:
-        r["functions"] = set_function_icon_html(r["id"], uid)
-
-    # for each record, and each column, check if the column is a link
-    # if so, then set the link str and html data-* parameters for that row/column.
-    for r in records:
-        for spec in t["columns"]:
-            if spec["link"]:
-                col_name = spec["col_name"]
-                row_id = r["id"]
-                link_str = r[col_name] # the column value
-                fk = col_name # ie company_id
-                if spec["type"] == "msr":
-                    fk_id = None
-                    r[col_name] = set_table_link_html(uid, row_id, fk_id, fk, link_str)
-                elif spec["type"] == "osr":
-                    # see _sqlalchemy_stmt() for fk_id column name convention
-                    display_value = r["fk_id" + col_name]
-                    if display_value: #display_value=None if db value=null
-                        fk_id = r["fk_id" + col_name]
-                        r[col_name] = set_table_link_html(uid, row_id, fk_id, fk, link_str)
-                    else: # null value in db
-                        r[col_name] = "None"
-
-    # get total records in table for DataTables footer
-    records_total = db.session.query(t["class_"].id).count()
-    return records_total, records
+            .where(search_filter)
+        if link_filter is not None:
+            count_stmt = count_stmt.where(link_filter)
+        records_filtered = conn.execute(count_stmt).scalar()
+    else:
+        records_filtered = records_total
+    return records_total, records_filtered
+
+def get_next_cursor(query, records):
+    """ Get the keyset pagination cursor for the page after records.  The cursor is the last row (order column value, id).  Removes the keyset_value column from records.
+    """
+    keyset = query["keyset"]
+    if keyset is None:
+        return None
+    if query["arrays"]:
+        for r in records:
+            keyset_value = r.pop() # keyset_value is the last select column
+        id_key = query["t"]["row_index"]["id"]
+    else:
+        for r in records:
+            keyset_value = r.pop("keyset_value")
+        id_key = "id"
+    if not records:
+        return None
+    cursor = dict(keyset["cursor"])
+    cursor["start"] = query["start"] + len(records)
+    cursor["values"] = [keyset_value, records[-1][id_key]]
+    return cursor
+
+def get_records(rows, query):
+    """ Convert fetched rows to records, a dict for each row or a list for each row if query["arrays"].
+
+    A list record has the values in the TableConfig row_columns order: the DataTables columns, then the fk_id columns.  It costs less to build and serialize than a dict, which repeats every column name in each row.
+    """
+    if query["arrays"]:
+        return [list(row) for row in rows]
+    return [{k:v for k, v in row.items()} for row in rows]
+
+def decorate_records(records, query):
+    """ Encode the non json column values and add the update/delete function buttons and the table link html to each record (in place).
+
+    Notes
+    -----
+    A list record (query["arrays"]) gets the functions html appended after its last value.
+
+    A compact query (scrud.js get_data requests when SCRUD_COMPACT_DATA = True) gets no html.  The functions column is left out and a link column keeps its value.  scrud.js renders the buttons and links in the browser from the row id, the fk_id column of a one side link and the "links" of dt_tables_config.
+    """
+    t = query["t"]
+    if query["arrays"]:
+        encode_records(records, t["row_encoders"])
+        if not query["compact"]:
+            t["row_decorator"].decorate(records)
+    else:
+        encode_records(records, t["encoders"])
+        if not query["compact"]:
+            t["decorator"].decorate(records)
+
+def get_table_data(link_ids, dt_request=None, query=None):
+    """ Get the data for the requested table from the database.
+
+    Parameters
+    ----------
+    current_app.tc : TableConfig instance
+    current_app.row_counts : RowCountCache instance
+    current_app.result_cache : ResultCache instance or None
+    link_ids : dict
+        LinkIDs.get_link_ids() for the requested table
+    dt_request : dict
+        DataTables ajax request (see get_table_query())
+    query : dict or None
+        get_table_query() of link_ids and dt_request if the caller already built it
+
+    Returns
+    -------
+    table_data : dict
+        recordsTotal : int
+            total number of records (rows) in requested table
+        recordsFiltered : int
+            number of records left after the search filter is applied (equals recordsTotal if there is no search)
+        data : list of dicts (lists if the request has "arrays", see get_records())
+            requested table data in json format required by DataTables
+        cursor : dict or None
+            keyset pagination cursor for the next page. scrud.js sends it back with the next request. None if the table does not use keyset pagination.
+    """
+    if query is None:
+        query = get_table_query(link_ids, dt_request)
+    cache = getattr(current_app, "result_cache", None)
+    if cache is not None: # see ResultCache in caches.py
+        return cache.get(query["uid"], dict(dt_request or {}, **link_ids), lambda: query_table_data(query))
+    return query_table_data(query)
+
+def query_table_data(query):
+    """ Get the table data of a query from get_table_query() from the database (see get_table_data()) """
+    t = query["t"]
+
+    # connection is returned to the bind's pool at the end of the with block
+    with get_connection(query) as conn:
+        result = conn.execute(query["select"])
+
+        # build records as list of dicts (or lists) in format required by DataTables
+        records = get_records(result, query)
+
+        set_batched_counts(conn, t, records, keys=t["row_index"] if query["arrays"] else None)
+        cursor = get_next_cursor(query, records)
+
+        # get total records in table for DataTables footer
+        records_total, records_filtered = get_record_counts(conn, query)
+
+    decorate_records(records, query)
+    return {
+        "recordsTotal": records_total,
+        "recordsFiltered": records_filtered,
+        "data": records,
+        "cursor": cursor
+    }
+
+def iter_table_records(conn, query, batch_size=1000, decorate=True):
+    """ Generator of the decorated records of a query from get_table_query().
+
+    Rows are fetched from the cursor batch_size rows at a time and decorated one batch at a time, so memory does not grow with the table size.
+
+    Parameters
+    ----------
+    conn : sqlalchemy connection
+        must stay open until the generator is exhausted
+    query : dict from get_table_query()
+    batch_size : int
+        rows fetched per database round trip
+    decorate : bool
+        False for the database values without encoding or html (exports)
+
+    Yields
+    ------
+    record : dict (list if query["arrays"])
+        one table row in the json format required by DataTables
+    """
+    result = conn.execution_options(stream_results=True).execute(query["select"])
+    # the batched counts need a second connection from the pool, since the cursor of conn stays open until the last row
+    # (mysqlclient refuses another query on it with "Commands out of sync" and PyMySQL would drain the rest of the result)
+    batched = any(col["type"] == "msr" and col["aggregate"] == "batched" for col in query["t"]["columns"])
+    counts_conn = get_connection(query) if batched else None
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            records = get_records(rows, query)
+            if counts_conn is not None:
+                set_batched_counts(counts_conn, query["t"], records, keys=query["t"]["row_index"] if query["arrays"] else None)
+            get_next_cursor(query, records)
+            if decorate:
+                decorate_records(records, query)
+            for r in records:
+                yield r
+    finally:
+        result.close()
+        if counts_conn is not None:
+            counts_conn.close()
+
+def set_batched_counts(conn, t, records, chunk_size=500, keys=None):
+    """ Set the many-side relationship counts for columns with "aggregate":"batched".
+
+    One GROUP BY query per column counts the related rows for the ids of the fetched records only.  The cost depends on the page size, not the table size.
+
+    Parameters
+    ----------
+    conn : sqlalchemy connection
+    t : dict
+        sqlalchemy_table_stmt for the requested table
+    records : list of dicts or lists
+        fetched rows, the count columns are set in place
+    chunk_size : int
+        max number of ids in each IN clause (sqlite limits the number of bound parameters)
+    keys : dict
+        column name : list index, for list records (None for dict records)
+    """
+    batched = [col for col in t["columns"] if col["type"] == "msr" and col["aggregate"] == "batched"]
+    if not batched or not records:
+        return
+    if keys is None:
+        keys = {col: col for col in t["column_exprs"]}
+    id_key = keys["id"]
+    ids = [r[id_key] for r in records]
+    for col in batched:
+        counts = {}
+        for i in range(0, len(ids), chunk_size):
+            s = select([col["fk"], func.count(col["fk_class"].id)])\
+                .where(col["fk"].in_(ids[i:i + chunk_size]))\
+                .group_by(col["fk"])
+            counts.update((fk_value, count) for fk_value, count in conn.execute(s))
+        col_key = keys[col["col_name"]]
+        for r in records:
+            r[col_key] = counts.get(r[id_key], 0)
+
+def escape_like(value):
+    """ Escape the LIKE wildcards in value so they match literally (use with escape="\\") """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def get_search_filter(t, dt_request):
+    """ Build the sqlalchemy WHERE clause for the DataTables global search value.
+
+    Parameters
+    ----------
+    t : dict
+        sqlalchemy_table_stmt for the requested table
+    dt_request : dict
+        DataTables server side request
+
+    Returns
+    -------
+    search_filter : sqlalchemy clause or None
+        OR of a case insensitive LIKE on each searchable column. None if there is no search value.
+
+    Notes
+    -----
+    Many-side relationship columns are counts, so they are not searched. The fk_id columns are not displayed, so they are not searched either.
+    """
+    search_value = dt_request.get("search", {}).get("value", "")
+    if not search_value:
+        return None
+
+    # DataTables can turn off search per column
+    not_searchable = set()
+    for c in dt_request.get("columns", []):
+        if not c.get("searchable", True):
+            not_searchable.add(c.get("data"))
+
+    # escape LIKE wildcards so they match literally
+    pattern = "%" + escape_like(search_value) + "%"
+    clauses = []
+    for col in t["columns"]:
+        col_name = col["col_name"]
+        if col["type"] == "msr" or col_name.startswith("fk_id") or col_name in not_searchable:
+            continue
+        expr = t["column_exprs"][col_name]
+        clauses.append(cast(expr, String).ilike(pattern, escape="\\"))
+    if not clauses:
+        return None
+    return or_(*clauses)
+
+def get_order_by(t, uid, dt_request):
+    """ Build the sqlalchemy ORDER BY clauses for the DataTables order request.
+
+    Parameters
+    ----------
+    t : dict
+        sqlalchemy_table_stmt for the requested table
+    uid : int
+        uid of the requested table
+    dt_request : dict
+        DataTables server side request
+
+    Returns
+    -------
+    order_by : list of sqlalchemy clauses
+        The pk id is always the last clause so that paging is deterministic when the order column has duplicate values.
+    """
+    columns = current_app.tc.get_dt_tables_config()[uid]["columns"]
+    order_by = []
+    for o in dt_request.get("order", []):
+        i = int(o["column"]) # DataTables column index
+        if i >= len(columns):
+            continue
+        col_name = columns[i]["data"]
+        if col_name not in t["column_exprs"]: # functions column
+            continue
+        expr = t["column_exprs"][col_name]
+        order_by.append(expr.desc() if o.get("dir") == "desc" else expr.asc())
+    if not order_by:
+        order_by.append(t["order_stmt"])
+    # id tie breaker follows the direction of the first order column (required by keyset pagination)
+    if order_by[0].modifier is operators.asc_op:
+        order_by.append(t["class_"].id.asc())
+    else:
+        order_by.append(t["class_"].id.desc())
+    return order_by
+
+def get_keyset(t, uid, dt_request, link_ids):
+    """ Get the keyset (seek) pagination parameters for a server side request.
+
+    Keyset pagination fetches the next page with an indexed range predicate on (order column, id) instead of OFFSET, so deep pages cost the same as the first page.  It is used when the model sets dt_keyset_pagination = True, the table is ordered by one database value column and the request includes the cursor returned with the previous page.
+
+    Parameters
+    ----------
+    t : dict
+        sqlalchemy_table_stmt for the requested table
+    uid : int
+        uid of the requested table
+    dt_request : dict
+        DataTables server side request plus the "cursor" sent back by scrud.js
+    link_ids : dict
+        link parameters for the requested table
+
+    Returns
+    -------
+    keyset : dict or None
+        None if the table or request order can't use keyset pagination
+        expr : sqlalchemy column of the order column
+        cursor : dict of the request parameters the cursor is valid for
+        filter : sqlalchemy seek clause, None if the request cursor does not match this request (ie first page, page jump, new search).  OFFSET is used in that case.
+
+    Notes
+    -----
+    The seek clause compares the raw database value of the order column (type_coerce to String) with the raw value returned with the previous page. sqlite stores dates as strings, so comparing a python datetime with the stored value would not be exact.
+
+    sqlite and mysql sort NULL before any value. A desc seek includes NULL rows since they come after the cursor. An asc seek from a NULL cursor value falls back to OFFSET.
+    """
+    if not t["keyset"]:
+        return None
+    columns = current_app.tc.get_dt_tables_config()[uid]["columns"]
+    order = dt_request.get("order", [])
+    if len(order) > 1:
+        return None
+    elif order:
+        i = int(order[0]["column"])
+        if i >= len(columns):
+            return None
+        col_name = columns[i]["data"]
+        direction = "desc" if order[0].get("dir") == "desc" else "asc"
+    else:
+        col_name, direction = t["order_col"]
+
+    # only database values of this table can be seeked with an index
+    col_types = {col["col_name"]: col["type"] for col in t["columns"]}
+    if col_types.get(col_name) != "value":
+        return None
+    expr = t["column_exprs"][col_name]
+
+    # the cursor is only valid for the next page of the same table view
+    cursor = {
+        "uid": uid,
+        "col": col_name,
+        "dir": direction,
+        "search": dt_request.get("search", {}).get("value", ""),
+        "row_id": link_ids["row_id"],
+        "fk_id": link_ids["fk_id"],
+        "fk": link_ids["fk"]
+    }
+    seek_filter = None
+    request_cursor = dt_request.get("cursor") or {}
+    if all(request_cursor.get(k) == v for k, v in cursor.items()) \
+        and request_cursor.get("start") == int(dt_request.get("start", 0)):
+        value, last_id = request_cursor["values"]
+        raw = type_coerce(expr, String)
+        id_col = t["class_"].id
+        if value is None:
+            if direction == "desc": # only NULL rows are left
+                seek_filter = and_(expr.is_(None), id_col < last_id)
+        elif direction == "desc":
+            seek_filter = or_(raw < value, and_(raw == value, id_col < last_id), expr.is_(None))
+        else:
+            seek_filter = or_(raw > value, and_(raw == value, id_col > last_id))
+    return {"expr": expr, "cursor": cursor, "filter": seek_filter}
+
+def get_lookup_options(class_, column_name, search_value, page=0, page_size=20):
+    """ Search the relationship table of a form lookup input (form_spec "type": "lookup").
+
+    Parameters
+    ----------
+    class_ : sqlalchemy class
+        table of the form (ie Employee)
+    column_name : str
+        foreign key column of the lookup input (ie company_id)
+    search_value : str
+        text typed in the lookup search box
+    page : int
+        page of options, starting at 0
+    page_size : int
+        options per page
+
+    Returns
+    -------
+    options : [(value, display_str)]
+        primary key and display str of the matching records, ordered by the first display column
+    more : bool
+        True if there is another page
+
+    Notes
+    -----
+    Records match if any of the related class display_columns starts with search_value (case insensitive), or contains it if the form_spec item has "match": "contains".  Only page_size + 1 rows are read (the extra row sets "more"), so the cost does not grow with the size of the relationship table.
+    """
+    spec = class_.form_spec.get(column_name)
+    if spec is None or spec.get("type") != "lookup":
+        raise ValueError(f"{class_.__name__}.{column_name} is not a lookup input")
+    related_class = get_related_class(getattr(class_, column_name), current_app.tc.modules)
+    if related_class.display_columns is None:
+        raise ValueError(f"{related_class.__name__} needs display_columns for a lookup input")
+    pk = getattr(related_class, inspect(related_class).primary_key[0].name)
+    columns = [getattr(related_class, col) for col in related_class.display_columns]
+
+    q = db.session.query(pk, *columns)
+    if search_value:
+        pattern = escape_like(search_value) + "%"
+        if spec.get("match") == "contains":
+            pattern = "%" + pattern
+        q = q.filter(or_(*[col.ilike(pattern, escape="\\") for col in columns]))
+    rows = q.order_by(columns[0], pk).offset(page * page_size).limit(page_size + 1).all()
+    options = [(r[0], " ".join(str(v) for v in r[1:])) for r in rows[:page_size]]
+    return options, len(rows) > page_size
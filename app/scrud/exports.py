@@ -0,0 +1,186 @@
+""" Streaming export of a table view to csv, jsonl or parquet (see export_table in views.py).
+
+The rows come from the same select as get_data (get_table_query() with all_rows=True), so the osr joins, msr counts, link filter, search and order are the ones the user sees.  The rows are fetched batch_size at a time from a server side cursor (stream_results) and written as they are fetched, so memory does not grow with the table size.
+
+The exported columns are the DataTables columns (dt_column_spec) without the function buttons, so the id and the many side relationship counts (ie Company.employees) are exported too.  The header is the column name, except a one side relationship column, which holds the display value of the related record, is named by its form_spec label (ie "Employer" for Employee.company_id).  The file can then be imported back with /scrud/import (see imports.py), which skips the id and count columns, so the rows get new ids.
+
+Parquet needs the optional pyarrow package.  Each batch is one parquet row group.
+"""
+import csv
+import io
+
+from sqlalchemy import types
+
+from .controllers import LinkIDs, get_table_query, get_connection, iter_table_records
+from .serializers import dumps
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # optional dependency
+    pa = None
+    pq = None
+
+EXPORT_MIMETYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+def get_export_formats():
+    return [fmt for fmt in EXPORT_MIMETYPES if fmt != "parquet" or pq is not None]
+
+def get_export_query(dt_request):
+    """ Get the get_table_query() query of every row of a table view.
+
+    Parameters
+    ----------
+    dt_request : dict
+        link parameters (p_uid, row_id, fk_id, fk) and the DataTables search and order of the table view
+    """
+    link_ids = LinkIDs.from_request(dt_request)
+    dt_request = dict(dt_request, compact=True, arrays=True)
+    return get_table_query(link_ids.get_link_ids(), dt_request, all_rows=True)
+
+def get_export_columns(query):
+    """ Get the exported columns of a query from get_table_query().
+
+    Returns
+    -------
+    columns : list of (index, name, column type)
+        index of the column in a query record (arrays), header name and sqlalchemy type of the column expression
+    """
+    t = query["t"]
+    spec = t["class_"].dt_column_spec
+    form_spec = getattr(t["class_"], "form_spec", {})
+    col_types = {col["col_name"]: col["type"] for col in t["columns"]}
+    columns = []
+    for col in t["row_columns"]:
+        if col not in spec or col not in t["column_exprs"]: # fk_id and functions columns
+            continue
+        # the import matches the form_spec label, which may differ from the table label
+        name = form_spec.get(col, spec[col]).get("label", col) if col_types.get(col) == "osr" else col
+        columns.append((t["row_index"][col], name, t["column_exprs"][col].type))
+    return columns
+
+def iter_export_batches(query, columns, batch_size=10000, encode=True, progress=None):
+    """ Generator of lists of up to batch_size rows (lists of the exported column values).
+
+    Parameters
+    ----------
+    query : dict from get_table_query()
+        with "arrays" and "compact" set, so the records are lists without html
+    columns : list from get_export_columns()
+    encode : bool
+        True to convert dates and Decimals to str (see get_column_encoder()), False for the database values
+    progress : function(rows) or None
+        called with the number of rows fetched before each batch is yielded (see jobs.py)
+    """
+    indexes = [i for i, name, column_type in columns]
+    # connection is returned to the bind's pool when the generator is closed
+    rows = 0
+    with get_connection(query) as conn:
+        batch = []
+        for r in iter_table_records(conn, query, batch_size, decorate=encode):
+            batch.append([r[i] for i in indexes])
+            if len(batch) == batch_size:
+                rows += len(batch)
+                if progress is not None:
+                    progress(rows)
+                yield batch
+                batch = []
+        if batch:
+            if progress is not None:
+                progress(rows + len(batch))
+            yield batch
+
+def export_csv(query, batch_size=10000, progress=None):
+    """ Generator of the csv file, one str for the header and for each batch of rows """
+    columns = get_export_columns(query)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for i, name, column_type in columns])
+    for batch in iter_export_batches(query, columns, batch_size, progress=progress):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def export_jsonl(query, batch_size=10000, progress=None):
+    """ Generator of the jsonl file (one json object per row), one str for each batch of rows """
+    columns = get_export_columns(query)
+    names = [name for i, name, column_type in columns]
+    for batch in iter_export_batches(query, columns, batch_size, progress=progress):
+        yield "".join(dumps(dict(zip(names, r))) + "\n" for r in batch)
+
+def get_arrow_type(column_type):
+    """ Get the parquet (arrow) type of a column.  Decimals are written as str, like the json encoders do. """
+    if isinstance(column_type, types.Boolean):
+        return pa.bool_()
+    elif isinstance(column_type, types.Integer):
+        return pa.int64()
+    elif isinstance(column_type, types.Numeric):
+        return pa.string() if column_type.asdecimal else pa.float64()
+    elif isinstance(column_type, types.DateTime):
+        return pa.timestamp("us")
+    elif isinstance(column_type, types.Date):
+        return pa.date32()
+    elif isinstance(column_type, types.Time):
+        return pa.time64("us")
+    return pa.string()
+
+class ParquetSink:
+    """ Write only file for pyarrow.parquet.ParquetWriter.  The bytes written since the last drain() are returned by drain(), so the file can be streamed while it is written. """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def export_parquet(query, batch_size=10000, progress=None):
+    """ Generator of the parquet file, one bytes for each row group (batch of rows) and one for the footer """
+    if pq is None:
+        raise ValueError("Parquet export needs the pyarrow package (pip install pyarrow)")
+    columns = get_export_columns(query)
+    schema = pa.schema([(name, get_arrow_type(column_type)) for i, name, column_type in columns])
+    # the database values are written, except Decimals which are str
+    decimals = [k for k, (i, name, column_type) in enumerate(columns)
+                if isinstance(column_type, types.Numeric) and column_type.asdecimal]
+    sink = ParquetSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in iter_export_batches(query, columns, batch_size, encode=False, progress=progress):
+            for r in batch:
+                for k in decimals:
+                    r[k] = None if r[k] is None else str(r[k])
+            arrays = [pa.array([r[k] for r in batch], type=field.type) for k, field in enumerate(schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+EXPORTERS = {
+    "csv": export_csv,
+    "jsonl": export_jsonl,
+    "parquet": export_parquet
+}
@@ -1,4 +1,5 @@
-from sqlalchemy import inspect
+import datetime as dt
+from sqlalchemy import inspect, DateTime, Integer, Numeric
 from flask import current_app
 from app import ManySideRelationship
 
@@ -16,6 +17,54 @@ def str_to_bool(s):
     else:
         return s
 
+def to_column_type(class_, name, value):
+    """ Convert a form str value to the python type of a numeric model column (int, float or Decimal), so computed columns see the same types as values read from the database.  A datetime str (ie from an export, see exports.py) is converted to a datetime, since sqlite only accepts datetime objects.  Other values are returned as is.
+
+    Parameters
+    ----------
+    class_ : sqlalchemy class
+    name : str
+        column name
+    value : str or converted value (ie bool, None)
+    """
+    column = class_.__table__.columns.get(name)
+    if column is None or not isinstance(value, str):
+        return value
+    if isinstance(column.type, DateTime):
+        return dt.datetime.fromisoformat(value)
+    if not isinstance(column.type, (Integer, Numeric)):
+        return value
+    return column.type.python_type(value)
+
+def convert_form_value(class_, name, value):
+    """ Convert a form input value (str) to the value that is set on the model attribute.  Values that are not str (ie from a json bulk request) are only converted if they are numeric strs.
+
+    Parameters
+    ----------
+    class_ : sqlalchemy class
+    name : str
+        column name
+    value : str
+    """
+    # convert date str to datetime if using sqlite database
+    if name == "date" and current_app.config["DATABASE"] == "sqlite" and isinstance(value, str) and value:
+        value = dt.datetime.strptime(value, "%Y-%m-%d")
+    return to_column_type(class_, name, str_to_bool(value))
+
+def to_form_str(value):
+    """ Convert a model attribute value to the str a form input would send (for WTForms validation) """
+    if value is None:
+        return ""
+    elif value is False:
+        return "false"
+    elif value is True:
+        return "y"
+    elif isinstance(value, dt.datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    elif isinstance(value, dt.date):
+        return value.isoformat()
+    return str(value)
+
 def get_related_class(attr, modules):
     """ Get the class referenced by a model attribute.
 
@@ -1,3 +1,4 @@
+from types import SimpleNamespace
 from flask import current_app
 from sqlalchemy.inspection import inspect
 from app import db
@@ -11,6 +12,7 @@ class SetFormInputHTML():
         any html <input> type - form input field defined by html standard
         textarea - html textarea type
         dropdown - form input field is drop down list (PAB defined type)
+        lookup - search box for a record in the relationship table (PAB defined type)
         boolean - True/False inline radio buttons
         computed - not in form: value is computed and entered by .py code
 
@@ -26,9 +28,11 @@ class SetFormInputHTML():
         values from one row of database table will be shown as values in form input fields (pre-fill current values in update form)
     validate: HTML validate keyword
         this is not fully implemented
+    uid : int
+        unique id of the table (used by lookup inputs)
     """
 
-    def __init__(self, label, placeholder, value, type, validate, form_type, class_, record, column_name):
+    def __init__(self, label, placeholder, value, type, validate, form_type, class_, record, column_name, uid=None):
         self.label = label
         self.placeholder = placeholder
         self.value = value
@@ -38,6 +42,7 @@ class SetFormInputHTML():
         self.class_ = class_
         self.record = record
         self.column_name = column_name
+        self.uid = uid
 
     def get_dropdown_list(self):
         """Build a list of (value, display_str) tuples for all records in the relationship table (ie Employee.company_id -- company is the relationship table). These records are displayed in the create/update record form dropdown inputs.
@@ -50,15 +55,27 @@ class SetFormInputHTML():
         ddl : [(value, display_str)] list of value (id or primary key) and display_str for dropdown lists
             lists all records in relationship table (ie company)
         """
+        ddl = [(None, f"Select {self.label}...")]
+        ddl.extend(self.get_dropdown_options())
+        return ddl
+
+    def get_dropdown_options(self):
+        """ Get the (value, display_str) list of the relationship table records, without the "Select..." item.  The list is cached until the related table changes (see OptionCache in caches.py), so the same list object is returned until then.
+        """
         attr = getattr(self.class_, self.column_name)
         related_class = get_related_class(attr, current_app.tc.modules)
-        q = db.session.query(related_class).all()
         pk_name = inspect(related_class).primary_key[0].name
-        ddl = [(None, f"Select {self.label}...")]
-        for r in q:
-            # ddl.append((r.id, r.__str__()))
-            ddl.append((getattr(r, pk_name), r.__str__()))
-        return ddl
+
+        def load_options():
+            if related_class.display_columns is None:
+                q = db.session.query(related_class).all()
+                return [(getattr(r, pk_name), r.__str__()) for r in q]
+            # only the pk and display columns, as tuples (no model objects)
+            columns = [getattr(related_class, col) for col in related_class.display_columns]
+            q = db.session.query(getattr(related_class, pk_name), *columns)
+            return [(r[0], " ".join(str(v) for v in r[1:])) for r in q]
+
+        return current_app.option_cache.get(related_class.__table__.name, load_options)
 
     def set_dropdown_html(self):
         """ Build the HTML for a form <select> input
@@ -68,9 +85,6 @@ class SetFormInputHTML():
         input_html : str
             HTML <select> string to define dropdown menu and options
         """
-        html = '<div class="form-group">'
-        html += '<label class="control-label col-sm-4"> {} </label>'.format(self.label)
-        html += '<div class="col-sm-8">'
         # a dropdown is the same for update or create modal
         ddl = self.get_dropdown_list() # drop down list
         if self.form_type == "update": # get default value "selected" for dropdown
@@ -78,18 +92,68 @@ class SetFormInputHTML():
         else:
             selected_id = None
 
-        # build dropdown <option> items
-        ddl_str = ''
-        for item in ddl:
-            if item[0] == selected_id:
-                ddl_str += '<option selected value="{}"> {} </option>'.format(item[0], item[1])
-            else:
-                ddl_str += '<option value="{}"> {} </option>'.format(item[0], item[1])
+        html = self.set_dropdown_head_html()
+        html += "".join(set_option_html(value, display_str, value == selected_id) for value, display_str in ddl)
+        html += """</select>"""
+        return html
 
+    def set_dropdown_head_html(self):
+        """ The dropdown html before the <option> items (label and <select>) """
+        html = '<div class="form-group">'
+        html += '<label class="control-label col-sm-4"> {} </label>'.format(self.label)
+        html += '<div class="col-sm-8">'
         html += '<select class="form-control" id="{col_name}" name="{col_name}" "{validate}">'\
             .format(col_name=self.column_name, validate = self.validate)
-        html += ddl_str
-        html += """</select>"""
+        return html
+
+    def get_lookup_display(self, selected_id):
+        """ Get the display str of the selected record of a lookup input (one row of the relationship table)
+        """
+        if selected_id is None:
+            return ""
+        attr = getattr(self.class_, self.column_name)
+        related_class = get_related_class(attr, current_app.tc.modules)
+        pk = getattr(related_class, inspect(related_class).primary_key[0].name)
+        if related_class.display_columns is None:
+            r = db.session.query(related_class).filter(pk == selected_id).first()
+            return "" if r is None else r.__str__()
+        columns = [getattr(related_class, col) for col in related_class.display_columns]
+        r = db.session.query(*columns).filter(pk == selected_id).first()
+        return "" if r is None else " ".join(str(v) for v in r)
+
+    def set_lookup_html(self, display=None):
+        """ Build the HTML for a lookup input : a search box for records in the relationship table
+        (ie Employee.company_id) and a hidden input with the selected record's primary key.
+
+        scrud.js searches the relationship table with the /scrud/lookup endpoint as the user types, so the form only has the selected record and not an <option> for every record like set_dropdown_html().
+
+        Parameters
+        ----------
+        display : str
+            display str of the selected record.  If None, it is read from the database.
+
+        Returns
+        -------
+        input_html : str
+        """
+        html = '<div class="form-group">'
+        html += '<label class="control-label col-sm-4"> {} </label>'.format(self.label)
+        html += '<div class="col-sm-8">'
+        if self.form_type == "update":
+            selected_id = getattr(self.record, self.column_name)
+        else:
+            selected_id = None
+        if display is None:
+            display = self.get_lookup_display(selected_id)
+        placeholder = self.placeholder or f"Search {self.label}..."
+
+        html += '<div class="lookup dropdown" data-uid="{uid}" data-column="{col_name}">'.format(uid=self.uid, col_name=self.column_name)
+        html += '<input type="hidden" id="{col_name}" name="{col_name}" value="{value}">'\
+            .format(col_name=self.column_name, value="" if selected_id is None else selected_id)
+        html += '<input class="form-control lookup_search" type="text" autocomplete="off" placeholder="{placeholder}" value="{display}" {validate}>'\
+            .format(placeholder=placeholder, display=display, validate=self.validate)
+        html += '<ul class="dropdown-menu lookup_results"></ul>'
+        html += '</div>'
         return html
 
     def set_radio_html(self):
@@ -187,53 +251,202 @@ def set_table_link_html(uid, row_id, fk_id, fk, link_str):
     """
     return '<a id="table_link" data-uid={uid} data-row_id={row_id} data-fk_id={fk_id} data-fk={fk} href="#">{link_str}</a>'.format(uid=uid, row_id=row_id, fk_id=fk_id, fk=fk, link_str=link_str)
 
-def set_form_html(class_, record, form_type):
-    """ Defines the html form as an html string
+def compile_html_template(html, *fields):
+    """ Convert html with {field} placeholders to a %-format template with one %s for each field, in the order the fields are given (which must be the order they appear in html).  Any other % in html is escaped.
+    """
+    template = html.replace("%", "%%")
+    for field in fields:
+        template = template.replace("{" + field + "}", "%s")
+    return template
+
+class RowDecorator:
+    """ Adds the function buttons and the table link html to the records of one table.  Built once for each table by TableConfig.
+
+    The html of set_function_icon_html() and set_table_link_html() is compiled into a template for each link column with uid and fk already filled in, so decorating a record only formats the row values.  decorate() works one column at a time over all records.
+
+    Parameters
+    ----------
+    uid : int
+        table uid
+    columns : list of dicts
+        TableConfig sqlalchemy_table_stmts "columns" of the table
+    row_index : dict
+        column name : list index, for list records (TableConfig row_columns).  None for dict records.  The functions html is appended to a list record.
+    """
+    def __init__(self, uid, columns, row_index=None):
+        self.arrays = row_index is not None
+        if row_index is None:
+            row_index = {col["col_name"]: col["col_name"] for col in columns}
+        self.id_key = row_index["id"]
+        # row id is used twice (update and delete buttons)
+        self.function_template = compile_html_template(set_function_icon_html("{id}", uid), "id", "id")
+        self.links = [] # (col key, fk_id col key or None for msr, template)
+        for col in columns:
+            if not col["link"]:
+                continue
+            col_name = col["col_name"]
+            # fk is the column name (ie company_id)
+            html = set_table_link_html(uid, "{row_id}", "{fk_id}", col_name, "{link_str}")
+            template = compile_html_template(html, "row_id", "fk_id", "link_str")
+            if col["type"] == "msr":
+                self.links.append((row_index[col_name], None, template))
+            elif col["type"] == "osr":
+                # see TableConfig._sqlalchemy_stmt() for fk_id column name convention
+                self.links.append((row_index[col_name], row_index["fk_id" + col_name], template))
+
+    def decorate(self, records):
+        """ Add the html to each record (in place) """
+        id_key = self.id_key
+        template = self.function_template
+        if self.arrays:
+            for r in records:
+                row_id = r[id_key]
+                r.append(template % (row_id, row_id))
+        else:
+            for r in records:
+                row_id = r[id_key]
+                r["functions"] = template % (row_id, row_id)
+
+        for col_key, fk_id_key, template in self.links:
+            if fk_id_key is None: # many side, fk_id = None
+                for r in records:
+                    r[col_key] = template % (r[id_key], None, r[col_key])
+            else: # one side
+                for r in records:
+                    fk_id = r[fk_id_key]
+                    if fk_id: # fk_id = None if db value = null
+                        r[col_key] = template % (r[id_key], fk_id, r[col_key])
+                    else:
+                        r[col_key] = "None"
+
+def set_option_html(value, display_str, selected=False):
+    """ Build the html of one dropdown <option> """
+    if selected:
+        return '<option selected value="{}"> {} </option>'.format(value, display_str)
+    return '<option value="{}"> {} </option>'.format(value, display_str)
+
+class FormTemplate:
+    """ The create and update form html of one table.  Built once for each table by TableConfig.
+
+    The html of each form_spec input is built once by SetFormInputHTML, with placeholders for the record values, and compiled into a %-template (see compile_html_template()).  A get_form request only fills in the record values, the dropdown options and the selected option.  form_spec is not changed (missing placeholder, value and validate keys default to "").
+
+    The <option> html of a dropdown is built once for each option list returned by the OptionCache (until the related table changes).  The selected option is then spliced in.
 
     Parameters
     ----------
+    uid : int
+        table uid
     class_ : sqlalchemy class
-        form will create/update a record in the table with this classname (i.e. Employee)
-    record : sqlalchemy query
-        values from one row of database table will be shown as values in form input fields (pre-fill current values in update form)
-    form_type : str
-        'update' or 'create' : type of modal to display
-
-    Returns
-    -------
-    form_str : str
-        string of html code that defines the form modal
-    modal_title : str
-        title displayed in modal
+        form will create/update a record in the table with this class name (i.e. Employee)
     """
-    if form_type == 'update': # show selected row values in form
-        modal_title = 'Update record'
-    else:
-        modal_title = 'Create record'
-    form_str = ''
-    # make form input for each table column
-    for column_name, spec in class_.form_spec.items():
-        # build form html for each column
-        # set defaults for validate and value in form specification
-        if 'validate' not in spec:
-            spec['validate'] = ""
-        if 'value' not in spec:
-            spec['value'] = ""
-        if 'placeholder' not in spec:
-            spec['placeholder'] = ""
-
-        input_html_builder = SetFormInputHTML(spec['label'], spec['placeholder'], spec['value'], spec['type'], spec['validate'], form_type, class_, record, column_name)
-        if spec['type'] == 'dropdown': # this is a dropdown <select> element
-            form_str += input_html_builder.set_dropdown_html()
-        elif spec['type'] == 'boolean': # True/False inline radio button
-            form_str += input_html_builder.set_radio_html()
-        elif spec['type'] == 'textarea': # textarea
-            form_str += input_html_builder.set_textarea_html()
-        elif spec['type'] == 'date' or spec['type'] == 'dateISO':
-            form_str += input_html_builder.set_date_html()
-        elif spec['type'] == 'computed':
-            pass # forms do not have an input for computed columns
+    def __init__(self, uid, class_):
+        self.class_ = class_
+        self.options = {} # column name : (options, options html, {value : (start, end, selected option html)})
+        self.parts = {} # form_type : list of str or function(record) that returns str
+        for form_type in ["create", "update"]:
+            parts = []
+            for column_name, spec in class_.form_spec.items():
+                if spec["type"] != "computed": # forms do not have an input for computed columns
+                    builder = SetFormInputHTML(spec["label"], spec.get("placeholder", ""), spec.get("value", ""),
+                        spec["type"], spec.get("validate", ""), form_type, class_, None, column_name, uid)
+                    parts.extend(self._compile_input(builder))
+                parts.append('</div> </div>')
+            self.parts[form_type] = self._join_str_parts(parts)
+
+    def _compile_input(self, builder):
+        """ Get the parts of one form input : str (same for every record) or function(record) """
+        col_name = builder.column_name
+        update = builder.form_type == "update"
+        if builder.type == "dropdown":
+            def options_html(record):
+                return self.get_options_html(builder, getattr(record, col_name) if update else None)
+            return [builder.set_dropdown_head_html(), options_html, "</select>"]
+
+        if not update: # create form has no record values
+            return [self._build_input(builder)]
+
+        if builder.type == "boolean":
+            builder.record = SimpleNamespace(**{col_name: True})
+            true_html = builder.set_radio_html()
+            builder.record = SimpleNamespace(**{col_name: False})
+            false_html = builder.set_radio_html()
+            return [lambda record: true_html if getattr(record, col_name) else false_html]
+
+        builder.record = SimpleNamespace(**{col_name: "{value}"})
+        if builder.type == "lookup":
+            template = compile_html_template(builder.set_lookup_html(display="{display}"), "value", "display")
+            def lookup_html(record):
+                selected_id = getattr(record, col_name)
+                return template % ("" if selected_id is None else selected_id, builder.get_lookup_display(selected_id))
+            return [lookup_html]
+
+        template = compile_html_template(self._build_input(builder), "value")
+        return [lambda record: template % (getattr(record, col_name),)]
+
+    @staticmethod
+    def _build_input(builder):
+        if builder.type == "boolean": # True/False inline radio button
+            return builder.set_radio_html()
+        elif builder.type == "lookup": # search box, options from /scrud/lookup
+            return builder.set_lookup_html()
+        elif builder.type == "textarea":
+            return builder.set_textarea_html()
+        elif builder.type == "date" or builder.type == "dateISO":
+            return builder.set_date_html()
         else: # Other standard html <input> types
-            form_str += input_html_builder.set_input_html()
-        form_str += '</div> </div>'
-    return form_str, modal_title
+            return builder.set_input_html()
+
+    @staticmethod
+    def _join_str_parts(parts):
+        """ Join the adjacent str parts """
+        joined = []
+        for part in parts:
+            if isinstance(part, str) and joined and isinstance(joined[-1], str):
+                joined[-1] += part
+            else:
+                joined.append(part)
+        return joined
+
+    def get_options_html(self, builder, selected_id):
+        """ Get the <option> html of a dropdown with the selected_id option selected """
+        options = builder.get_dropdown_options()
+        compiled = self.options.get(builder.column_name)
+        if compiled is None or compiled[0] is not options: # related table changed
+            html = ""
+            selected = {}
+            for value, display_str in [(None, f"Select {builder.label}...")] + list(options):
+                option_html = set_option_html(value, display_str)
+                selected[value] = (len(html), len(html) + len(option_html), set_option_html(value, display_str, True))
+                html += option_html
+            compiled = (options, html, selected)
+            self.options[builder.column_name] = compiled
+        options, html, selected = compiled
+        if selected_id in selected:
+            start, end, option_html = selected[selected_id]
+            return html[:start] + option_html + html[end:]
+        return html
+
+    def render(self, record, form_type):
+        """ Fill in the form html
+
+        Parameters
+        ----------
+        record : sqlalchemy query
+            values from one row of database table will be shown as values in form input fields (pre-fill current values in update form)
+        form_type : str
+            'update' or 'create' : type of modal to display
+
+        Returns
+        -------
+        form_str : str
+            string of html code that defines the form modal
+        modal_title : str
+            title displayed in modal
+        """
+        if form_type == 'update': # show selected row values in form
+            modal_title = 'Update record'
+        else:
+            form_type = 'create'
+            modal_title = 'Create record'
+        form_str = "".join([part if isinstance(part, str) else part(record) for part in self.parts[form_type]])
+        return form_str, modal_title
@@ -0,0 +1,290 @@
+""" Streaming import of a csv or jsonl file into one table (see import_file in views.py).
+
+The file is read one record at a time and processed in batches, so memory does not grow with the size of the file:
+
+    1. The file columns are mapped to model columns through form_spec.  A column is named by the model column name (values are stored as is) or by the form_spec label.  The primary key and the many side relationship count columns of an export (see exports.py) are skipped, so the records get new ids.  The values of a dropdown or lookup column named by its label are the display values of the related records (ie the company name for the Employee "Employer" column) and are looked up to get the ids.
+    2. Each record is validated with the model's WTForms class and set_computed_columns() is called on it (see bulk.py).
+    3. The valid records of a batch are inserted with bulk_insert_mappings() and committed.  If the batch breaks a database constraint or has a value the column type rejects, its records are inserted one at a time so only the bad records are rejected.
+
+Records that fail are counted and the first MAX_ERRORS are kept with their row number (the first record in the file is row 0) and errors.
+"""
+import csv
+import itertools
+from collections import OrderedDict
+
+from flask import current_app, json
+from sqlalchemy.exc import StatementError
+from sqlalchemy.inspection import inspect
+
+from app import db, ManySideRelationship
+from .bulk import MAX_ERRORS, get_form_class, get_column_names, validate_record, map_record, iter_text_lines
+from .caches import mark_bulk_write
+from .helpers import get_related_class
+
+IMPORT_FORMATS = ["csv", "jsonl"]
+
+def get_import_format(filename, fmt=None):
+    """ Get the import format from the request format parameter or the file extension """
+    if not fmt:
+        fmt = filename.rsplit(".", 1)[-1].lower() if filename and "." in filename else "csv"
+        fmt = {"json": "jsonl", "ndjson": "jsonl"}.get(fmt, fmt)
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Import format must be one of {IMPORT_FORMATS}")
+    return fmt
+
+def iter_file_records(stream, fmt):
+    """ Generator of the records of a csv file with a header row (dicts) or a jsonl file (one json value per line, map_records() rejects the values that are not objects) """
+    lines = iter_text_lines(stream)
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+    else:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+def chunked(iterable, size):
+    """ Generator of lists of up to size items """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+class ForeignKeyResolver:
+    """ Looks up the id of a related record from its display value (ie company name -> company_id).
+
+    If the related class has one display column, the values of each batch that are not cached are looked up with one IN () query and up to max_size values are kept (least recently used are dropped).  Otherwise the display values are __str__() or several columns, so every related record is read once.  If two related records have the same display value, one of them is used.
+
+    Parameters
+    ----------
+    class_ : sqlalchemy class
+        table that is imported
+    column_name : str
+        foreign key column (ie company_id)
+    max_size : int
+        display values kept
+    """
+    def __init__(self, class_, column_name, max_size=10000):
+        related_class = get_related_class(getattr(class_, column_name), current_app.tc.modules)
+        self.related_class = related_class
+        self.tablename = related_class.__table__.name
+        self.pk = getattr(related_class, inspect(related_class).primary_key[0].name)
+        display_columns = related_class.display_columns
+        self.column = getattr(related_class, display_columns[0]) if display_columns and len(display_columns) == 1 else None
+        self.max_size = max_size
+        self.ids = OrderedDict() # display value : id or None if not found
+        self.complete = False # every related record is in ids
+
+    def load(self, values):
+        """ Look up the display values that are not cached """
+        if self.complete:
+            return
+        if self.column is None:
+            self._load_all()
+            return
+        missing = list({v for v in values if v not in self.ids})
+        for start in range(0, len(missing), 500):
+            part = missing[start:start + 500]
+            found = dict(db.session.query(self.column, self.pk).filter(self.column.in_(part)))
+            for value in part:
+                self.ids[value] = found.get(value)
+        while len(self.ids) > self.max_size:
+            self.ids.popitem(last=False)
+
+    def _load_all(self):
+        display_columns = self.related_class.display_columns
+        if display_columns is None:
+            for r in db.session.query(self.related_class):
+                self.ids[r.__str__()] = getattr(r, self.pk.key)
+        else:
+            columns = [getattr(self.related_class, col) for col in display_columns]
+            for r in db.session.query(self.pk, *columns):
+                self.ids[" ".join(str(v) for v in r[1:])] = r[0]
+        self.complete = True
+
+    def get(self, value):
+        if value in self.ids:
+            self.ids.move_to_end(value)
+        return self.ids.get(value)
+
+class ImportColumns:
+    """ Maps the columns of an import file to model columns through form_spec.
+
+    Parameters
+    ----------
+    class_ : sqlalchemy class
+        table that is imported
+    """
+    def __init__(self, class_):
+        self.class_ = class_
+        self.columns = get_column_names(class_)
+        self.labels = {spec["label"].strip().lower(): name for name, spec in class_.form_spec.items()}
+        # exported columns that are not imported
+        self.skipped = {key.name for key in inspect(class_).primary_key}
+        self.skipped.update(name for name in getattr(class_, "dt_column_spec", {})
+                            if isinstance(getattr(class_, name, None), ManySideRelationship))
+        self.resolvers = {} # column name : ForeignKeyResolver
+        self.map = {} # file column : (column name, resolver or None) or None if not a column
+
+    def get(self, key):
+        """ Get (model column name, ForeignKeyResolver or None) for a file column, None if it is not a column """
+        if key is None: # the extra fields of a csv row that is longer than the header
+            return None
+        if key not in self.map:
+            name = key.strip()
+            if name in self.columns:
+                self.map[key] = (name, None)
+            elif name.lower() in self.labels:
+                name = self.labels[name.lower()]
+                resolver = None
+                if self.class_.form_spec[name]["type"] in ("dropdown", "lookup"):
+                    resolver = self.resolvers.setdefault(name, ForeignKeyResolver(self.class_, name))
+                self.map[key] = (name, resolver)
+            else:
+                self.map[key] = None
+        return self.map[key]
+
+    def check_header(self, header):
+        unknown = [key for key in header if key is not None and key.strip() not in self.skipped and self.get(key) is None]
+        if unknown:
+            raise ValueError(f"Not a column of {self.class_.__table__.name} : {', '.join(unknown)}")
+
+    def map_records(self, records):
+        """ Map a batch of file records to model column values.
+
+        Returns
+        -------
+        list of (values, errors) : one for each record
+            values : dict of column name : value
+            errors : dict of column name : [messages], {} if the record mapped
+        """
+        # look up the display values of the batch together
+        lookups = {}
+        for r in records:
+            if not isinstance(r, dict):
+                continue
+            for key, value in r.items():
+                column = self.get(key)
+                if column is not None and column[1] is not None and value not in (None, "") and is_single_value(value):
+                    lookups.setdefault(column[1], set()).add(value)
+        for resolver, values in lookups.items():
+            resolver.load(values)
+
+        mapped = []
+        for r in records:
+            values = {}
+            errors = {}
+            if not isinstance(r, dict):
+                mapped.append((values, {"row": ["Not a json object"]}))
+                continue
+            for key, value in r.items():
+                if key is None:
+                    errors["row"] = ["More fields than the header"]
+                    continue
+                if key.strip() in self.skipped:
+                    continue
+                column = self.get(key)
+                if column is None:
+                    errors[key] = ["Not a column"]
+                    continue
+                name, resolver = column
+                if not is_single_value(value):
+                    errors[name] = ["Not a single value"]
+                    continue
+                if resolver is not None and value not in (None, ""):
+                    id = resolver.get(value)
+                    if id is None:
+                        errors[name] = [f"No {resolver.tablename} with display value '{value}'"]
+                        continue
+                    value = id
+                values[name] = value
+            mapped.append((values, errors))
+        return mapped
+
+def is_single_value(value):
+    """ False for the json arrays and objects of a jsonl record """
+    return not isinstance(value, (list, dict))
+
+def import_records(class_, stream, fmt="csv", batch_size=1000):
+    """ Import a csv or jsonl file into the table of class_.
+
+    Parameters
+    ----------
+    class_ : sqlalchemy class
+    stream : binary file object
+    fmt : str
+        "csv" or "jsonl"
+    batch_size : int
+        records validated and inserted together
+
+    Yields
+    ------
+    status : dict
+        after each batch (and once for an empty file).  The same dict is updated and yielded each time.
+        rows : records read
+        inserted : records inserted
+        error_count : records not inserted
+        errors : [{"row", "errors"}] the first MAX_ERRORS records not inserted
+    """
+    form_class = get_form_class(class_)
+    columns = get_column_names(class_)
+    import_columns = ImportColumns(class_)
+    status = {"rows": 0, "inserted": 0, "error_count": 0, "errors": []}
+
+    def add_error(row, errors):
+        status["error_count"] += 1
+        if len(status["errors"]) < MAX_ERRORS:
+            status["errors"].append({"row": row, "errors": errors})
+
+    records = iter_file_records(stream, fmt)
+    try:
+        for chunk in chunked(records, batch_size):
+            if fmt == "csv" and status["rows"] == 0:
+                import_columns.check_header(chunk[0].keys())
+            mappings = []
+            rows = []
+            for row, (values, errors) in enumerate(import_columns.map_records(chunk), status["rows"]):
+                if not errors:
+                    errors = validate_record(form_class, values)
+                if not errors:
+                    mapping, errors = map_record(class_, values, columns)
+                if errors:
+                    add_error(row, errors)
+                    continue
+                mappings.append(mapping)
+                rows.append(row)
+            status["inserted"] += insert_batch(class_, mappings, rows, add_error)
+            status["rows"] += len(chunk)
+            yield status
+        if status["rows"] == 0:
+            yield status
+    finally:
+        db.session.close()
+
+def insert_batch(class_, mappings, rows, add_error):
+    """ Insert and commit a batch of records.  Returns the number of records inserted.
+
+    If the batch breaks a constraint (ie a duplicate of a unique column) or has a value the column type rejects, the records are inserted one at a time and the ones that fail are passed to add_error(row, errors).
+    """
+    if not mappings:
+        return 0
+    try:
+        db.session.bulk_insert_mappings(class_, mappings)
+        mark_bulk_write(db.session, class_.__table__.name, inserted=len(mappings))
+        db.session.commit()
+        return len(mappings)
+    except StatementError:
+        db.session.rollback()
+
+    inserted = 0
+    for mapping, row in zip(mappings, rows):
+        try:
+            db.session.bulk_insert_mappings(class_, [mapping])
+            mark_bulk_write(db.session, class_.__table__.name, inserted=1)
+            db.session.commit()
+            inserted += 1
+        except StatementError as ex:
+            db.session.rollback()
+            add_error(row, {"database": [str(ex.orig)]})
+    return inserted
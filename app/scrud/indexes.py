@@ -0,0 +1,138 @@
+from collections import OrderedDict
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
+from alembic.script import ScriptDirectory
+from alembic.util import rev_id
+
+from app import db
+
+def get_indexed_columns(engine, tablename):
+    """ Get the columns of a database table that can be searched with an index.
+
+    A column is indexed if it is the first column of the primary key, an index or a unique constraint (sqlite creates an index for each unique constraint).
+
+    Returns
+    -------
+    indexed : set of column names
+    """
+    insp = inspect(engine)
+    indexed = set(insp.get_pk_constraint(tablename)["constrained_columns"][:1])
+    for ix in insp.get_indexes(tablename) + insp.get_unique_constraints(tablename):
+        if ix["column_names"]:
+            indexed.add(ix["column_names"][0])
+    return indexed
+
+def get_index_advice(tc):
+    """ List the order, link filter and join columns of every table in TableConfig that do not have an index.
+
+    Parameters
+    ----------
+    tc : TableConfig instance
+
+    Returns
+    -------
+    advice : list of dicts
+        {
+            "database": database name,
+            "bind": bind key,
+            "tablename": table name,
+            "column": column name,
+            "reasons": list of str, why the column is used in queries
+        }
+
+    Notes
+    -----
+    Order columns are the "order" columns in dt_column_spec.  They are used by ORDER BY for every draw and by keyset pagination.  Foreign key columns are used to filter the child table when a link is followed, to join the related table and to count the many side of a relationship.
+    """
+    advice = []
+    for t in tc.get_sqlalchemy_table_stmts():
+        class_ = t["class_"]
+        table = class_.__table__
+        wanted = OrderedDict() # column name : reasons
+        for col, spec in class_.dt_column_spec.items():
+            if "order" in spec and col in table.columns:
+                wanted.setdefault(col, []).append(f"table order ({spec['order']})")
+        for c in table.columns:
+            if c.foreign_keys:
+                related = next(iter(c.foreign_keys)).column.table.name
+                wanted.setdefault(c.name, []).append(f"link filter and join on {related}")
+
+        engine = db.get_engine(bind=class_.__bind_key__)
+        indexed = get_indexed_columns(engine, table.name)
+        for col, reasons in wanted.items():
+            if col not in indexed:
+                advice.append({
+                    "database": t["database"],
+                    "bind": class_.__bind_key__,
+                    "tablename": table.name,
+                    "column": col,
+                    "reasons": reasons
+                })
+    return advice
+
+def write_index_migration(advice, directory="migrations"):
+    """ Write an Alembic migration that creates an index for each column in advice.
+
+    The migration uses the multiple database template in migrations/script.py.mako, so each index is created in the upgrade function of its bind.  Apply it with "flask db upgrade".
+
+    Parameters
+    ----------
+    advice : list of dicts from get_index_advice()
+    directory : str
+        Flask-Migrate migration directory
+
+    Returns
+    -------
+    path : str
+        path of the new migration file
+    """
+    upgrades = OrderedDict()
+    downgrades = OrderedDict()
+    for a in advice:
+        engine_name = a["bind"] or "" # alembic engine name of the default bind is ""
+        name = f"ix_{a['tablename']}_{a['column']}"
+        upgrades.setdefault(engine_name, []).append(
+            f"op.create_index('{name}', '{a['tablename']}', ['{a['column']}'], unique=False)")
+        downgrades.setdefault(engine_name, []).insert(0,
+            f"op.drop_index('{name}', table_name='{a['tablename']}')")
+
+    kw = {}
+    for engine_name in upgrades:
+        kw[f"{engine_name}_upgrades"] = "\n    ".join(upgrades[engine_name])
+        kw[f"{engine_name}_downgrades"] = "\n    ".join(downgrades[engine_name])
+
+    config = current_app.extensions["migrate"].migrate.get_config(directory)
+    script = ScriptDirectory.from_config(config)
+    revision = script.generate_revision(rev_id(), "add scrud order and link column indexes", head="head", **kw)
+    return revision.path
+
+def log_index_advice(tc):
+    """ Log a warning for each column without an index (SCRUD_INDEX_ADVISOR = True in config.py) """
+    for a in get_index_advice(tc):
+        current_app.logger.warning("PAB> %s.%s (%s) has no index. Used for %s. Run 'flask scrud indexes --migration' to add it.",
+            a["tablename"], a["column"], a["database"], ", ".join(a["reasons"]))
+
+@click.group("scrud")
+def scrud_cli():
+    """ SCRUD blueprint commands """
+
+@scrud_cli.command("indexes")
+@click.option("--migration", is_flag=True, help="write an Alembic migration that creates the missing indexes")
+@click.option("-d", "--directory", default="migrations", help="migration directory (default is 'migrations')")
+@with_appcontext
+def indexes_command(migration, directory):
+    """ Report order, link filter and join columns that do not have an index. """
+    from .controllers import TableConfig
+    advice = get_index_advice(TableConfig())
+    if not advice:
+        click.echo("All order, link filter and join columns are indexed.")
+        return
+    for a in advice:
+        click.echo(f"{a['database']}  {a['tablename']}.{a['column']} : {', '.join(a['reasons'])}")
+    if migration:
+        path = write_index_migration(advice, directory)
+        click.echo(f"Wrote {path}")
+        click.echo("Add index=True to the model columns so that autogenerate keeps the indexes, then run 'flask db upgrade'.")
@@ -0,0 +1,268 @@
+""" Background jobs for the scrud operations that can take longer than a request : imports, exports, recomputing the computed columns of a table and large bulk deletes.
+
+A job is submitted by a request (see submit_job in views.py), which returns at once with the job id.  scrud.js then polls the job status until it is done.
+
+Jobs run in a thread pool of SCRUD_JOB_WORKERS threads in the process that received the submit.  Each job runs in its own app context, so it has its own db session.  I use threads rather than processes since the jobs are mostly database and file I/O, and a thread shares the TableConfig and caches of the app, so the cache updates at commit (see caches.py) reach the tables the users see.
+
+The job table is a sqlite file (SCRUD_JOB_PATH) that is not one of the SCRUD binds.  It is shared by the worker processes on one host, so any worker can answer a status request.  Uploaded import files and finished exports are kept in SCRUD_JOB_DIR.  Finished jobs and the files are deleted after SCRUD_JOB_MAX_AGE seconds.
+
+Job status : queued -> running -> done or failed.  Jobs left queued or running by a process that stopped are marked failed when the next JobQueue starts.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from .bulk import bulk_delete, recompute_columns
+from .controllers import get_connection, get_record_counts
+from .exports import EXPORTERS, get_export_query
+from .imports import import_records
+
+class JobStore:
+    """ Job table in a sqlite file.
+
+    Parameters
+    ----------
+    path : str
+        sqlite file
+    """
+    COLUMNS = ["id", "kind", "uid", "params", "status", "progress", "result", "error", "pid",
+               "submitted", "started", "finished", "pid_start"]
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local() # one sqlite connection per thread
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS job (id TEXT PRIMARY KEY, kind TEXT, uid INTEGER, params TEXT, "
+                         "status TEXT, progress TEXT, result TEXT, error TEXT, pid INTEGER, "
+                         "submitted REAL, started REAL, finished REAL, pid_start TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_job_submitted ON job (submitted)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode = WAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, kind, uid, params):
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("INSERT INTO job (id, kind, uid, params, status, progress, pid, pid_start, submitted) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (job_id, kind, uid, json.dumps(params), "queued", json.dumps({}), os.getpid(), get_process_start(os.getpid()), time.time()))
+        return job_id
+
+    def update(self, job_id, **values):
+        """ Set columns of a job.  progress and result are json encoded. """
+        for k in ("progress", "result"):
+            if k in values:
+                values[k] = json.dumps(values[k], default=str)
+        assignments = ", ".join(f"{k} = ?" for k in values)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE job SET {assignments} WHERE id = ?", list(values.values()) + [job_id])
+
+    def get(self, job_id):
+        row = self._connect().execute("SELECT * FROM job WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else self._to_dict(row)
+
+    def list(self, limit=50):
+        """ Get the most recently submitted jobs """
+        rows = self._connect().execute("SELECT * FROM job ORDER BY submitted DESC LIMIT ?", (limit,))
+        return [self._to_dict(row) for row in rows]
+
+    def _to_dict(self, row):
+        job = dict(zip(self.COLUMNS, row))
+        for k in ("params", "progress", "result"):
+            job[k] = json.loads(job[k]) if job[k] is not None else None
+        return job
+
+    def fail_interrupted(self):
+        """ Mark the unfinished jobs of processes that are not running any more as failed """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, pid, pid_start FROM job WHERE status IN ('queued', 'running')").fetchall()
+            for job_id, pid, pid_start in rows:
+                if not process_running(pid, pid_start):
+                    conn.execute("UPDATE job SET status = 'failed', error = ?, finished = ? WHERE id = ?",
+                                 ("interrupted, the process running the job stopped", time.time(), job_id))
+
+    def delete_before(self, submitted):
+        """ Delete the finished jobs submitted before this time """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM job WHERE submitted < ? AND status IN ('done', 'failed')", (submitted,))
+
+def pid_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError: # running, owned by another user
+        pass
+    return True
+
+def get_process_start(pid):
+    """ Start time of a process in clock ticks since boot, None if it is not known (no /proc, ie not linux) """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # field 22, counted after the command name (field 2) which is in parentheses and may hold spaces
+    return stat[stat.rindex(")") + 2:].split()[19]
+
+def process_running(pid, pid_start):
+    """ Check that the process that submitted a job is running.  A pid is reused by a new process after a restart, so the start time is compared too when it is known. """
+    if not pid_running(pid):
+        return False
+    return pid_start is None or get_process_start(pid) in (None, pid_start)
+
+class Job:
+    """ Passed to the job functions to report progress and to name the job's files.
+
+    Parameters
+    ----------
+    queue : JobQueue
+    job_id : str
+    """
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+
+    def progress(self, done, total=None, **info):
+        """ Save the progress of the job.  percent is set if total is known. """
+        progress = dict(info, done=done, total=total)
+        if total:
+            progress["percent"] = round(100 * done / total, 1)
+        self.queue.store.update(self.id, progress=progress)
+
+    def path(self, suffix):
+        return get_job_file(self.queue.job_dir, self.id, suffix)
+
+def get_job_file(job_dir, job_id, suffix):
+    """ Path of a file written by a job (ie the file of an export job) """
+    return os.path.join(job_dir, f"{job_id}.{suffix}")
+
+class JobQueue:
+    """ Thread pool that runs the jobs of this process.
+
+    Parameters
+    ----------
+    app : Flask app
+    store : JobStore
+    job_dir : str
+        directory of the uploaded and exported files
+    workers : int
+        jobs run at the same time, the others wait in the queue
+    max_age : int
+        seconds a finished job and its files are kept
+    """
+    def __init__(self, app, store, job_dir, workers=2, max_age=24 * 3600):
+        self.app = app
+        self.store = store
+        self.job_dir = job_dir
+        self.max_age = max_age
+        os.makedirs(job_dir, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scrud_job")
+        store.fail_interrupted()
+        self.purge()
+
+    def submit(self, kind, uid, params):
+        """ Queue a job.  Returns the job dict (see JobStore). """
+        if kind not in JOBS:
+            raise ValueError(f"Job kind must be one of {list(JOBS)}")
+        self.purge()
+        job_id = self.store.create(kind, uid, params)
+        self.executor.submit(self._run, job_id, kind, uid, params)
+        return self.store.get(job_id)
+
+    def upload_path(self):
+        """ Path for a file uploaded with a job submit """
+        return os.path.join(self.job_dir, f"upload_{uuid.uuid4().hex}")
+
+    def _run(self, job_id, kind, uid, params):
+        with self.app.app_context():
+            self.store.update(job_id, status="running", started=time.time())
+            try:
+                class_ = current_app.tc.get_dt_tables_config()[uid]["class_"]
+                result = JOBS[kind](Job(self, job_id), class_, **params)
+                self.store.update(job_id, status="done", result=result, finished=time.time())
+            except ValueError as ex: # bad file, format or ids
+                current_app.logger.warning(f"PAB> {kind} job {job_id} failed : {ex}")
+                self.store.update(job_id, status="failed", error=str(ex), finished=time.time())
+            except Exception as ex:
+                current_app.logger.exception(f"PAB> {kind} job {job_id} failed")
+                self.store.update(job_id, status="failed", error=str(ex), finished=time.time())
+
+    def purge(self):
+        """ Delete the old jobs and files (including the uploads of interrupted imports) """
+        before = time.time() - self.max_age
+        self.store.delete_before(before)
+        for name in os.listdir(self.job_dir):
+            path = os.path.join(self.job_dir, name)
+            try:
+                if os.path.getmtime(path) < before:
+                    os.remove(path)
+            except FileNotFoundError: # removed by the purge of another worker process
+                pass
+
+def create_job_queue(app):
+    """ Create the JobQueue set by SCRUD_JOB_* in config.py """
+    return JobQueue(app, JobStore(app.config["SCRUD_JOB_PATH"]), app.config["SCRUD_JOB_DIR"],
+        app.config["SCRUD_JOB_WORKERS"], app.config["SCRUD_JOB_MAX_AGE"])
+
+# job functions : job(Job, class_, **params) returns the job result (json types)
+
+def import_job(job, class_, path, fmt, batch_size):
+    """ Import the uploaded file at path (see imports.py) """
+    size = os.path.getsize(path)
+    status = {}
+    try:
+        with open(path, "rb") as f:
+            for status in import_records(class_, f, fmt, batch_size):
+                job.progress(f.tell(), size, rows=status["rows"],
+                    inserted=status["inserted"], error_count=status["error_count"])
+    finally:
+        os.remove(path)
+    return dict(status, message=f"{status['inserted']} of {status['rows']} records imported, {status['error_count']} errors")
+
+def export_job(job, class_, fmt, dt_request, batch_size):
+    """ Export a table view to a file in the job directory (see exports.py).  The file is downloaded from /scrud/jobs/<id>/file. """
+    query = get_export_query(dt_request)
+    with get_connection(query) as conn:
+        total = get_record_counts(conn, query)[1]
+    rows = 0
+    def progress(done):
+        nonlocal rows
+        rows = done
+        job.progress(done, total) # total was counted before the export, rows may be added meanwhile
+
+    path = job.path(fmt)
+    # the file is written under a temporary name, so a download can't get a partial file
+    with open(path + ".part", "wb") as f:
+        for chunk in EXPORTERS[fmt](query, batch_size, progress=progress):
+            f.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+    os.replace(path + ".part", path)
+    return {"rows": rows, "size": os.path.getsize(path), "filename": f"{query['t']['tablename']}.{fmt}",
+            "message": f"{rows} rows exported"}
+
+def recompute_job(job, class_):
+    """ Recompute the computed columns of every row (see recompute_columns() in bulk.py) """
+    count = recompute_columns(class_, progress=job.progress)
+    return {"rows": count, "message": f"computed columns of {count} rows recomputed"}
+
+def bulk_delete_job(job, class_, ids):
+    """ Delete the rows with these ids in one transaction (see bulk_delete() in bulk.py) """
+    count = bulk_delete(class_, ids, progress=job.progress)
+    return {"count": count, "message": f"{count} records deleted"}
+
+JOBS = {
+    "import": import_job,
+    "export": export_job,
+    "recompute": recompute_job,
+    "bulk_delete": bulk_delete_job
+}
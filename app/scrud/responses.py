@@ -0,0 +1,121 @@
+""" ETag validation and compression of the scrud blueprint responses.
+
+get_data and init_table responses carry a weak ETag.  scrud.js sends it back in If-None-Match and gets a 304 with no body if the table has not changed (see TableVersions in caches.py).  The requests are POSTs, so the browser does not do this by itself; scrud.js keeps the last response of each table and reuses it on a 304.
+
+Responses are compressed with brotli (if the brotli package is installed and the browser accepts br) or gzip.  Streamed responses are compressed as they are streamed.
+"""
+import gzip
+import hashlib
+import zlib
+
+from flask import current_app, request, Response
+
+from .caches import get_request_digest
+
+try:
+    import brotli
+except ImportError: # optional dependency
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/html", "text/css", "application/javascript"}
+
+def get_data_etag(uid, dt_request):
+    """ Get the ETag of a get_data request.
+
+    The ETag is the version tag of the table (TableVersions) and a hash of the request parameters, except draw which changes with every request.
+
+    Parameters
+    ----------
+    uid : int
+        uid of the table to display
+    dt_request : dict
+        get_data request json
+    """
+    return f"{current_app.table_versions.get_tag(uid)}.{get_request_digest(dt_request)}"
+
+def get_content_etag(body):
+    """ ETag of a response body that only changes when the app is restarted (ie init_table) """
+    return hashlib.sha1(body.encode("utf-8")).hexdigest()[:16]
+
+def not_modified(etag):
+    """ True if the request If-None-Match header matches etag """
+    return request.if_none_match.contains_weak(etag)
+
+def not_modified_response(etag):
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+def json_response(body, etag=None):
+    """ Build the response for a json str (or a generator of json strs when streaming).
+
+    Parameters
+    ----------
+    body : str or generator of str
+    etag : str
+        sent as a weak ETag if not None
+    """
+    response = Response(body, mimetype="application/json")
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    return response
+
+def get_encoding():
+    """ Get the best content encoding accepted by the request ("br", "gzip" or None) """
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return None
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=current_app.config["SCRUD_BROTLI_QUALITY"])
+    return gzip.compress(data, compresslevel=current_app.config["SCRUD_GZIP_LEVEL"])
+
+def compress_stream(chunks, encoding, brotli_quality, gzip_level):
+    """ Generator that compresses the chunks of a streamed response. """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=brotli_quality)
+        compress_chunk, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31) # 31 = gzip header
+        compress_chunk, finish = compressor.compress, compressor.flush
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compress_chunk(chunk)
+            if data: # the compressor buffers small chunks
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+def compress_response(response):
+    """ Compress a blueprint response if the browser accepts it (see SCRUD_COMPRESSION in config.py).
+
+    Registered with bp.after_request.  Small responses, static files and responses that are already encoded are not compressed.
+    """
+    if not current_app.config["SCRUD_COMPRESSION"] or response.status_code != 200 \
+        or response.direct_passthrough or "Content-Encoding" in response.headers \
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    encoding = get_encoding()
+    response.vary.add("Accept-Encoding")
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding,
+            current_app.config["SCRUD_BROTLI_QUALITY"], current_app.config["SCRUD_GZIP_LEVEL"])
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config["SCRUD_COMPRESS_MIN_SIZE"]:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
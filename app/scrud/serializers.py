@@ -0,0 +1,70 @@
+""" JSON serialization for the scrud blueprint.
+
+dumps() uses orjson when it is installed (pip install orjson) and falls back to flask.json.  Column values that are not json types (dates, times, Decimal) are converted by an encoder that TableConfig picks once for each column from the model column type (see get_column_encoder() and encode_records()), so serialization does not fall back to a python default() call for every cell.
+"""
+import datetime as dt
+
+from flask import json
+from sqlalchemy import types
+
+try:
+    import orjson
+except ImportError: # optional dependency
+    orjson = None
+
+def dumps(obj):
+    """ Serialize obj to a json str.
+
+    Values without an encoder are converted with str(), same as json.dumps(obj, default=str).
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode("utf-8")
+    return json.dumps(obj, default=str)
+
+def _encode_datetime(value):
+    return value.isoformat(" ") # same format as str(value)
+
+def get_column_encoder(column_type):
+    """ Get the function that converts a column value to a json type.
+
+    Parameters
+    ----------
+    column_type : sqlalchemy type instance
+        type of the model column (ie Post.created_at.type)
+
+    Returns
+    -------
+    encoder : function or None
+        None if values of this type are already json types (int, float, str, bool)
+
+    Notes
+    -----
+    The encoded values are the same as str(value), so the json sent to scrud.js does not depend on the serializer backend.
+    """
+    if isinstance(column_type, types.DateTime):
+        return _encode_datetime
+    elif isinstance(column_type, types.Date):
+        return dt.date.isoformat
+    elif isinstance(column_type, types.Time):
+        return dt.time.isoformat
+    elif isinstance(column_type, types.Numeric):
+        return str if column_type.asdecimal else None
+    elif isinstance(column_type, (types.Integer, types.String, types.Boolean, types.Float, types.NullType)):
+        return None
+    return str
+
+def encode_records(records, encoders):
+    """ Convert the non json values of each record in place.
+
+    Parameters
+    ----------
+    records : list of dicts
+    encoders : list of (col_name, encoder) from TableConfig
+    """
+    if not encoders:
+        return
+    for r in records:
+        for col_name, encoder in encoders:
+            value = r[col_name]
+            if value is not None:
+                r[col_name] = encoder(value)
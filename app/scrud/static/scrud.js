@@ -1,5 +1,38 @@
 'use strict'
 
+// keyset pagination cursor returned with the last page of each table
+// key = html table element id
+var table_cursors = {};
+
+// link parameters {p_uid, row_id, fk_id, fk} of the table shown in each html table element
+// They are sent with every init_table and get_data request, so the server keeps no link state.
+// key = html table element id
+var table_links = {};
+
+// last get_data response {etag, json} of each table, reused when the server answers 304 Not Modified
+// key = html table element id
+var table_responses = {};
+
+// promise of the table configs of all tables {version, tables}, loaded once per page
+// table_configs_url is set in index.html
+var table_configs;
+
+function get_table_configs() {
+    // The url has the version of the configs in it, so the browser caches the response until a model changes
+    if (table_configs === undefined) {
+        table_configs = $.ajax({
+            url:      table_configs_url,
+            type:     'get',
+            dataType: 'json'
+        });
+        table_configs.fail(function(jqXHR, textStatus) {
+            table_configs = undefined; // try again on the next table
+            show_message('table configs request failed: ' + textStatus, 'error');
+        });
+    }
+    return table_configs;
+}
+
 function update_record(element, create_or_update) {
     // update or create a new record to the db table
     var id;
@@ -71,6 +104,70 @@ function display_form(form_html, modal_title) {
     });
 }
 
+// debounce timer of the lookup input being typed in
+var lookup_timer;
+
+function lookup_search(lookup, page) {
+    /*
+    Search the relationship table of a form lookup input (form_spec "type": "lookup", see set_lookup_html() in html.py) and show a page of matching records under the search box.  Page 0 replaces the list, the next pages are appended with a "more" item.
+    */
+    var request_id = (lookup.data('request_id') || 0) + 1;
+    lookup.data('request_id', request_id);
+    var request = $.ajax({
+        url:      '/scrud/lookup',
+        cache:    false,
+        data:     {
+                    'uid': lookup.data('uid'),
+                    'column': lookup.data('column'),
+                    'q': lookup.find('.lookup_search').val(),
+                    'page': page
+                  },
+        dataType: 'json',
+        type:     'get'
+    });
+    request.done(function(json) {
+        // a newer search was sent while this one was running
+        if (lookup.data('request_id') !== request_id) {
+            return;
+        }
+        if (json.result != 'success') {
+            show_message('lookup failed with message ' + json.message, 'error');
+            return;
+        }
+        var results = lookup.find('.lookup_results');
+        if (page === 0) {
+            results.empty();
+        }
+        results.find('.lookup_more').remove();
+        json.results.forEach(function(option) {
+            var a = $('<a href="#" class="lookup_option"></a>').attr('data-id', option[0]).text(option[1]);
+            results.append($('<li></li>').append(a));
+        });
+        if (json.more) {
+            results.append('<li class="lookup_more"><a href="#" data-page="' + (page + 1) + '">more...</a></li>');
+        }
+        if (page === 0 && json.results.length === 0) {
+            results.append('<li class="disabled"><a href="#">no matches</a></li>');
+        }
+        results.show();
+    });
+    request.fail(function(jqXHR, textStatus) {
+        console.log("PAB> AJAX request failed in lookup search");
+        show_message('lookup request failed: ' + textStatus, 'error');
+    });
+}
+
+function close_lookups() {
+    // hide the lookup results.  A search box with no record selected is cleared, so "required" validation sees it is empty.
+    $('.lookup').each(function() {
+        var lookup = $(this);
+        lookup.find('.lookup_results').hide();
+        if (lookup.find('input[type="hidden"]').val() === '') {
+            lookup.find('.lookup_search').val('');
+        }
+    });
+}
+
 function submit_form(e, id, uid){
     // id : row id
     // uid : table id
@@ -122,29 +219,179 @@ function show_message(message_text, message_type){
     }, 8000);
 }
 
+// Background jobs (see jobs.py) : submit the job, then poll its status until it is done
+function submit_job(kind, params, ajax_options, table){
+    /*
+    Parameters
+    ----------
+    kind : str
+        import, export, recompute or bulk_delete
+    params : object
+        query string parameters (uid, format)
+    ajax_options : object
+        data sent with the submit
+    table : jQuery object
+        DataTables table reloaded when the job is done, null for an export (the file is downloaded)
+    */
+    var request = $.ajax($.extend({
+        url:      '/scrud/jobs/submit/' + kind + '?' + $.param(params),
+        type:     'post',
+        dataType: 'json',
+        cache:    false
+    }, ajax_options));
+    request.done(function(json) {
+        if (json.result == 'success'){
+            show_message(json.message, 'success');
+            poll_job(json.job.id, table);
+        } else {
+            show_message(kind + ' request failed with message ' + json.message, 'error');
+        }
+    });
+    request.fail(function(jqXHR, textStatus) {
+        show_message(kind + ' request failed: ' + textStatus, 'error');
+    });
+}
+
+function poll_job(job_id, table){
+    var request = $.ajax({
+        url:      '/scrud/jobs/' + job_id,
+        dataType: 'json',
+        cache:    false
+    });
+    request.done(function(json) {
+        var job = json.job;
+        if (job === null) {
+            show_message(json.message, 'error');
+        } else if (job.status == 'done') {
+            show_message(job.result.message, 'success');
+            if (job.file_url) {
+                window.location = job.file_url; // download the export
+            } else if (table) {
+                table.DataTable().ajax.reload();
+            }
+        } else if (job.status == 'failed') {
+            show_message(job.kind + ' job failed: ' + job.error, 'error');
+        } else {
+            var progress = job.progress.percent !== undefined ? job.progress.percent + '%' : '';
+            show_message(job.kind + ' ' + job.status + ' ' + progress, 'success');
+            setTimeout(function() {
+                poll_job(job_id, table);
+            }, job_poll_interval);
+        }
+    });
+    request.fail(function(jqXHR, textStatus) {
+        show_message('job status request failed: ' + textStatus, 'error');
+    });
+}
+
 // Hide message
 function hide_message(){
   $('#message').html('').attr('class', '');
   $('#message_container').hide();
 }
 
-function get_datatable(uid, main_table = true) {
+// html of a row's update and delete buttons (same as set_function_icon_html() in html.py)
+function function_icon_html(id, uid) {
+    var temp = '<a data-id=' + id + ' data-uid=' + uid + ' ><span>update</span></a>';
+    return '<div class="function_buttons"><ul class="list-inline">' +
+        '<li class="function_update">' + temp + '</li>' +
+        '<li class="function_delete">' + temp + '</li>' +
+        '</ul></div>';
+}
+
+// html of a link to a child table (same as set_table_link_html() in html.py)
+function table_link_html(uid, row_id, fk_id, fk, link_str) {
+    return '<a id="table_link" data-uid=' + uid + ' data-row_id=' + row_id +
+        ' data-fk_id=' + fk_id + ' data-fk=' + fk + ' href="#">' + link_str + '</a>';
+}
+
+function set_array_columns(d) {
+    /*
+    Map the DataTables columns to the values of array get_data rows (SCRUD_ARRAY_DATA in config.py).
+
+    Parameters
+    ----------
+    d : object
+        init_table response. d.row_columns lists the column name of each row value.  The functions html is appended after the last value.
+    */
+    d.row_index = {}; // column name : row array index
+    d.row_columns.forEach(function(col, i) {
+        d.row_index[col] = i;
+    });
+    d.columns.forEach(function(column) {
+        if (column.data === 'functions') {
+            column.data = d.row_columns.length;
+        } else {
+            column.data = d.row_index[column.data];
+        }
+    });
+}
+
+function set_compact_render(d, uid) {
+    /*
+    Render the function buttons and table links of compact get_data rows (SCRUD_COMPACT_DATA in config.py).  Compact rows have no functions column and a link column has only its value.
+
+    Parameters
+    ----------
+    d : object
+        init_table response. d.links lists the link columns {column, fk, fk_id}.  fk_id is the name of the row value with the linked row id (null for the many side).
+    uid : int
+        unique id of the table
+    */
+    // row values are looked up by index in array rows (see set_array_columns())
+    var key = function(col) {
+        return d.arrays ? d.row_index[col] : col;
+    };
+    var id_key = key('id');
+    d.links.forEach(function(link) {
+        var fk_id_key = key(link.fk_id);
+        d.columns[link.column].render = function(data, type, row) {
+            if (type !== 'display') {
+                return data;
+            }
+            if (link.fk_id === null) { // many side
+                return table_link_html(uid, row[id_key], 'None', link.fk, data);
+            }
+            if (!row[fk_id_key]) { // null foreign key in db
+                return 'None';
+            }
+            return table_link_html(uid, row[id_key], row[fk_id_key], link.fk, data);
+        };
+    });
+    // functions is the last column
+    var functions = d.columns[d.columns.length - 1];
+    functions.data = null;
+    functions.render = function(data, type, row) {
+        return function_icon_html(row[id_key], uid);
+    };
+}
+
+function get_datatable(uid, link, main_table = true) {
+    /*
+    Parameters
+    ----------
+    uid : int
+        unique id of the table to display
+    link : object
+        link parameters {p_uid, row_id, fk_id, fk} of the table to display
+    main_table : bool
+        true if the table is shown in the main tab, false if in the linked tab
+    */
     if (main_table) { // main table selected from navbar menu
         var table_element_id = '#table' + uid; //html table element id
     } else { // related table selected from link in main table row
         var table_element_id = '#l_table' + uid; //html table element id
     }
+    // a reload reads the link from here, so a linked table can show a new link
+    table_links[table_element_id] = link;
 
     if ( ! $.fn.DataTable.isDataTable( table_element_id ) ) {
         // initialize table setup and load data
-        // Get table initialization specs from views.py
-        $.ajax({
-            url:"/scrud/init_table",
-            type:"post",
-            contentType: 'application/json; charset=utf-8', //data sent to server
-            dataType:"json",
-        })
-        .done(function(d) {
+        // Get table initialization specs from views.py (loaded once for all tables)
+        get_table_configs()
+        .done(function(configs) {
+            // copy, the render functions are added to the config of each html table element
+            var d = $.extend(true, {}, configs.tables[uid]);
             // if d.render has item in list not equal to '', then convert the render str into its equivalent dt render function and add as element to column dict.  I could set render as part of the column spec in controllers.py, but I would still need the eval() here. So rather than doing part in controllers.py and part here, I just add render, where defined, to the column dict here.
             // should I be using eval() or is it dangerous in this case?
             var i;
@@ -153,24 +400,56 @@ function get_datatable(uid, main_table = true) {
                     d.columns[i].render = eval(d.render[i])
                 }
             }
+            if (d.arrays) {
+                set_array_columns(d);
+            }
+            if (d.compact) {
+                set_compact_render(d, uid);
+            }
+            // the row id is kept on the <tr> for bulk delete of the selected rows
+            var id_key = d.arrays ? d.row_columns.indexOf('id') : 'id';
 
             $(table_element_id).DataTable( {
-                ajax: {
-                    url:"/scrud/get_data",
-                    type:"post",
-                    data: function(d1) {
-                        return JSON.stringify(d1)
-                    },
-                    dataType:"json", // data type returned from server
-                    contentType: 'application/json; charset=utf-8', //data sent to server
-                    dataSrc: function(json) {
-                        // can modify json returned from server here if needed
-                        return json.data; // json formatted for datatables
-                    } //dataSrc function
+                ajax: function(d1, callback, settings) {
+                    $.extend(d1, table_links[table_element_id]);
+                    d1.compact = d.compact;
+                    d1.arrays = d.arrays;
+                    // server only uses the cursor if it matches this request
+                    d1.cursor = table_cursors[table_element_id];
+                    // server sends 304 (no data) if the table has not changed since the last response
+                    var last = table_responses[table_element_id];
+                    $.ajax({
+                        url:"/scrud/get_data",
+                        type:"post",
+                        data: JSON.stringify(d1),
+                        dataType:"json", // data type returned from server
+                        contentType: 'application/json; charset=utf-8', //data sent to server
+                        headers: last ? {'If-None-Match': last.etag} : {}
+                    })
+                    .done(function(json, textStatus, jqXHR) {
+                        if (jqXHR.status === 304) {
+                            json = $.extend({}, last.json, {draw: d1.draw});
+                        } else {
+                            var etag = jqXHR.getResponseHeader('ETag');
+                            table_responses[table_element_id] = etag ? {etag: etag, json: json} : undefined;
+                        }
+                        table_cursors[table_element_id] = json.cursor;
+                        callback(json); // json formatted for datatables
+                    })
+                    .fail(function(jqXHR, textStatus) {
+                        show_message('get data request failed: ' + textStatus, 'error');
+                    });
                 }, //interior ajax()
                 columns: d.columns,
+                createdRow: function(row, data) {
+                    $(row).attr('data-id', data[id_key]);
+                },
                 order: d.order,
-                render: d.render
+                render: d.render,
+                // server side : only the displayed page is sent by the server
+                serverSide: d.server_side,
+                processing: d.server_side,
+                searchDelay: 400
             } ); //DataTable
         }) //.done
     } else {
@@ -189,6 +468,9 @@ $(document).ready(function(){
     // Hide all table containers in both main and linked tabs
     hide_tables()
 
+    // load the table configs now, so the first table selected only needs its data
+    get_table_configs();
+
     // display table selected from navbar dropdown menu
     $('.dropdown-menu').click(function() {
         event.preventDefault();
@@ -206,21 +488,13 @@ $(document).ready(function(){
         var p_uid = event.target.dataset.uid; // unique id of table (see Tables in views.py)
         var container_id = '#container' + p_uid; // html container element id
         // row_id, fk_id, and fk are not used when table is selected from navbar menu.  They are used when a table is selected from a row link.
-        $.ajax({
-            url:"/scrud/set_link_ids",
-            type:"post",
-            contentType: 'application/json; charset=utf-8', //data sent to server
-            data: JSON.stringify({ // data to server
-                p_uid : p_uid,
-                row_id : null,
-                fk_id : null,
-                fk : null
-            })
-        })
-        .done(function() {
-            var main_table;
-            get_datatable(p_uid, main_table=true);
-        });
+        var link = {
+            p_uid : p_uid,
+            row_id : null,
+            fk_id : null,
+            fk : null
+        };
+        get_datatable(p_uid, link, true);
         $(container_id).show();
         $('a[href="#main_tab"]').tab('show');
     });
@@ -251,22 +525,23 @@ $(document).ready(function(){
         var row_id = $(this).data('row_id'); //parent table row
         var fk_id = $(this).data('fk_id'); //child table row id
         var fk = $(this).data('fk'); //parent table fk attr
+        var link = {
+            p_uid : p_uid,
+            row_id : row_id,
+            fk_id : fk_id,
+            fk : fk
+        };
+        // get the uid of the linked table to select its html element
         $.ajax({
-            url:"/scrud/set_link_ids",
+            url:"/scrud/get_link_uid",
             type:"post",
             contentType: 'application/json; charset=utf-8', //data sent to server
-            data: JSON.stringify({ // data to server
-                p_uid : p_uid,
-                row_id : row_id,
-                fk_id : fk_id,
-                fk : fk
-            }),
+            data: JSON.stringify(link),
             dataType:"json", // data type returned from server
         })
         .done(function(json) {
-            var main_table;
             var c_uid = json.c_uid;
-            get_datatable(c_uid, main_table=false);
+            get_datatable(c_uid, link, false);
             //show table container
             $('#l_container' + c_uid).show();
             $('a[href="#linked_tab"]').tab('show');
@@ -288,6 +563,42 @@ $(document).ready(function(){
       update_record(this, 'update');
     });
 
+    // form lookup inputs : search as the user types
+    $(document).on('input', '.lookup_search', function() {
+        var lookup = $(this).closest('.lookup');
+        // the typed text is not a selection until an option is clicked
+        lookup.find('input[type="hidden"]').val('');
+        window.clearTimeout(lookup_timer);
+        lookup_timer = setTimeout(function() {
+            lookup_search(lookup, 0);
+        }, 250);
+    });
+
+    $(document).on('focus', '.lookup_search', function() {
+        lookup_search($(this).closest('.lookup'), 0);
+    });
+
+    $(document).on('click', '.lookup_option', function(e) {
+        var lookup = $(this).closest('.lookup');
+        lookup.find('input[type="hidden"]').val($(this).data('id'));
+        lookup.find('.lookup_search').val($(this).text());
+        lookup.find('.lookup_results').hide();
+    });
+
+    $(document).on('click', '.lookup_results a', function(e) {
+        e.preventDefault();
+    });
+
+    $(document).on('click', '.lookup_more a', function(e) {
+        lookup_search($(this).closest('.lookup'), $(this).data('page'));
+    });
+
+    $(document).on('click', function(e) {
+        if ($(e.target).closest('.lookup').length === 0) {
+            close_lookups();
+        }
+    });
+
     // Cancel modal form
     // The .off() function deregisters the ajax call
     // without this, two ajax calls would go out in sequence if
@@ -296,6 +607,79 @@ $(document).ready(function(){
         $('#modalSubmit').off('click');
     });
 
+    // select rows for bulk delete (a click on a link or button in the row does not select it)
+    $(document).on('click', 'table.scrud_datatable tbody tr', function(e) {
+        if ($(e.target).closest('a').length === 0 && $(this).attr('data-id') !== undefined) {
+            $(this).toggleClass('selected');
+        }
+    });
+
+    // Delete selected rows button
+    $('.bulk_delete_button').click(function(e) {
+        e.preventDefault();
+        var uid = $(this).data("uid");
+        var table = $(this).closest('.my_table_container, .my_l_table_container').find('table.scrud_datatable');
+        var ids = table.find('tbody tr.selected').map(function() {
+            return $(this).attr('data-id');
+        }).get();
+        if (ids.length === 0) {
+            show_message('Select the rows to delete', 'error');
+            return;
+        }
+        if (confirm("Select OK to delete " + ids.length + " rows")) {
+            // a background job, so a large selection does not hit the request timeout (the table is reloaded when it is done)
+            submit_job('bulk_delete', {uid: $.trim(uid)},
+                {data: JSON.stringify({'ids': ids}), contentType: 'application/json; charset=utf-8'}, table);
+        }
+    });
+
+    // Export button : download every row of the table view (link, search and order) as a file
+    $('.export_button').click(function(e) {
+        e.preventDefault();
+        var table = $(this).closest('.my_table_container, .my_l_table_container').find('table.scrud_datatable');
+        var table_element_id = '#' + table.attr('id');
+        if ( ! $.fn.DataTable.isDataTable( table_element_id ) ) {
+            return;
+        }
+        var dt = table.DataTable();
+        var params = $.extend({}, table_links[table_element_id], {
+            search: {value: dt.search()},
+            order: dt.order().map(function(o) {
+                return {column: o[0], dir: o[1]};
+            })
+        });
+        // the file is written by a background job and downloaded when it is done
+        submit_job('export', {format: $(this).data('format')}, {data: {request: JSON.stringify(params)}}, null);
+    });
+
+    // Import button : choose a csv or jsonl file, it is imported by a background job
+    $('.import_button').click(function(e) {
+        e.preventDefault();
+        $(this).siblings('.import_file').click();
+    });
+
+    $('.import_file').change(function() {
+        if (this.files.length === 0) {
+            return;
+        }
+        var uid = $(this).siblings('.import_button').data('uid');
+        var table = $(this).closest('.my_table_container, .my_l_table_container').find('table.scrud_datatable');
+        var form_data = new FormData();
+        form_data.append('file', this.files[0]);
+        submit_job('import', {uid: $.trim(uid)}, {data: form_data, processData: false, contentType: false}, table);
+        $(this).val(''); // the same file can be chosen again
+    });
+
+    // Recompute button : recompute the computed columns of every row in a background job
+    $('.recompute_button').click(function(e) {
+        e.preventDefault();
+        var uid = $(this).data('uid');
+        var table = $(this).closest('.my_table_container, .my_l_table_container').find('table.scrud_datatable');
+        if (confirm("Select OK to recompute the computed columns of every row")) {
+            submit_job('recompute', {uid: $.trim(uid)}, {}, table);
+        }
+    });
+
     // Delete record button
     $(document).on('click', '.function_delete a', function(e) {
         e.preventDefault();
@@ -1,24 +1,44 @@
 from flask import (
-    Blueprint, render_template, request, current_app
+    Blueprint, render_template, request, current_app, stream_with_context, url_for, Response, send_file, abort
 )
 from flask import json
+import csv
 import sys
-import datetime as dt
-from sqlalchemy import desc
-from sqlalchemy.inspection import inspect
 
 from . import bp
 from app import db
-from .controllers import (TableConfig, LinkIDs, get_table_data)
-from .html import set_form_html
-from .helpers import str_to_bool, get_uid_from_tablename
+from .controllers import (TableConfig, LinkIDs, get_table_data, get_table_query,
+    get_connection, get_record_counts, iter_table_records, get_lookup_options)
+from .caches import RowCountCache, OptionCache, TableVersions, create_result_cache
+from .indexes import log_index_advice
+from .helpers import convert_form_value
+from .bulk import MAX_ERRORS, read_records, read_ids, bulk_create, bulk_update, bulk_delete
+from .imports import get_import_format, import_records
+from .exports import EXPORTERS, EXPORT_MIMETYPES, get_export_formats, get_export_query
+from .jobs import create_job_queue, get_job_file
+from .serializers import dumps
+from .responses import (get_data_etag, get_content_etag, not_modified, not_modified_response,
+    json_response, compress_response)
 
 @bp.before_app_first_request
 def init_table_configuration():
     """ Run once to initialize the table configuration class
     """
     current_app.tc = TableConfig()
-    current_app.link_ids = LinkIDs()
+    current_app.row_counts = RowCountCache(current_app.config["SCRUD_ROW_COUNT_MAX_AGE"])
+    current_app.table_versions = TableVersions(current_app.config["SCRUD_TABLE_VERSIONS_PATH"],
+        current_app.config["SCRUD_ETAG_MAX_AGE"])
+    current_app.result_cache = create_result_cache(current_app, current_app.table_versions)
+    current_app.option_cache = OptionCache(current_app.config["SCRUD_OPTION_CACHE_MAX_TABLES"],
+        current_app.config["SCRUD_OPTION_CACHE_MAX_OPTIONS"], current_app.config["SCRUD_ROW_COUNT_MAX_AGE"])
+    current_app.jobs = create_job_queue(current_app._get_current_object())
+    if current_app.config["SCRUD_INDEX_ADVISOR"]:
+        log_index_advice(current_app.tc)
+
+@bp.after_request
+def compress(response):
+    """ gzip or brotli compression of the blueprint responses (see responses.py) """
+    return compress_response(response)
 
 @bp.route("/")
 @bp.route("/index")
@@ -29,77 +49,144 @@ def index():
     """
     menumap = current_app.tc.db_tables
     dt_tables_config = current_app.tc.get_dt_tables_config()
-    return render_template("scrud/index.html", menumap=menumap, dt_tables_config=dt_tables_config)
+    # versioned url, so the browser can cache the table configs until a model changes
+    table_configs_url = url_for("scrud.table_configs", version=current_app.tc.client_configs_version)
+    # tables with computed columns (models that override set_computed_columns()) get a recompute button
+    computed_uids = {t["uid"] for t in dt_tables_config if "set_computed_columns" in vars(t["class_"])}
+    return render_template("scrud/index.html", menumap=menumap, dt_tables_config=dt_tables_config,
+        table_configs_url=table_configs_url, export_formats=get_export_formats(), computed_uids=computed_uids)
 
-@bp.route("/set_link_ids", methods=["GET", "POST"])
-def set_link_ids():
-    """ Sets uid, row_id, fk_id, and fk prior to getting data for DataTables.  A row in a table may have links to other tables. This sets the parameters for those links.
+@bp.route("/get_link_uid", methods=["GET", "POST"])
+def get_link_uid():
+    """ Get the uid of the table displayed by a link (c_uid).  A row in a table may have links to other tables.  scrud.js uses c_uid to show the linked table's html element and then sends the same link parameters with the init_table and get_data requests for that table.
 
     Notes
     -----
-    I originally tried having DataTables send the id's in its ajax call.  This did not work because it would try to reinitialize the table, which it does not allow.  DataTable.ajax.reload(), which doesn't reinitialize the table, does not have an option to send new parameter values to the reload call.  This class is my work around.
+    Nothing is stored on the server.  See LinkIDs in controllers.py.
     """
-    dt_request = request.get_json()
-
-    p_uid = int(dt_request['p_uid']) # parent table uid
-    row_id = dt_request['row_id']
-    fk_id = dt_request['fk_id']
-    fk = dt_request['fk'] # fk is a str in both .js and .py
-
-    if isinstance(row_id, str):
-        row_id = None if row_id == 'None' else int(row_id)
-    if isinstance(fk_id, str):
-        fk_id = None if fk_id == 'None' else int(fk_id)
-
-    p_class = current_app.tc.get_dt_tables_config()[p_uid]["class_"]
-    c_uid = None # default is parent table
-    if fk_id: # get child table uid (both osr and msr define row_id)
-        for c in list(inspect(p_class).columns):
-            if c.name == fk:
-                insp = inspect(c)
-                fk = next(iter(insp.foreign_keys))
-        c_uid = get_uid_from_tablename(fk._table_key())
-    elif row_id: # msr table
-        msr = getattr(p_class, fk) # returns ManySideRelationship class
-        c_uid = get_uid_from_tablename(msr.related_classname.lower())
-
-    current_app.link_ids.set_link_ids(p_uid, c_uid, row_id, fk_id, fk)
+    dt_request = request.get_json(silent=True) or {}
+    link_ids = get_request_link_ids(dt_request)
     json_dump = json.dumps({
-        "c_uid": c_uid
+        "c_uid": link_ids.c_uid
     }, default=str)
     return json_dump
 
 @bp.route("/init_table", methods=["GET", "POST"])
 def init_table():
     """ Get the table specifications for columns, etc and send to scrud.js.
-    """
-    link_ids = current_app.link_ids.get_link_ids()
-    uid = link_ids["p_uid"] # table uid
-    if link_ids["row_id"]: uid = link_ids["c_uid"]
 
-    # Get table and its specs from Tables
-    t = current_app.tc.get_dt_tables_config()[uid] # the requested table
+    Parameters
+    ----------
+    p_uid, row_id, fk_id, fk : link parameters of the requested table (see LinkIDs)
+    """
+    dt_request = request.get_json(silent=True) or {}
+    uid = get_request_link_ids(dt_request).get_uid() # table uid
 
     # Prep data to send to scrud.js
-    json_dump = json.dumps({
-        "columns": t["columns"],
-        "order": t["order"],
-        "render":t["render"]
-    }, default=str)
-    return json_dump
+    json_dump = dumps(current_app.tc.get_client_config(uid))
+    etag = get_content_etag(json_dump)
+    if not_modified(etag):
+        return not_modified_response(etag)
+    return json_response(json_dump, etag)
+
+@bp.route("/table_configs/<version>", methods=["GET"])
+def table_configs(version):
+    """ Get the table specifications of all tables in one response (the init_table response of each table, by uid).  scrud.js loads it once per page, so opening a table only needs the get_data request.
+
+    Parameters
+    ----------
+    version : str
+        TableConfig client_configs_version, put in the url by index()
+
+    Notes
+    -----
+    The response only changes when the models change, and then the version changes too, so it is sent with a long lived Cache-Control (SCRUD_TABLE_CONFIGS_MAX_AGE).  A page rendered before a restart with changed models asks for an old version.  It gets the current configs, but not cached.
+    """
+    tc = current_app.tc
+    if not_modified(tc.client_configs_version):
+        return not_modified_response(tc.client_configs_version)
+    response = json_response(tc.client_configs_json, tc.client_configs_version)
+    if version == tc.client_configs_version:
+        response.headers["Cache-Control"] = "public, max-age={}, immutable".format(
+            current_app.config["SCRUD_TABLE_CONFIGS_MAX_AGE"])
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+    return response
 
 @bp.route("/get_data", methods=["GET", "POST"])
 def get_data():
     """ Get server side processing data requested by scrud.js. Get, slice, order, format and return data requested by scrud.js.
+
+    Parameters
+    ----------
+    p_uid, row_id, fk_id, fk : link parameters of the requested table (see LinkIDs)
+    DataTables server side request parameters (draw, start, length, order, search)
     """
+    dt_request = request.get_json(silent=True) or {}
+    link_ids = get_request_link_ids(dt_request)
+    draw = int(dt_request.get("draw", 0))
+
+    # the etag is taken before the query, so a write committed during the query only causes an extra reload
+    etag = None
+    if current_app.config["SCRUD_ETAG"]:
+        etag = get_data_etag(link_ids.get_uid(), dt_request)
+        if not_modified(etag): # table unchanged since scrud.js got this etag
+            return not_modified_response(etag)
+
+    # unpaged requests (client side tables, "show all") can be the whole table
+    query = get_table_query(link_ids.get_link_ids(), dt_request)
+    if current_app.config["SCRUD_STREAM_JSON"] and not query["paged"]:
+        return json_response(stream_with_context(stream_table_json(query, draw)), etag)
+
     # Prepare data to return to scrud.js
-    records_total, requested_data = get_table_data()
-    dt_request = request.get_json()
+    table_data = get_table_data(link_ids.get_link_ids(), dt_request, query)
 
-    json_dump = json.dumps({
-        "data"    : requested_data
-    }, default=str)
-    return json_dump
+    # draw is echoed back so DataTables can discard out of order responses
+    table_data["draw"] = draw
+    json_dump = dumps(table_data)
+    return json_response(json_dump, etag)
+
+def get_request_link_ids(dt_request):
+    """ Get the LinkIDs of a request.  Aborts with a 400 if the link parameters are missing or are not valid. """
+    try:
+        return LinkIDs.from_request(dt_request)
+    except (KeyError, IndexError, TypeError, ValueError) as ex:
+        abort(400, f"Missing or bad link parameters (p_uid, row_id, fk_id, fk) : {ex!r}")
+
+def stream_table_json(query, draw):
+    """ Generator of the get_data json response, written one record at a time.
+
+    The counts are sent first, then the records are fetched, decorated and serialized in batches of SCRUD_STREAM_BATCH_SIZE rows. Memory stays flat regardless of the table size.
+
+    Parameters
+    ----------
+    query : dict from get_table_query()
+    draw : int
+        DataTables draw counter
+    """
+    # the connection is checked out while the response is streamed
+    with get_connection(query) as conn:
+        records_total, records_filtered = get_record_counts(conn, query)
+        yield '{{"draw": {}, "recordsTotal": {}, "recordsFiltered": {}, "cursor": null, "data": ['\
+            .format(draw, records_total, records_filtered)
+        separator = ""
+        for r in iter_table_records(conn, query, current_app.config["SCRUD_STREAM_BATCH_SIZE"]):
+            yield separator + dumps(r)
+            separator = ","
+        yield "]}"
+
+@bp.route("/pool_status", methods=["GET"])
+def pool_status():
+    """ Connection pool status and metrics for each database (see app/database.py)
+    """
+    return json.dumps(db.get_pool_status(), default=str)
+
+@bp.route("/cache_status", methods=["GET"])
+def cache_status():
+    """ get_table_data result cache hit/miss statistics and size (see ResultCache in caches.py)
+    """
+    cache = current_app.result_cache
+    return json.dumps(cache.stats() if cache is not None else None, default=str)
 
 @bp.route("/delete_record", methods=["GET"])
 def delete_record():
@@ -145,13 +232,14 @@ def get_form():
     uid : int
         unique id of db table
     """
-    dt_request = request.get_json()
-
-    uid = int(dt_request['uid'])
-    id = None if isinstance(dt_request['id'], str) else int(dt_request['id'])
-
-    # get table and model class_
-    t = current_app.tc.get_dt_tables_config()[uid]
+    dt_request = request.get_json(silent=True) or {}
+    try:
+        uid = int(dt_request['uid'])
+        id = None if isinstance(dt_request['id'], str) else int(dt_request['id'])
+        # get table and model class_
+        t = current_app.tc.get_dt_tables_config()[uid]
+    except (KeyError, IndexError, TypeError, ValueError) as ex:
+        abort(400, f"Missing or bad uid or id : {ex!r}")
     class_ = t["class_"]
 
     if id: # update record
@@ -161,11 +249,11 @@ def get_form():
             message = f"Did not find record with id = {id}"
         else:
             # get the html string that defines modal content
-            form_html, modal_title = set_form_html(class_, q, "update")
+            form_html, modal_title = current_app.tc.get_form_template(uid).render(q, "update")
             result  = "success"
             message = "query success"
     else: # create record
-        form_html, modal_title = set_form_html(class_, "None", "create")
+        form_html, modal_title = current_app.tc.get_form_template(uid).render(None, "create")
         result  = "success"
         message = ""
 
@@ -178,6 +266,47 @@ def get_form():
     # Convert dict to JSON array
     return json.dumps(data, default=str)#, use_decimal=True)
 
+@bp.route("/lookup", methods=["GET"])
+def lookup():
+    """ Search the relationship table of a form lookup input (form_spec "type": "lookup") as the user types.
+
+    Parameters
+    ----------
+    uid : int
+        unique id of the form's db table
+    column : str
+        foreign key column of the lookup input (ie company_id)
+    q : str
+        search text
+    page : int
+        page of results, starting at 0 (SCRUD_LOOKUP_PAGE_SIZE results per page)
+
+    Returns
+    -------
+    json : {"result", "message", "results" : [[value, display_str]], "more" : bool}
+    """
+    try:
+        uid = get_request_uid()
+        column_name = request.args.get("column", "")
+        search_value = request.args.get("q", "")
+        page = max(int(request.args.get("page", 0)), 0)
+        class_ = current_app.tc.get_dt_tables_config()[uid]["class_"]
+        results, more = get_lookup_options(class_, column_name, search_value, page,
+            current_app.config["SCRUD_LOOKUP_PAGE_SIZE"])
+        result = "success"
+        message = ""
+    except ValueError as ex: # bad uid, page or column
+        results, more = [], False
+        result = "error"
+        message = str(ex)
+    data = {
+        "result" : result,
+        "message" : message,
+        "results" : results,
+        "more" : more
+    }
+    return json_response(dumps(data))
+
 @bp.route("/update_db", methods=["GET", "POST"])
 def update_db():
 
@@ -223,14 +352,11 @@ def update_db():
         validated = form.validate()
 
     print(form.errors, "validated = {}".format(validated))
+    record_id = None
     if request.method == "POST" and validated:
         # loop through all input fields from form
         for name, value in rf.items():
-            # convert date str to datetime if using sqlite database
-            if name == "date" and current_app.config["DATABASE"]=="sqlite":
-                value = dt.datetime.strptime(value, "%Y-%m-%d")
-            value = str_to_bool(value)
-            setattr(record, name, value)
+            setattr(record, name, convert_form_value(class_, name, value))
 
         try:
             if create_record_flag: # create record
@@ -238,6 +364,10 @@ def update_db():
                 message = "Record added to database"
             else: # update record
                 message = "Record updated in database"
+            # computed columns (not in forms) are set by the before_flush hook in app/__init__.py,
+            # so they are written in the same transaction
+            db.session.flush()
+            record_id = record.id # new pk is set by the flush
             db.session.commit()
             result  = "success"
         except:
@@ -247,17 +377,6 @@ def update_db():
             raise
         finally:
             db.session.close()
-
-        # Update computed columns (computed columns are not in forms)
-        if create_record_flag:
-            # get the table row that was added above
-            # I committed and then requeried so I could use the same
-            # code for both create and update record
-            record = class_.query.order_by(desc(class_.id)).first()
-        else:
-            record = class_.query.filter_by(id = int(id)).first()
-
-        record.set_computed_columns()
     else:
         result = "error"
         if not validated:
@@ -267,6 +386,253 @@ def update_db():
 
     data = {
         "result" : result,
-        "message" : message
+        "message" : message,
+        "id" : record_id
     }
     return json.dumps(data, default=str)#, use_decimal=True)
+
+@bp.route("/bulk_create", methods=["POST"])
+def bulk_create_records():
+    """ Create many records in one transaction (see bulk.py).
+
+    Parameters
+    ----------
+    uid : int
+        table unique id
+    body : json array of objects or csv (body with Content-Type text/csv or a "file" upload)
+        one object or csv row of column values for each record
+
+    Returns
+    -------
+    json : {"result", "message", "count", "errors", "error_count"}
+        errors lists the first MAX_ERRORS records that failed validation and error_count is the number of them.  If there are any, no record is created.
+    """
+    return bulk_write(bulk_create, "created")
+
+@bp.route("/bulk_update", methods=["POST"])
+def bulk_update_records():
+    """ Update many records in one transaction (see bulk.py).  Same parameters as bulk_create, each record has the "id" of the row to update and only the columns to change.
+    """
+    return bulk_write(bulk_update, "updated")
+
+def bulk_write(bulk_func, action):
+    uid = int(request.args.get("uid"))
+    class_ = current_app.tc.get_dt_tables_config()[uid]["class_"]
+    try:
+        count, errors = bulk_func(class_, read_records(request))
+        if errors:
+            result = "error"
+            message = f"{len(errors)} records failed server validation, no records {action}"
+        else:
+            result = "success"
+            message = f"{count} records {action}"
+    except ValueError as ex: # not a list of records, a value that can't be converted or a database constraint
+        count, errors = 0, []
+        result = "error"
+        message = str(ex)
+    data = {
+        "result" : result,
+        "message" : message,
+        "count" : count,
+        "errors" : errors[:MAX_ERRORS],
+        "error_count" : len(errors)
+    }
+    return json_response(dumps(data))
+
+@bp.route("/bulk_delete", methods=["POST"])
+def bulk_delete_records():
+    """ Delete many records in one transaction.
+
+    Parameters
+    ----------
+    uid : int
+        table unique id
+    ids : json {"ids": [id, ...]}
+        pk ids of the rows to delete
+    """
+    uid = int(request.args.get("uid"))
+    class_ = current_app.tc.get_dt_tables_config()[uid]["class_"]
+    try:
+        count = bulk_delete(class_, read_ids(request))
+        result = "success"
+        message = f"{count} records deleted"
+    except ValueError as ex: # not a list of ids or an id is not an int
+        count = 0
+        result = "error"
+        message = str(ex)
+    data = {
+        "result" : result,
+        "message" : message,
+        "count" : count
+    }
+    return json_response(dumps(data))
+
+@bp.route("/import", methods=["POST"])
+def import_file():
+    """ Import a csv or jsonl file into a table (see imports.py).
+
+    The file is read and inserted in batches, so it can be larger than memory.  Each batch is its own transaction and invalid records are skipped.
+
+    Parameters
+    ----------
+    uid : int
+        table unique id
+    file : csv or jsonl file upload
+        csv header or jsonl keys are column names or form_spec labels
+    format : str
+        "csv" or "jsonl", from the file extension if not given
+    batch_size : int
+        records per batch, SCRUD_IMPORT_BATCH_SIZE if not given
+
+    Returns
+    -------
+    jsonl (application/x-ndjson) : streamed as the import runs
+        {"rows", "inserted", "error_count"} after each batch, then
+        {"result", "message", "rows", "inserted", "error_count", "errors"}
+    """
+    uid = int(request.args.get("uid"))
+    class_ = current_app.tc.get_dt_tables_config()[uid]["class_"]
+    batch_size = int(request.args.get("batch_size", current_app.config["SCRUD_IMPORT_BATCH_SIZE"]))
+    upload = request.files.get("file")
+
+    def generate():
+        try:
+            if upload is None:
+                raise ValueError("No file to import")
+            fmt = get_import_format(upload.filename, request.args.get("format"))
+            for status in import_records(class_, upload.stream, fmt, batch_size):
+                yield dumps({k: status[k] for k in ("rows", "inserted", "error_count")}) + "\n"
+            data = dict(status, result="success",
+                message=f"{status['inserted']} of {status['rows']} records imported, {status['error_count']} errors")
+        except (ValueError, UnicodeDecodeError, csv.Error) as ex: # bad format, header or json
+            data = {"result": "error", "message": str(ex)}
+        yield dumps(data) + "\n"
+
+    # the upload has been spooled to a temporary file, so the body is not read while the response is sent
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@bp.route("/export", methods=["GET", "POST"])
+def export_table():
+    """ Download every row of a table view as a csv, jsonl or parquet file (see exports.py).
+
+    Parameters
+    ----------
+    format : str
+        "csv", "jsonl" or "parquet" (needs pyarrow)
+    request : json str
+        link parameters (p_uid, row_id, fk_id, fk) and the DataTables search and order of the table view, sent by scrud.js.  Without it, the link parameters and the search value are read from the query string (ie /scrud/export?format=csv&p_uid=2&search=smith).
+    """
+    fmt = request.values.get("format", "csv")
+    if fmt not in get_export_formats():
+        message = f"Export format must be one of {get_export_formats()}"
+        return json_response(dumps({"result": "error", "message": message}))
+    query = get_export_query(read_export_request())
+
+    body = EXPORTERS[fmt](query, current_app.config["SCRUD_EXPORT_BATCH_SIZE"])
+    response = Response(stream_with_context(body), mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers["Content-Disposition"] = f'attachment; filename="{query["t"]["tablename"]}.{fmt}"'
+    return response
+
+def read_export_request():
+    """ Get the table view of an export from the "request" json (scrud.js) or the query string """
+    if "request" in request.values:
+        return json.loads(request.values["request"])
+    dt_request = request.args.to_dict()
+    dt_request["search"] = {"value": dt_request.get("search", "")}
+    return dt_request
+
+def get_request_uid():
+    """ Get the table uid from the query string.  Raises ValueError if it is missing or not the uid of a table. """
+    uid = request.args.get("uid")
+    try:
+        uid = int(uid)
+    except (TypeError, ValueError):
+        raise ValueError(f"uid must be a table uid, not {uid!r}")
+    if not 0 <= uid < len(current_app.tc.get_dt_tables_config()):
+        raise ValueError(f"No table with uid {uid}")
+    return uid
+
+@bp.route("/jobs/submit/<kind>", methods=["POST"])
+def submit_job(kind):
+    """ Run an import, export, recompute or bulk_delete as a background job (see jobs.py).  Returns at once, scrud.js polls /scrud/jobs/<id> for the progress.
+
+    Parameters
+    ----------
+    kind : str
+        import : "file" upload, same parameters as /scrud/import
+        export : same parameters as /scrud/export
+        recompute : recompute the computed columns of every row
+        bulk_delete : json {"ids": [id, ...]}, same as /scrud/bulk_delete
+    uid : int
+        table unique id.  An export gets the table from the link parameters (p_uid, row_id, fk_id, fk).
+
+    Returns
+    -------
+    json : {"result", "message", "job"}
+    """
+    try:
+        if kind == "export":
+            fmt = request.values.get("format", "csv")
+            if fmt not in get_export_formats():
+                raise ValueError(f"Export format must be one of {get_export_formats()}")
+            dt_request = read_export_request()
+            uid = LinkIDs.from_request(dt_request).get_uid()
+        else:
+            uid = get_request_uid()
+        if kind == "import":
+            upload = request.files.get("file")
+            if upload is None:
+                raise ValueError("No file to import")
+            fmt = get_import_format(upload.filename, request.args.get("format"))
+            path = current_app.jobs.upload_path()
+            upload.save(path)
+            batch_size = int(request.args.get("batch_size", current_app.config["SCRUD_IMPORT_BATCH_SIZE"]))
+            params = {"path": path, "fmt": fmt, "batch_size": batch_size}
+        elif kind == "export":
+            params = {"fmt": fmt, "dt_request": dt_request, "batch_size": current_app.config["SCRUD_EXPORT_BATCH_SIZE"]}
+        elif kind == "bulk_delete":
+            params = {"ids": read_ids(request)}
+        else:
+            params = {}
+        job = current_app.jobs.submit(kind, uid, params)
+        data = {"result": "success", "message": f"{kind} job submitted", "job": get_job_status(job)}
+    except ValueError as ex: # bad kind, uid, format or ids
+        data = {"result": "error", "message": str(ex), "job": None}
+    return json_response(dumps(data))
+
+@bp.route("/jobs", methods=["GET"])
+def list_jobs():
+    """ Status of the most recently submitted jobs """
+    jobs = [get_job_status(job) for job in current_app.jobs.store.list()]
+    return json_response(dumps({"result": "success", "jobs": jobs}))
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """ Status and progress of a job.
+
+    Returns
+    -------
+    json : {"result", "job"}
+        job : {"id", "kind", "uid", "status", "progress", "result", "error", "submitted", "started", "finished"} and "file_url" of a finished export
+    """
+    job = current_app.jobs.store.get(job_id)
+    if job is None:
+        return json_response(dumps({"result": "error", "message": f"No job {job_id}", "job": None}))
+    return json_response(dumps({"result": "success", "job": get_job_status(job)}))
+
+@bp.route("/jobs/<job_id>/file", methods=["GET"])
+def job_file(job_id):
+    """ Download the file of a finished export job """
+    job = current_app.jobs.store.get(job_id)
+    if job is None or job["kind"] != "export" or job["status"] != "done":
+        return json_response(dumps({"result": "error", "message": f"No export file for job {job_id}"})), 404
+    fmt = job["params"]["fmt"]
+    return send_file(get_job_file(current_app.jobs.job_dir, job_id, fmt), mimetype=EXPORT_MIMETYPES[fmt],
+        as_attachment=True, attachment_filename=job["result"]["filename"])
+
+def get_job_status(job):
+    """ The job fields sent to the browser (params has server file paths) """
+    status = {k: v for k, v in job.items() if k not in ("params", "pid", "pid_start")}
+    if job["kind"] == "export" and job["status"] == "done":
+        status["file_url"] = url_for("scrud.job_file", job_id=job["id"])
+    return status
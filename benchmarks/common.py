@@ -0,0 +1,64 @@
+""" Helpers shared by the benchmarks.
+
+The benchmarks run the scrud blueprint code against temporary sqlite copies of the models so the example databases are not changed.  Run from the repository root, ie
+
+    $ python -m benchmarks.msr_counts
+"""
+import os
+import shutil
+import tempfile
+import timeit
+from contextlib import contextmanager
+
+from config import config, DevelopmentConfig
+from app import create_app, db
+
+
+@contextmanager
+def benchmark_app(**config_overrides):
+    """ Create the app with empty temporary databases for every bind.
+
+    Parameters
+    ----------
+    config_overrides : dict
+        config attributes to set on top of DevelopmentConfig
+
+    Yields
+    ------
+    app : Flask app with an active test request context
+    """
+    tmpdir = tempfile.mkdtemp(prefix="scrud_bench_")
+    file_1 = os.path.join(tmpdir, DevelopmentConfig.DATABASE_FILE_1)
+    file_2 = os.path.join(tmpdir, DevelopmentConfig.DATABASE_FILE_2)
+    attrs = {
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + file_1,
+        "SQLALCHEMY_BINDS": {"models_pab": "sqlite:///" + file_2},
+        "SCRUD_RESULT_CACHE": None, # time the queries, not the cache
+        "SCRUD_TABLE_VERSIONS_PATH": os.path.join(tmpdir, "scrud_versions.sqlite"),
+        "SCRUD_JOB_PATH": os.path.join(tmpdir, "scrud_jobs.sqlite"),
+        "SCRUD_JOB_DIR": os.path.join(tmpdir, "scrud_jobs"),
+    }
+    attrs.update(config_overrides)
+    config["benchmark"] = type("BenchmarkConfig", (DevelopmentConfig,), attrs)
+    try:
+        app = create_app("benchmark")
+        with app.test_request_context():
+            db.create_all()
+            # runs the scrud before_app_first_request setup (TableConfig)
+            app.try_trigger_before_first_request_functions()
+            yield app
+    finally:
+        del config["benchmark"]
+        shutil.rmtree(tmpdir)
+
+
+def insert_rows(class_, rows):
+    """ Insert a list of dicts into the table of class_ with one executemany """
+    engine = db.get_engine(bind=class_.__bind_key__)
+    with engine.begin() as conn:
+        conn.execute(class_.__table__.insert(), rows)
+
+
+def best_of(func, repeat=5, number=1):
+    """ Best wall time in ms of repeat runs of func """
+    return 1000.0 * min(timeit.repeat(func, repeat=repeat, number=number)) / number
@@ -0,0 +1,85 @@
+""" Compare the get_data response with server rendered html, the compact format (SCRUD_COMPACT_DATA) and compact array rows (SCRUD_ARRAY_DATA).
+
+The Employee table (a one side link to Company), the Company table (11 columns) and the User table (two many side links) are filled with rows.  Each draw is get_table_data() plus serialization.
+
+    $ python -m benchmarks.compact_data [num_rows]
+
+Results on a laptop, 20000 employees and users, 2000 companies, per draw (ms, KB):
+
+    table       length              html           compact            arrays
+    employee        10      15.7     5.6      15.5     2.1      15.9     0.9
+    employee       100      17.5    55.4      17.2    20.0      16.5     8.2
+    employee      1000      35.0   553.4      34.3   199.3      29.6    81.3
+    company         10       1.0     5.8       0.8     2.2       0.8     0.9
+    company        100       2.1    56.9       2.0    21.3       1.5     8.2
+    company       1000      13.6   568.6      11.9   212.6       8.2    81.6
+    user            10       2.0     5.4       1.8     0.9       2.0     0.5
+    user           100       6.2    53.3       5.9     8.2       5.7     4.7
+    user          1000      50.1   532.1      25.2    81.1      22.7    46.1
+
+The html of the function buttons and links is most of each row, so compact responses are 3 to 6 times smaller.  The browser builds the same html with the DataTables render callbacks in scrud.js.  Array rows drop the column names repeated in every row, another 2 to 3 times smaller for the wide company table, and skip building a dict per row.  The employee draws are dominated by sorting on the unindexed last_name column.
+"""
+import datetime as dt
+import random
+import sys
+
+from sqlalchemy import text
+
+from app import db
+from app.models_pab import Company, Employee, User, Post, Pet
+from app.scrud.controllers import LinkIDs, get_table_data
+from app.scrud.helpers import get_uid_from_tablename
+from app.scrud.serializers import dumps
+from .common import benchmark_app, insert_rows, best_of
+
+PAGE_LENGTHS = [10, 100, 1000]
+
+
+def populate(num_rows):
+    random.seed(0)
+    num_companies = max(num_rows // 10, 1)
+    insert_rows(Company, [{"id": i, "rank": i, "name": f"company {i}", "industries": "tech", "revenue": 1.0e9,
+                           "fiscal_year": 2019, "num_employees": 100, "market_cap": 2.0e9, "headquarters": "US"}
+                          for i in range(1, num_companies + 1)])
+    insert_rows(Employee, [{"first_name": "first", "last_name": f"last {i}", "date": dt.date(2019, 1, 1),
+                            "salary": 100000.0, "married": i % 2 == 0, "company_id": random.randint(1, num_companies)}
+                           for i in range(num_rows)])
+    insert_rows(User, [{"id": i, "name": f"user {i}", "email": f"u{i}@example.com"}
+                       for i in range(1, num_rows + 1)])
+    insert_rows(Post, [{"body": "post", "date": dt.date(2019, 1, 1), "user_id": random.randint(1, num_rows)}
+                       for i in range(num_rows)])
+    insert_rows(Pet, [{"name": "pet", "animal": "dog", "owner_id": random.randint(1, num_rows)}
+                      for i in range(num_rows)])
+    # index the fk columns so the draws time the response format, not the many side counts
+    engine = db.get_engine(bind="models_pab")
+    for table, col in [("employee", "company_id"), ("post", "user_id"), ("pet", "owner_id")]:
+        engine.execute(text(f"CREATE INDEX ix_{table}_{col} ON {table} ({col})"))
+
+
+FORMATS = [("html", {}), ("compact", {"compact": True}), ("arrays", {"compact": True, "arrays": True})]
+
+
+def draw(uid, length, request_format):
+    dt_request = {"draw": 1, "start": 0, "length": length, "order": [],
+                  "search": {"value": ""}, "columns": []}
+    dt_request.update(request_format)
+    link_ids = LinkIDs(uid).get_link_ids()
+    return lambda: dumps(get_table_data(link_ids, dt_request))
+
+
+def main(num_rows=20000):
+    with benchmark_app():
+        populate(num_rows)
+        print(f"{num_rows} rows, per draw, ms / KB")
+        print(f"{'table':<10}{'length':>8}" + "".join(f"{name:>18}" for name, f in FORMATS))
+        for tablename in ["employee", "company", "user"]:
+            uid = get_uid_from_tablename(tablename)
+            for length in PAGE_LENGTHS:
+                line = f"{tablename:<10}{length:>8}"
+                for name, request_format in FORMATS:
+                    func = draw(uid, length, request_format)
+                    line += f"{best_of(func):>10.1f}{len(func()) / 1000:>8.1f}"
+                print(line)
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
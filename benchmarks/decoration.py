@@ -0,0 +1,93 @@
+""" Compare the row decoration (function buttons and table link html) before and after RowDecorator.
+
+Records are generated for each table from its TableConfig columns, so only the decoration is timed.
+
+    $ python -m benchmarks.decoration [num_rows]
+
+    * per cell : the loop over records x columns that get_table_data() used, calling set_table_link_html() for every link cell
+    * RowDecorator : the templates compiled by TableConfig, one pass per link column
+
+Results on a laptop, 100000 rows, us per row:
+
+    table          links     per cell   RowDecorator
+    employee           1         3.60           1.39
+    company            1         3.38           1.62
+    user               2         5.29           2.05
+    post               0         1.03           0.84
+
+The per cell loop checks every column of every record and builds each link with str.format and all its keyword arguments.  RowDecorator only visits the link columns and fills a %-template that already has uid and fk in it.  Both produce the same html.
+"""
+import sys
+
+from flask import current_app
+
+from app.scrud.html import set_function_icon_html, set_table_link_html
+from .common import benchmark_app, best_of
+
+TABLES = ["employee", "company", "user", "post"]
+
+
+def decorate_per_cell(records, uid, columns):
+    """ get_table_data() decoration before RowDecorator """
+    for r in records:
+        r["functions"] = set_function_icon_html(r["id"], uid)
+    for r in records:
+        for spec in columns:
+            if spec["link"]:
+                col_name = spec["col_name"]
+                row_id = r["id"]
+                link_str = r[col_name]
+                fk = col_name
+                if spec["type"] == "msr":
+                    r[col_name] = set_table_link_html(uid, row_id, None, fk, link_str)
+                elif spec["type"] == "osr":
+                    fk_id = r["fk_id" + col_name]
+                    if fk_id:
+                        r[col_name] = set_table_link_html(uid, row_id, fk_id, fk, link_str)
+                    else:
+                        r[col_name] = "None"
+
+
+def make_records(columns, num_rows):
+    records = []
+    for i in range(1, num_rows + 1):
+        r = {"id": i}
+        for col in columns:
+            if col["col_name"].startswith("fk_id"):
+                r[col["col_name"]] = i % 50 # 0 = null foreign key
+            elif col["type"] == "msr":
+                r[col["col_name"]] = i % 7
+            else:
+                r[col["col_name"]] = f"value {i}"
+        records.append(r)
+    return records
+
+
+def main(num_rows=100000):
+    with benchmark_app():
+        stmts = {t["tablename"]: t for t in current_app.tc.get_sqlalchemy_table_stmts()}
+        print(f"{num_rows} rows, us per row")
+        print(f"{'table':<12}{'links':>7}{'per cell':>13}{'RowDecorator':>15}")
+        for tablename in TABLES:
+            t = stmts[tablename]
+            records = make_records(t["columns"], num_rows)
+
+            def per_cell():
+                r = [dict(x) for x in records]
+                decorate_per_cell(r, t["uid"], t["columns"])
+                return r
+
+            def compiled():
+                r = [dict(x) for x in records]
+                t["decorator"].decorate(r)
+                return r
+
+            assert per_cell() == compiled(), tablename
+            copy = best_of(lambda: [dict(x) for x in records], repeat=3)
+            a = best_of(per_cell, repeat=3) - copy
+            b = best_of(compiled, repeat=3) - copy
+            print(f"{tablename:<12}{len(t['decorator'].links):>7}{1000 * a / num_rows:>13.2f}{1000 * b / num_rows:>15.2f}")
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
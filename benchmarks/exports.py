@@ -0,0 +1,81 @@
+""" Time and peak memory of exporting a whole table with /scrud/export, compared with getting the same rows as one get_data response (a client side table, SCRUD_STREAM_JSON = False).
+
+The Employee table is filled with rows, so each exported row has the two osr joins (Employer, Country).  Peak memory is measured with tracemalloc in a second run.
+
+    $ python -m benchmarks.exports [num_rows]
+
+Results on a laptop, 200000 employees:
+
+                        seconds   peak MB
+    get_data               3.02     152.8
+    export csv             1.99      17.0
+    export jsonl           2.56      19.5
+    export parquet         2.46      14.8
+
+get_data builds the list of all records and the json str before it is sent.  /scrud/export writes SCRUD_EXPORT_BATCH_SIZE rows at a time from a server side cursor, so memory stays flat however large the table is.  The export responses are read a chunk at a time, so the peak does not include the whole file.
+"""
+import datetime as dt
+import sys
+import time
+import tracemalloc
+
+
+from app.models_pab import Company, Country, Employee
+from app.scrud.exports import get_export_formats
+from app.scrud.helpers import get_uid_from_tablename
+from .common import benchmark_app, insert_rows
+
+
+def populate(num_rows):
+    insert_rows(Company, [{"id": i, "rank": i, "name": f"company {i}", "industries": "tech", "revenue": 1.0e9,
+                           "fiscal_year": 2019, "num_employees": 100, "market_cap": 2.0e9, "headquarters": "US"}
+                          for i in range(1, 101)])
+    insert_rows(Country, [{"id": i, "name": f"country {i}", "political_system": "republic", "population": 1.0e6}
+                          for i in range(1, 51)])
+    insert_rows(Employee, [{"id": i, "first_name": f"first {i}", "last_name": f"last {i}", "date": dt.date(2019, 1, 1),
+                            "salary": 50000.0 + i, "married": bool(i % 2), "company_id": i % 100 + 1,
+                            "country_id": i % 50 + 1} for i in range(1, num_rows + 1)])
+
+
+def measure(func):
+    t = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - t
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main(num_rows=200000):
+    with benchmark_app(SCRUD_STREAM_JSON=False) as app:
+        populate(num_rows)
+        uid = get_uid_from_tablename("employee")
+        client = app.test_client()
+
+        def get_data():
+            r = client.post("/scrud/get_data", json={"p_uid": uid, "compact": True, "arrays": True})
+            assert len(r.get_json()["data"]) == num_rows
+
+        def export(fmt):
+            def run():
+                # read the streamed response a chunk at a time, so the peak is the server side memory
+                r = client.get(f"/scrud/export?format={fmt}&p_uid={uid}", buffered=False)
+                size = 0
+                for chunk in r.response:
+                    size += len(chunk)
+                r.close()
+                assert size > num_rows
+            return run
+
+        print(f"{num_rows} employees")
+        print(f"{'':<20}{'seconds':>10}{'peak MB':>10}")
+        tests = [("get_data", get_data)] + [(f"export {fmt}", export(fmt)) for fmt in get_export_formats()]
+        for name, func in tests:
+            seconds, peak = measure(func)
+            print(f"{name:<20}{seconds:>10.2f}{peak:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,103 @@
+""" Compare building the get_form html per request with the FormTemplate compiled by TableConfig.
+
+The Company table is filled with rows, so the Employee form has a dropdown with one option per company.  The option lists come from the OptionCache in both cases, so only the html is timed.
+
+    $ python -m benchmarks.forms [num_companies]
+
+    * per request : set_form_html() before FormTemplate.  A SetFormInputHTML for each form_spec item, html built with .format and +=, and form_spec defaults set in place
+    * FormTemplate : record values and the selected option filled into the compiled templates
+
+Results on a laptop, 2000 companies, us per form:
+
+    table         form   per request   FormTemplate
+    employee    create         865.2           31.5
+    employee    update         887.4           40.2
+    company     create          21.1            0.4
+    company     update          24.7            7.1
+    post        create           9.5            0.4
+    post        update         332.2          364.9
+    pet         create          43.7           22.4
+    pet         update          49.7           27.8
+
+Most of the per request time of the employee form is formatting the 2000 <option> items.  FormTemplate builds them once for each option list and only splices in the selected option.  A create form without a dropdown is a str join.  The post update form is one query for the display value of the selected user (lookup input), the same in both.  Both produce the same html.
+"""
+import datetime as dt
+import sys
+
+from flask import current_app
+
+from app.models_pab import Company, Employee, User, Post, Pet
+from app.scrud.helpers import get_uid_from_tablename
+from app.scrud.html import SetFormInputHTML
+from .common import benchmark_app, insert_rows, best_of
+
+TABLES = ["employee", "company", "post", "pet"]
+
+
+def set_form_html(class_, record, form_type, uid):
+    """ set_form_html() before FormTemplate (uid added for the lookup input) """
+    if form_type == 'update': # show selected row values in form
+        modal_title = 'Update record'
+    else:
+        modal_title = 'Create record'
+    form_str = ''
+    for column_name, spec in class_.form_spec.items():
+        if 'validate' not in spec:
+            spec['validate'] = ""
+        if 'value' not in spec:
+            spec['value'] = ""
+        if 'placeholder' not in spec:
+            spec['placeholder'] = ""
+
+        input_html_builder = SetFormInputHTML(spec['label'], spec['placeholder'], spec['value'], spec['type'], spec['validate'], form_type, class_, record, column_name, uid)
+        if spec['type'] == 'dropdown':
+            form_str += input_html_builder.set_dropdown_html()
+        elif spec['type'] == 'lookup':
+            form_str += input_html_builder.set_lookup_html()
+        elif spec['type'] == 'boolean':
+            form_str += input_html_builder.set_radio_html()
+        elif spec['type'] == 'textarea':
+            form_str += input_html_builder.set_textarea_html()
+        elif spec['type'] == 'date' or spec['type'] == 'dateISO':
+            form_str += input_html_builder.set_date_html()
+        elif spec['type'] == 'computed':
+            pass
+        else:
+            form_str += input_html_builder.set_input_html()
+        form_str += '</div> </div>'
+    return form_str, modal_title
+
+
+def populate(num_companies):
+    insert_rows(Company, [{"id": i, "rank": i, "name": f"company {i}", "industries": "tech", "revenue": 1.0e9,
+                           "fiscal_year": 2019, "num_employees": 100, "market_cap": 2.0e9, "headquarters": "US"}
+                          for i in range(1, num_companies + 1)])
+    insert_rows(Employee, [{"id": 1, "first_name": "first", "last_name": "last", "date": dt.date(2019, 1, 1),
+                            "salary": 100000.0, "married": True, "company_id": num_companies // 2}])
+    insert_rows(User, [{"id": 1, "name": "user", "email": "u@example.com"}])
+    insert_rows(Post, [{"id": 1, "body": "post", "date": dt.date(2019, 1, 1), "user_id": 1}])
+    insert_rows(Pet, [{"id": 1, "name": "pet", "animal": "dog", "owner_id": 1, "weight_lb": 35.0}])
+
+
+def main(num_companies=2000):
+    with benchmark_app():
+        populate(num_companies)
+        print(f"{num_companies} companies, us per form")
+        print(f"{'table':<10}{'form':>8}{'per request':>14}{'FormTemplate':>15}")
+        for tablename in TABLES:
+            uid = get_uid_from_tablename(tablename)
+            class_ = current_app.tc.get_dt_tables_config()[uid]["class_"]
+            template = current_app.tc.get_form_template(uid)
+            record = class_.query.first()
+            for form_type in ["create", "update"]:
+                r = record if form_type == "update" else None
+                before = lambda: set_form_html(class_, r, form_type, uid)
+                after = lambda: template.render(r, form_type)
+                assert before() == after(), (tablename, form_type)
+                a = best_of(before, repeat=5, number=200)
+                b = best_of(after, repeat=5, number=200)
+                print(f"{tablename:<10}{form_type:>8}{1000 * a:>14.1f}{1000 * b:>15.1f}")
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,77 @@
+""" Compare importing a csv file with /scrud/import (streamed, in batches) with /scrud/bulk_create (whole file in memory, one transaction).
+
+Employees are imported with the "Employer" column (form_spec label), so /scrud/import looks up the company ids from the company names.  The bulk_create file has the company_id instead.  Peak memory is measured with tracemalloc in a second run and includes the request body built by the test client, the same size for both.
+
+    $ python -m benchmarks.imports [num_rows] [num_companies]
+
+Results on a laptop, 50000 employees, 2000 companies:
+
+                   seconds   peak MB
+    bulk_create      10.68      94.7
+    import            9.68      16.9
+
+The time is mostly the WTForms validation, the same in both.  bulk_create holds every record, mapping and error in memory until the commit.  /scrud/import holds one batch (SCRUD_IMPORT_BATCH_SIZE records) and the company names of the batch, so memory stays flat however large the file is.
+"""
+import io
+import sys
+import time
+import tracemalloc
+
+from app import db
+from app.models_pab import Company, Employee
+from app.scrud.helpers import get_uid_from_tablename
+from .common import benchmark_app, insert_rows
+
+
+def csv_body(num_rows, num_companies, company_column):
+    lines = [f"first_name,last_name,date,salary,married,{company_column}"]
+    for i in range(num_rows):
+        company = i % num_companies + 1
+        company = f"company {company}" if company_column == "Employer" else company
+        lines.append(f"first {i},last {i},2019-01-01,{50000 + i},{'true' if i % 2 else 'false'},{company}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def measure(post):
+    t = time.perf_counter()
+    post()
+    seconds = time.perf_counter() - t
+    Employee.query.delete()
+    db.session.commit()
+    tracemalloc.start()
+    post()
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    Employee.query.delete()
+    db.session.commit()
+    return seconds, peak
+
+
+def main(num_rows=50000, num_companies=2000):
+    with benchmark_app() as app:
+        insert_rows(Company, [{"id": i, "rank": i, "name": f"company {i}", "industries": "tech", "revenue": 1.0e9,
+                               "fiscal_year": 2019, "num_employees": 100, "market_cap": 2.0e9, "headquarters": "US"}
+                              for i in range(1, num_companies + 1)])
+        uid = get_uid_from_tablename("employee")
+        client = app.test_client()
+        by_id = csv_body(num_rows, num_companies, "company_id")
+        by_name = csv_body(num_rows, num_companies, "Employer")
+
+        def bulk_create():
+            r = client.post(f"/scrud/bulk_create?uid={uid}", data=by_id, content_type="text/csv")
+            assert r.get_json()["count"] == num_rows
+
+        def import_file():
+            r = client.post(f"/scrud/import?uid={uid}", data={"file": (io.BytesIO(by_name), "employees.csv")},
+                            content_type="multipart/form-data")
+            assert r.get_data(as_text=True).splitlines()[-1].startswith(f'{{"rows":{num_rows},"inserted":{num_rows},')
+
+        print(f"{num_rows} employees, {num_companies} companies")
+        print(f"{'':<15}{'seconds':>10}{'peak MB':>10}")
+        for name, post in [("bulk_create", bulk_create), ("import", import_file)]:
+            seconds, peak = measure(post)
+            print(f"{name:<15}{seconds:>10.2f}{peak:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
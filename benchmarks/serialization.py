@@ -0,0 +1,91 @@
+""" Compare the json serialization of a get_data response.
+
+The Post table (Date, DateTime and a linked one-side column) is filled with rows and all of them are fetched once.  Each method serializes a fresh copy of the records.
+
+    $ python -m benchmarks.serialization [num_rows]
+
+    * default=str : json.dumps(records, default=str), the serialization before scrud/serializers.py
+    * encoders + json : the column encoders from TableConfig, then flask json
+    * encoders + orjson : the column encoders from TableConfig, then orjson (skipped if orjson is not installed)
+
+Results on a laptop, 100000 rows, ms per response (copying the records takes 37 ms of each):
+
+    method                    ms        MB
+    default=str            460.7      14.7
+    encoders + json        378.8      14.7
+    encoders + orjson      181.5      13.5
+
+The encoders only touch the date and created_at columns, so json never calls default() for each cell, and orjson serializes the rest in C.  All methods decode to the same records (orjson leaves out the spaces after separators, hence the smaller size).
+"""
+import datetime as dt
+import random
+import sys
+
+from flask import json
+
+from app.models_pab import User, Post
+from app.scrud.controllers import LinkIDs, get_table_query, get_connection
+from app.scrud import serializers
+from app.scrud.helpers import get_uid_from_tablename
+from .common import benchmark_app, insert_rows, best_of
+
+
+def populate(num_rows):
+    random.seed(0)
+    num_users = max(num_rows // 10, 1)
+    insert_rows(User, [{"id": i, "name": f"user {i}", "email": f"u{i}@example.com"}
+                       for i in range(1, num_users + 1)])
+    created_at = dt.datetime(2019, 1, 1, 12, 30, 15)
+    insert_rows(Post, [{"body": f"post body {i}", "date": dt.date(2019, 1, 1) + dt.timedelta(days=i % 1000),
+                        "user_id": random.randint(1, num_users), "created_at": created_at}
+                       for i in range(num_rows)])
+
+
+def fetch_records():
+    uid = get_uid_from_tablename("post")
+    dt_request = {"draw": 1, "start": 0, "length": -1, "order": [],
+                  "search": {"value": ""}, "columns": []}
+    query = get_table_query(LinkIDs(uid).get_link_ids(), dt_request)
+    with get_connection(query) as conn:
+        records = [{k:v for k, v in row.items()} for row in conn.execute(query["select"])]
+    return records, query["t"]["encoders"]
+
+
+def main(num_rows=100000):
+    with benchmark_app():
+        populate(num_rows)
+        records, encoders = fetch_records()
+
+        def copy():
+            return [dict(r) for r in records]
+
+        def default_str():
+            return json.dumps(copy(), default=str)
+
+        def encoders_json():
+            r = copy()
+            serializers.encode_records(r, encoders)
+            return json.dumps(r)
+
+        def encoders_orjson():
+            r = copy()
+            serializers.encode_records(r, encoders)
+            return serializers.orjson.dumps(r).decode("utf-8")
+
+        methods = [("default=str", default_str), ("encoders + json", encoders_json)]
+        if serializers.orjson is not None:
+            methods.append(("encoders + orjson", encoders_orjson))
+        else:
+            print("PAB> orjson is not installed, skipping encoders + orjson")
+
+        expected = json.loads(default_str())
+        print(f"{num_rows} rows, encoded columns {[c for c, e in encoders]}, copy {best_of(copy, repeat=3):.1f} ms")
+        print(f"{'method':<20}{'ms':>10}{'MB':>10}")
+        for name, func in methods:
+            out = func()
+            assert json.loads(out) == expected, name
+            print(f"{name:<20}{best_of(func, repeat=3):>10.1f}{len(out) / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,92 @@
+""" Compare read throughput while a writer commits, with and without the sqlite performance profile (SCRUD_SQLITE_PRAGMAS in config.py).
+
+Reader threads draw pages of the Post table with get_table_data() while one writer thread inserts and commits one post at a time, like update_db.
+
+    $ python -m benchmarks.sqlite_profile [num_posts] [seconds]
+
+Results on a laptop (50000 posts, page length 100, 5 s):
+
+    profile              reads/s    writes/s    errors
+    sqlite default           9.0       272.6         0
+    performance             11.2       675.8         0
+
+With the default rollback journal a commit locks out the readers, and every commit syncs the journal and the database file.  WAL lets readers run during commits, and synchronous=NORMAL only syncs at checkpoints.  The readers here are bound by sorting the unindexed created_at column (see the index advisor), so they gain less than the writer.
+"""
+import datetime as dt
+import sys
+import threading
+import time
+
+from app import db
+from app.models_pab import User, Post
+from app.scrud.controllers import LinkIDs, get_table_data
+from app.scrud.helpers import get_uid_from_tablename
+from .common import benchmark_app, insert_rows
+
+NUM_READERS = 4
+
+
+def populate(num_posts):
+    insert_rows(User, [{"id": 1, "name": "user", "email": "u@example.com"}])
+    insert_rows(Post, [{"body": f"post {i}", "date": dt.date(2019, 1, 1), "user_id": 1}
+                       for i in range(num_posts)])
+
+
+def run(app, seconds):
+    """ Returns (reads per second, writes per second, errors) """
+    uid = get_uid_from_tablename("post")
+    link_ids = LinkIDs(uid).get_link_ids()
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def reader():
+        dt_request = {"draw": 1, "start": 0, "length": 100, "order": [],
+                      "search": {"value": ""}, "columns": []}
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    get_table_data(link_ids, dt_request)
+                    with lock:
+                        counts["reads"] += 1
+                except Exception:
+                    with lock:
+                        counts["errors"] += 1
+
+    def writer():
+        engine = db.get_engine(app, bind=Post.__bind_key__)
+        while not stop.is_set():
+            try:
+                with engine.begin() as conn:
+                    conn.execute(Post.__table__.insert(),
+                                 {"body": "new post", "date": dt.date(2019, 1, 2), "user_id": 1})
+                with lock:
+                    counts["writes"] += 1
+            except Exception:
+                with lock:
+                    counts["errors"] += 1
+
+    threads = [threading.Thread(target=reader) for i in range(NUM_READERS)]
+    threads.append(threading.Thread(target=writer))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return counts["reads"] / seconds, counts["writes"] / seconds, counts["errors"]
+
+
+def main(num_posts=50000, seconds=5):
+    print(f"Post table with {num_posts} rows, {NUM_READERS} readers + 1 writer for {seconds} s")
+    print("{:<16}{:>12}{:>12}{:>10}".format("profile", "reads/s", "writes/s", "errors"))
+    for name, pragmas in [("sqlite default", {}), ("performance", None)]:
+        overrides = {} if pragmas is None else {"SCRUD_SQLITE_PRAGMAS": pragmas}
+        with benchmark_app(**overrides) as app:
+            populate(num_posts)
+            reads, writes, errors = run(app, seconds)
+        print("{:<16}{:>12.1f}{:>12.1f}{:>10}".format(name, reads, writes, errors))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -11,6 +11,80 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_MIGRATE_REPO = os.path.join(basedir, "db_repository")
 
+    # seconds before the cached total row count of a table is recounted from the database
+    # counts are also updated when records are created or deleted by this app
+    # the cached form dropdown options are reloaded after the same time
+    SCRUD_ROW_COUNT_MAX_AGE = 300
+
+    # stream unpaged get_data responses (client side tables, DataTables "show all") one batch of rows at a time
+    SCRUD_STREAM_JSON = True
+    SCRUD_STREAM_BATCH_SIZE = 1000 # rows fetched and serialized per batch
+
+    # scrud.js asks get_data for rows without html and renders the function buttons and table links itself
+    SCRUD_COMPACT_DATA = True
+    # scrud.js asks get_data for each row as an array of values instead of an object (see get_records() in controllers.py)
+    SCRUD_ARRAY_DATA = True
+
+    # get_data ETag : scrud.js reloads of unchanged tables get a 304 (see TableVersions in caches.py)
+    # the table versions are kept in a sqlite file shared by the workers on one host, not one of the SCRUD binds
+    # writes made outside of the app (raw SQL, another host) are picked up after SCRUD_ETAG_MAX_AGE seconds
+    SCRUD_ETAG = True
+    SCRUD_ETAG_MAX_AGE = 300
+    SCRUD_TABLE_VERSIONS_PATH = os.path.join(basedir, "scrud_versions.sqlite")
+
+    # get_table_data result cache : "memory" (this process), "sqlite" (file shared by the workers on one host), None (off)
+    # the key has the shared table version (SCRUD_TABLE_VERSIONS_PATH), so a write through any worker is seen by all of them
+    # or a function(app) that returns a backend (see ResultCache in app/scrud/caches.py)
+    SCRUD_RESULT_CACHE = "memory"
+    SCRUD_RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024 # least recently used results are evicted above this size
+    SCRUD_RESULT_CACHE_PATH = os.path.join(basedir, "scrud_cache.sqlite")
+
+    # form dropdown options of each related table are cached until the table changes (see OptionCache in app/scrud/caches.py)
+    SCRUD_OPTION_CACHE_MAX_TABLES = 32
+    SCRUD_OPTION_CACHE_MAX_OPTIONS = 10000 # longer option lists are not cached
+
+    # options per page of a form lookup input (form_spec "type": "lookup")
+    SCRUD_LOOKUP_PAGE_SIZE = 20
+
+    # Cache-Control max-age of the versioned table configs (see table_configs in app/scrud/views.py)
+    SCRUD_TABLE_CONFIGS_MAX_AGE = 365 * 24 * 3600
+
+    # records validated and inserted per transaction by /scrud/import (see app/scrud/imports.py)
+    SCRUD_IMPORT_BATCH_SIZE = 1000
+
+    # rows fetched and written per batch by /scrud/export, and rows per parquet row group (see app/scrud/exports.py)
+    SCRUD_EXPORT_BATCH_SIZE = 10000
+
+    # background jobs (imports, exports, recompute, bulk delete), see app/scrud/jobs.py
+    # the job table is a sqlite file shared by the workers on one host, not one of the SCRUD binds
+    SCRUD_JOB_WORKERS = 2 # threads per process
+    SCRUD_JOB_PATH = os.path.join(basedir, "scrud_jobs.sqlite")
+    SCRUD_JOB_DIR = os.path.join(basedir, "scrud_jobs") # uploaded and exported files
+    SCRUD_JOB_MAX_AGE = 24 * 3600 # seconds finished jobs and their files are kept
+    SCRUD_JOB_POLL_INTERVAL = 1000 # ms between scrud.js job status requests
+
+    # gzip (or brotli if the brotli package is installed) compression of blueprint responses
+    SCRUD_COMPRESSION = True
+    SCRUD_COMPRESS_MIN_SIZE = 500 # bytes, smaller responses are sent as is
+    SCRUD_GZIP_LEVEL = 6
+    SCRUD_BROTLI_QUALITY = 4
+
+    # log a warning at startup for each table order, link filter or join column without an index
+    # $flask scrud indexes --migration writes a migration to add them
+    SCRUD_INDEX_ADVISOR = False
+
+    # sqlite tuning profile applied to each new connection (see app/database.py)
+    # WAL lets readers run while update_db writes. synchronous=NORMAL is safe with WAL (a power loss can lose the last commits but does not corrupt the database).
+    # mmap_size and cache_size (negative value = KiB) keep hot pages in memory.
+    SQLITE_PERFORMANCE_PROFILE = {
+        "busy_timeout": 5000, # ms to wait for a lock before "database is locked"
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456, # 256 MiB
+        "cache_size": -65536, # 64 MiB
+        "temp_store": "MEMORY"
+    }
+
     # This allows the application to customize the configuration.
     # Add appropriate code if want to implement some app level customization
     @staticmethod
@@ -20,6 +94,7 @@ class Config:
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    SCRUD_INDEX_ADVISOR = True
     DATABASE =  "sqlite" # {"mysql", "sqlite"} used for date conversions
     EXPLAIN_TEMPLATE_LOADING = False
     DATABASE_FILE_1 = "chinook.sqlite"
@@ -39,6 +114,23 @@ class DevelopmentConfig(Config):
     SCRUD_BINDS = {None:DATABASE_FILE_1,
                    "models_pab":DATABASE_FILE_2}
 
+    # connection pool options for each bind key (see app/database.py)
+    # pool_size : connections kept open, max_overflow : extra connections under load
+    # pool_recycle : seconds before a connection is replaced, pool_timeout : seconds to wait for a connection
+    # with several worker processes, each has its own pools and in memory caches (row counts, dropdown options, SCRUD_RESULT_CACHE = "memory").
+    # The result cache and ETag are keyed by the table versions in SCRUD_TABLE_VERSIONS_PATH, so a write through one worker is seen by all of them at once.
+    # Row counts and dropdown options are only updated by the writes of their own worker, the others recount after SCRUD_ROW_COUNT_MAX_AGE seconds.
+    SCRUD_ENGINE_OPTIONS = {
+        None: {"pool_size": 5, "max_overflow": 10, "pool_recycle": 3600, "pool_timeout": 30},
+        "models_pab": {"pool_size": 5, "max_overflow": 10, "pool_recycle": 3600, "pool_timeout": 30}
+    }
+
+    # sqlite pragmas for each bind key, {} = sqlite defaults
+    SCRUD_SQLITE_PRAGMAS = {
+        None: Config.SQLITE_PERFORMANCE_PROFILE,
+        "models_pab": Config.SQLITE_PERFORMANCE_PROFILE
+    }
+
 
 class ProductionConfig(Config):
     DEBUG = False
@@ -61,6 +153,23 @@ class ProductionConfig(Config):
     SCRUD_BINDS = {None:DATABASE_FILE_1,
                    "models_pab":DATABASE_FILE_2}
 
+    # connection pool options for each bind key (see app/database.py)
+    # pool_size : connections kept open, max_overflow : extra connections under load
+    # pool_recycle : seconds before a connection is replaced, pool_timeout : seconds to wait for a connection
+    # with several worker processes, each has its own pools and in memory caches (row counts, dropdown options, SCRUD_RESULT_CACHE = "memory").
+    # The result cache and ETag are keyed by the table versions in SCRUD_TABLE_VERSIONS_PATH, so a write through one worker is seen by all of them at once.
+    # Row counts and dropdown options are only updated by the writes of their own worker, the others recount after SCRUD_ROW_COUNT_MAX_AGE seconds.
+    SCRUD_ENGINE_OPTIONS = {
+        None: {"pool_size": 5, "max_overflow": 10, "pool_recycle": 3600, "pool_timeout": 30},
+        "models_pab": {"pool_size": 5, "max_overflow": 10, "pool_recycle": 3600, "pool_timeout": 30}
+    }
+
+    # sqlite pragmas for each bind key, {} = sqlite defaults
+    SCRUD_SQLITE_PRAGMAS = {
+        None: Config.SQLITE_PERFORMANCE_PROFILE,
+        "models_pab": Config.SQLITE_PERFORMANCE_PROFILE
+    }
+
 config = {
     "development": DevelopmentConfig,
     "production": ProductionConfig,